@@ -0,0 +1,91 @@
+'''Parallel build benchmark.
+
+Run from the repository root:
+
+    python -m bench.build [MODULES] [JOBS]
+
+Generates a project of MODULES modules (24 by default) in layers of four,
+each importing two modules from the layer before it, then times emitting
+the whole project serially and with build.build over JOBS processes (the
+CPU count by default). Both builds run without the AST cache.
+'''
+
+import os
+import os.path
+import rain.build as B
+import rain.compiler as C
+import sys
+import tempfile
+import time
+
+
+def generate(path, modules=24, width=4, funcs=40):
+  for i in range(modules):
+    lines = []
+    if i >= width:
+      base = i // width * width - width
+      lines.append('import mod{}'.format(base + i % width))
+      lines.append('import mod{}'.format(base + (i + 1) % width))
+      lines.append('')
+
+    for j in range(funcs):
+      lines.append('export func{} = func(a, b)'.format(j))
+      lines.append('  let c = a + b * {}'.format(j))
+      lines.append('  if c > 10')
+      lines.append('    print("big " $ tostr(c))')
+      lines.append('  return [a, b, c]')
+      lines.append('')
+
+    with open(os.path.join(path, 'mod{}.rn'.format(i)), 'w') as tmp:
+      tmp.write('\n'.join(lines))
+
+  lines = ['import mod{}'.format(i) for i in range(max(modules - width, 0), modules)]
+  lines.append('let main = func()')
+  lines.append('  print("done")')
+
+  with open(os.path.join(path, 'main.rn'), 'w') as tmp:
+    tmp.write('\n'.join(lines) + '\n')
+
+  return os.path.join(path, 'main.rn')
+
+
+def emit(src, jobs):
+  session = C.Session()
+  comp = session.get_compiler(src, main=True)
+  comp.target = src[:-3] + '.ll'
+
+  start = time.perf_counter()
+  if jobs > 1:
+    B.build(comp, C.phases.emitting, jobs=jobs)
+  else:
+    comp.goodies(C.phases.emitting)
+
+  return time.perf_counter() - start
+
+
+def main(modules=24, jobs=None):
+  os.environ.setdefault('RAINLIB', os.path.abspath('core'))
+  os.environ.setdefault('RAINBASE', os.path.abspath('base'))
+  jobs = jobs or os.cpu_count()
+
+  C.Compiler.quiet = True
+  C.Compiler.cache = False
+
+  with tempfile.TemporaryDirectory() as path:
+    src = generate(path, modules)
+
+    serial = emit(src, 1)
+    with open(src[:-3] + '.ll') as tmp:
+      expected = tmp.read()
+
+    parallel = emit(src, max(jobs, 2))
+    with open(src[:-3] + '.ll') as tmp:
+      same = tmp.read() == expected
+
+  print('{} modules, {} jobs, same IR: {}'.format(modules + 1, max(jobs, 2), same))
+  print('{:>10} {:10.2f} s'.format('serial', serial))
+  print('{:>10} {:10.2f} s'.format('parallel', parallel))
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:]))
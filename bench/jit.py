@@ -0,0 +1,49 @@
+'''JIT run mode benchmark.
+
+Run from the repository root:
+
+    python -m bench.jit
+
+Runs every sample program in samples/ twice with rainc: once with --run,
+which builds an executable with clang first, and once with --jit, which runs
+the program in the compiler's own process. Prints the wall time of each, from
+starting rainc to the program exiting.
+'''
+
+from tests.test_samples import lsrn
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def rainc(*args):
+  start = time.perf_counter()
+  subprocess.call([sys.executable, '-m', 'rain', '-q'] + list(args),
+                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  return time.perf_counter() - start
+
+
+def main():
+  os.environ.setdefault('RAIN_TEST', 'testing')  # for the command line args sample
+
+  print('{:<40} {:>10} {:>10}'.format('sample', 'run', 'jit'))
+  total_run = total_jit = 0
+
+  with tempfile.TemporaryDirectory() as path:
+    for src in sorted(lsrn('samples', recurse=True)):
+      target = os.path.join(path, 'prog')
+      run = rainc('-r', '-o', target, src)
+      jit = rainc('--jit', src)
+      total_run += run
+      total_jit += jit
+
+      print('{:<40} {:10.2f} {:10.2f}'.format(src, run, jit))
+
+  print('{:<40} {:10.2f} {:10.2f}'.format('total', total_run, total_jit))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,49 @@
+'''Lexer throughput benchmark.
+
+Run from the repository root:
+
+    python -m bench.lexer [FILE...]
+
+With no files, a generated module full of table literals is used.
+'''
+
+import rain.lexer as L
+import sys
+import time
+
+
+def generate(rows=5000):
+  lines = ['let data = func()', '  let rows = table']
+  for i in range(rows):
+    lines.append('  rows[{0}] = {{name = "row {0}", value = {0}.5, ok = true, ' \
+                 'items = [{0}, {1}, {2}]}}'.format(i, i + 1, i * 2))
+  lines.append('  return rows')
+  lines.append('')
+  return '\n'.join(lines)
+
+
+def measure(source, repeat=5):
+  best = None
+  for i in range(repeat):
+    start = time.perf_counter()
+    count = sum(1 for token in L.stream(source))
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+
+  size = len(source.encode('utf-8')) / 1e6
+  return size / best, count / best, count
+
+
+def main(files):
+  if files:
+    sources = [(file, open(file).read()) for file in files]
+  else:
+    sources = [('<generated>', generate())]
+
+  for name, source in sources:
+    mbs, tps, count = measure(source)
+    print('{:>30} {:8.2f} MB/s {:12,.0f} tokens/s {:10,} tokens'.format(name, mbs, tps, count))
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
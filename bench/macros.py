@@ -0,0 +1,72 @@
+'''Macro definition benchmark.
+
+Run from the repository root:
+
+    python -m bench.macros [MACROS]
+
+Generates a module in the style of base/macros.rn that defines MACROS macros
+(20 by default) and uses each of them once, then times parsing it, which
+compiles every macro. The first parse sets up the shared macro runtime; the
+second parse, in a fresh session, shows what each further file of macros
+costs.
+'''
+
+import os
+import os.path
+import rain.compiler as C
+import sys
+import tempfile
+import time
+
+
+def generate(path, macros=20):
+  lines = []
+  for i in range(macros):
+    lines.append('macro print{}(args) as (args)'.format(i))
+    lines.append('  let node = ast.block:empty()')
+    lines.append('  save node')
+    lines.append('')
+    lines.append('  for arg in args:items()')
+    lines.append('    let call = ast.call:new(ast.name:new("print"), table)')
+    lines.append('    call.args[0] = arg')
+    lines.append('    node:add(call)')
+    lines.append('')
+
+  lines.append('let main = func()')
+  for i in range(macros):
+    lines.append('  @print{}("one", "two")'.format(i))
+
+  with open(os.path.join(path, 'macros.rn'), 'w') as tmp:
+    tmp.write('\n'.join(lines) + '\n')
+
+  return os.path.join(path, 'macros.rn')
+
+
+def parse(src):
+  comp = C.Session().get_compiler(src, main=True)
+
+  start = time.perf_counter()
+  comp.read()
+  comp.parse()
+  return time.perf_counter() - start
+
+
+def main(macros=20):
+  os.environ.setdefault('RAINLIB', os.path.abspath('core'))
+  os.environ.setdefault('RAINBASE', os.path.abspath('base'))
+
+  C.Compiler.quiet = True
+  C.Compiler.cache = False
+
+  with tempfile.TemporaryDirectory() as path:
+    src = generate(path, macros)
+    cold = parse(src)
+    warm = parse(src)
+
+  print('{} macros'.format(macros))
+  print('{:>10} {:10.2f} s {:10.1f} ms/macro'.format('cold', cold, cold / macros * 1000))
+  print('{:>10} {:10.2f} s {:10.1f} ms/macro'.format('warm', warm, warm / macros * 1000))
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,68 @@
+'''Low-memory mode benchmark.
+
+Run from the repository root:
+
+    python -m bench.memory [MODULES]
+
+Generates a project of MODULES modules (200 by default) in layers of 20,
+each importing two modules from the layer before it, then builds it to IR
+in a fresh process twice: once keeping every module, and once with
+Compiler.low_memory. Prints each build's peak RSS.
+'''
+
+from bench.build import generate
+import multiprocessing
+import os
+import os.path
+import rain.compiler as C
+import resource
+import sys
+import tempfile
+import time
+
+
+def build(src, low_memory, queue):
+  C.Compiler.quiet = True
+  C.Compiler.cache = False
+  C.Compiler.low_memory = low_memory
+
+  start = time.perf_counter()
+  comp = C.Session().get_compiler(src, main=True)
+  comp.goodies()
+  elapsed = time.perf_counter() - start
+
+  # ru_maxrss is in kilobytes on Linux
+  queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, elapsed))
+
+  for other in comp.session.compilers.values():
+    if other.ll:
+      os.remove(other.ll)
+
+
+def measure(src, low_memory):
+  ctx = multiprocessing.get_context('fork')
+  queue = ctx.Queue()
+  proc = ctx.Process(target=build, args=(src, low_memory, queue))
+  proc.start()
+  ret = queue.get()
+  proc.join()
+  return ret
+
+
+def main(modules=200):
+  os.environ.setdefault('RAINLIB', os.path.abspath('core'))
+  os.environ.setdefault('RAINBASE', os.path.abspath('base'))
+
+  with tempfile.TemporaryDirectory() as path:
+    src = generate(path, modules, width=20, funcs=10)
+
+    full = measure(src, False)
+    low = measure(src, True)
+
+  print('{} modules'.format(modules + 1))
+  print('{:>12} {:10.1f} MB peak RSS {:8.2f} s'.format('full', full[0] / 1024, full[1]))
+  print('{:>12} {:10.1f} MB peak RSS {:8.2f} s'.format('low-memory', low[0] / 1024, low[1]))
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,36 @@
+'''Parser throughput benchmark.
+
+Run from the repository root:
+
+    python -m bench.parser [LINES]
+
+Lexes a generated module of about LINES lines (10,000 by default) up front,
+then times parsing the tokens alone.
+'''
+
+from .reparse import generate
+import rain.lexer as L
+import rain.parser as P
+import sys
+import time
+
+
+def main(lines=10000):
+  src = generate(lines)
+  tokens = list(L.stream(src))
+
+  best = None
+  for i in range(5):
+    start = time.perf_counter()
+    ctx = P.context(iter(tokens), file='bench.rn')
+    P.program(ctx)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+
+  size = len(src.encode('utf-8')) / 1e6
+  print('{:,} tokens in {:.2f} ms: {:,.0f} tokens/s, {:.2f} MB/s'.format(
+        len(tokens), best * 1000, len(tokens) / best, size / best))
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:]))
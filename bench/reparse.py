@@ -0,0 +1,66 @@
+'''Incremental re-parse benchmark.
+
+Run from the repository root:
+
+    python -m bench.reparse [LINES]
+
+Parses a generated module of about LINES lines (10,000 by default) from
+scratch, then times a one-line edit in the middle of it through
+parser.reparse.
+'''
+
+import rain.lexer as L
+import rain.parser as P
+import sys
+import time
+
+
+def generate(lines=10000):
+  out = []
+  i = 0
+  while len(out) < lines:
+    out.append('let func{} = func(a, b)'.format(i))
+    out.append('  let c = a + b * {}'.format(i))
+    out.append('  if c > 10')
+    out.append('    print("big " $ tostr(c))')
+    out.append('  return [a, b, c]')
+    out.append('')
+    i += 1
+
+  return '\n'.join(out) + '\n'
+
+
+def full(src):
+  tokens = L.lex(src, file='bench.rn')
+  ctx = P.context(iter(tokens), file='bench.rn')
+  ast = P.program(ctx)
+  return ctx, tokens, ast
+
+
+def main(lines=10000):
+  src = generate(lines)
+
+  start = time.perf_counter()
+  ctx, tokens, ast = full(src)
+  parse = time.perf_counter() - start
+
+  # change one line in the middle of the file, back and forth
+  line = src.index('  let c = a + b * {}'.format(lines // 12))
+  old = '  let c = a + b * {}'.format(lines // 12)
+  new = '  let c = a - b * {}'.format(lines // 12)
+
+  times = []
+  for i in range(20):
+    text = new if i % 2 == 0 else old
+    start = time.perf_counter()
+    src = P.reparse(ctx, src, tokens, ast, line, line + len(old), text)
+    times.append(time.perf_counter() - start)
+
+  times.sort()
+  print('{:,} lines, {:,} tokens, {:,} statements'.format(src.count('\n'), len(tokens), len(ast.stmts)))
+  print('{:>20} {:10.2f} ms'.format('full lex + parse', parse * 1000))
+  print('{:>20} {:10.2f} ms (median of {})'.format('one-line reparse', times[len(times) // 2] * 1000, len(times)))
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,53 @@
+'''Compile server latency benchmark.
+
+Run from the repository root:
+
+    python -m bench.server [RUNS]
+
+Starts rainc --server, then builds samples/hello.rn RUNS times (10 by
+default) through python -m rain.client, and RUNS times with a fresh rainc
+process each. Prints the average wall time of each, from starting the
+command to it exiting, for emitting IR and for a full build.
+'''
+
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def timed(cmd, runs):
+  start = time.perf_counter()
+  for num in range(runs):
+    subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  return (time.perf_counter() - start) / runs
+
+
+def main(runs=10):
+  with tempfile.TemporaryDirectory() as path:
+    sock = os.path.join(path, 'rainc.sock')
+    server = subprocess.Popen([sys.executable, '-m', 'rain', '--server', sock],
+                              stdout=subprocess.DEVNULL)
+    try:
+      while not os.path.exists(sock):
+        if server.poll() is not None:
+          sys.exit('rainc --server exited with {}'.format(server.returncode))
+        time.sleep(0.01)
+
+      print('{:<10} {:>10} {:>10}'.format('', 'cold', 'server'))
+      for name, args in (('emit', ['--emit', '-o', os.path.join(path, 'hello.ll')]),
+                         ('build', ['-o', os.path.join(path, 'hello')])):
+        args = ['-q'] + args + ['samples/hello.rn']
+        cold = timed([sys.executable, '-m', 'rain'] + args, runs)
+        warm = timed([sys.executable, '-m', 'rain.client'] + args, runs)
+        print('{:<10} {:8.0f}ms {:8.0f}ms'.format(name, cold * 1000, warm * 1000))
+
+    finally:
+      server.terminate()
+      server.wait()
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:]))
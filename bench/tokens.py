@@ -0,0 +1,51 @@
+'''Token memory benchmark.
+
+Run from the repository root:
+
+    python -m bench.tokens [FILE...]
+
+With no files, every .rn file under samples/, core/ and base/ is used. Reports
+bytes per token for a list of token objects and for the packed token array
+that the compiler keeps.
+'''
+
+from .lexer import generate
+import glob
+import rain.lexer as L
+import sys
+import tracemalloc
+
+
+def measure(build):
+  tracemalloc.start()
+  base = tracemalloc.get_traced_memory()[0]
+  res = build()
+  size = tracemalloc.get_traced_memory()[0] - base
+  tracemalloc.stop()
+  return size, len(res)
+
+
+def main(files):
+  if not files:
+    files = sorted(glob.glob('samples/**/*.rn', recursive=True) +
+                   glob.glob('core/**/*.rn', recursive=True) +
+                   glob.glob('base/**/*.rn', recursive=True))
+
+  sources = [open(file).read() for file in files]
+  sources.append(generate())
+
+  for name, build in (('token objects', lambda src: list(L.stream(src))),
+                      ('token array', lambda src: L.lex(src))):
+    total = count = 0
+    for src in sources[:-1]:
+      size, num = measure(lambda: build(src))
+      total += size
+      count += num
+
+    size, num = measure(lambda: build(sources[-1]))
+    print('{:>15} {:8.1f} bytes/token ({:,} tokens in {} files) {:8.1f} bytes/token (generated)'.format(
+          name, total / count, count, len(sources) - 1, size / num))
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
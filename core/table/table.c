@@ -139,3 +139,36 @@ void rain_put(box *tab, box *key, box *val) {
   }
 }
 
+
+// build a table from arrays of keys and values in one call
+void rain_set_table_from(box *ret, box *env, box *keys, box *vals, int n) {
+  rain_set_table(ret);
+  rain_set_env(ret, env);
+
+  for(int i=0; i<n; i++) {
+    rain_put(ret, keys + i, vals + i);
+  }
+}
+
+// copy up to max of a table's own keys and values out in one call. returns
+// how many it has, which may be more than max
+int rain_table_items(box *tab, box *keys, box *vals, int max) {
+  if(BOX_ISNT(tab, TABLE)) {
+    return 0;
+  }
+
+  int n = 0;
+  table *t = tab->data.lpt;
+
+  for(int i=0; i<t->max; i++) {
+    if(t->items[i].valid) {
+      if(n < max) {
+        keys[n] = t->items[i].key;
+        vals[n] = t->items[i].val;
+      }
+      n += 1;
+    }
+  }
+
+  return n;
+}
@@ -10,5 +10,7 @@ item *rain_has(box *, box *);
 box *rain_get_ptr(box *, box *);
 void rain_get(box *, box *, box *);
 void rain_put(box *, box *, box *);
+void rain_set_table_from(box *, box *, box *, box *, int);
+int rain_table_items(box *, box *, box *, int);
 
 #endif
@@ -1,7 +1,6 @@
 from . import compiler as C
 from . import error as Q
-from . import module as M
-from termcolor import colored as X
+from . import trace as Z
 import argparse
 import os.path
 import sys
@@ -9,6 +8,15 @@ import sys
 parser = argparse.ArgumentParser(description='Compile Rain code.')
 parser.add_argument('-r', '--run', action='store_true',
                     help='Execute the compiled code.')
+parser.add_argument('--jit', action='store_true',
+                    help='Execute the code in this process without building an executable.')
+parser.add_argument('--repl', action='store_true',
+                    help='Start an interactive prompt.')
+parser.add_argument('--server', metavar='SOCKET', nargs='?', const='',
+                    help='Serve builds on a Unix socket, for python -m rain.client. The socket is '
+                         '$RAIN_SERVER or rainc-UID.sock in $TMPDIR by default.')
+parser.add_argument('--batch', metavar='FILE', nargs='+',
+                    help='Build each FILE as a program of its own, emitting the modules they share once.')
 parser.add_argument('-o', '--output', metavar='FILE', default=None,
                     help='Executable file to produce.')
 parser.add_argument('-l', '--link', metavar='FILE', action='append',
@@ -17,6 +25,24 @@ parser.add_argument('-q', '--quiet', action='store_true',
                     help='Quiet the compiler.')
 parser.add_argument('-v', '--verbose', action='store_true',
                     help='Print extra output.')
+parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                    help='Parse and emit modules in N processes.')
+parser.add_argument('--c-jobs', metavar='N', type=int, default=None,
+                    help='Compile up to N C links at once (one per CPU by default).')
+parser.add_argument('-O', '--opt', metavar='LEVEL',
+                    help='Optimize and emit objects in process, at -O0 to -O3, -Os or -Oz.')
+parser.add_argument('--passes', metavar='PASS,...',
+                    help='Optimize with these llvmlite passes instead of a level.')
+parser.add_argument('--lto', action='store_true',
+                    help='Link with the bitcode of the runtime, so it can be optimized with the program.')
+parser.add_argument('--low-memory', action='store_true',
+                    help='Keep only a summary of each module once it is written.')
+parser.add_argument('--no-cache', action='store_true',
+                    help="Don't load or save cached parse results, built modules, compiled C, or machine code.")
+parser.add_argument('--time', action='store_true',
+                    help='Print how long each phase of the build took.')
+parser.add_argument('--trace', metavar='FILE', default=None,
+                    help='Write the phases of the build to FILE as Chrome trace events.')
 
 parser.add_argument('--lex', action='store_true',
                     help='Stop and output the results of lexing.')
@@ -25,41 +51,128 @@ parser.add_argument('--parse', action='store_true',
 parser.add_argument('--emit', action='store_true',
                     help='Stop and output the results of code generation.')
 
-parser.add_argument('file', metavar='FILE', type=str, default='.', nargs='?',
-                    help='Main source file.')
+parser.add_argument('file', metavar='FILE', type=str, default=None, nargs='?',
+                    help='Main source file (the package in this directory by default).')
+parser.add_argument('args', metavar='ARG', type=str, nargs=argparse.REMAINDER,
+                    help='Arguments for the program when it is executed. Everything after FILE is one.')
 
-args = parser.parse_args()
 
-os.environ['RAINHOME'] = os.path.normpath(os.path.join(sys.argv[0], '../../'))
-os.environ['RAINLIB'] = os.path.join(os.environ['RAINHOME'], 'core')
-os.environ['RAINBASE'] = os.path.join(os.environ['RAINHOME'], 'base')
-src = M.find_rain(args.file)
-if not src:
-  Q.abort("Can't find module {!r}".format(args.file))
+# build a program, or a batch of them, as the arguments say. returns the
+# compiler of the (last) program
+def build(args, session=None):
+  session = session or C.default_session
 
-C.Compiler.quiet = args.quiet
-C.Compiler.verbose = args.verbose
-comp = C.get_compiler(src, target=args.output, main=True)
+  if args.batch and (args.file or args.args or args.output or args.run or args.jit or args.jobs > 1):
+    Q.abort("--batch can't be used with FILE, ARG, --output, --run, --jit or --jobs")
 
-if args.link:
-  for tmp in args.link:
-    comp.links.add(tmp)
+  srcs = []
+  for file in args.batch or [args.file or '.']:
+    src = session.index.find_rain(file)
+    if not src:
+      Q.abort("Can't find module {!r}".format(file))
+    srcs.append(src)
 
-phase = C.phases.building
+  C.Compiler.quiet = args.quiet
+  C.Compiler.verbose = args.verbose
+  C.Compiler.cache = not args.no_cache
+  C.Compiler.low_memory = args.low_memory
+  C.Compiler.c_jobs = args.c_jobs
+  C.Compiler.lto = args.lto
 
-if args.emit:
-  phase = C.phases.emitting
+  C.Compiler.backend = None
+  if args.opt or args.passes:
+    from . import backend as D
 
-if args.parse:
-  phase = C.phases.parsing
+    try:
+      passes = args.passes.split(',') if args.passes else None
+      C.Compiler.backend = D.Backend(args.opt or '2', passes, cache=not args.no_cache)
+    except ValueError as exc:
+      Q.abort('{}', exc)
 
-if args.lex:
-  phase = C.phases.lexing
+  session.tracer = Z.Tracer() if args.time or args.trace else None
+  try:
+    if args.batch:
+      comp = C.batch(srcs, last_phase(args), session=session, links=args.link or [])[-1]
+    else:
+      comp = make(args, srcs[0], session)
+  finally:
+    if session.tracer and args.time:
+      print('\n'.join(session.tracer.table()))
+    if session.tracer and args.trace:
+      session.tracer.write(args.trace)
 
-comp.goodies(phase)
+  if args.run:
+    comp.run(args.args)
 
-if phase.value > C.phases.emitting.value:
-  comp.compile()
+  return comp
 
-if args.run:
-  comp.run()
+
+# the phase to stop after
+def last_phase(args):
+  phase = C.phases.building
+
+  if args.emit:
+    phase = C.phases.emitting
+
+  if args.parse:
+    phase = C.phases.parsing
+
+  if args.lex:
+    phase = C.phases.lexing
+
+  return phase
+
+
+# everything up to running the program, which isn't timed
+def make(args, src, session):
+  comp = C.get_compiler(src, target=args.output, main=True, session=session)
+
+  if args.link:
+    for tmp in args.link:
+      comp.links.add(tmp)
+
+  phase = last_phase(args)
+  if args.jobs > 1:
+    from . import build as B
+
+    B.build(comp, phase, jobs=args.jobs)
+  else:
+    comp.goodies(phase)
+
+  if args.jit and phase == C.phases.building:
+    sys.exit(comp.jit(args.args))
+
+  if phase.value > C.phases.emitting.value:
+    comp.compile()
+
+  return comp
+
+
+if __name__ == '__main__':
+  args = parser.parse_args()
+
+  os.environ['RAINHOME'] = os.path.normpath(os.path.join(sys.argv[0], '../../'))
+  os.environ['RAINLIB'] = os.path.join(os.environ['RAINHOME'], 'core')
+  os.environ['RAINBASE'] = os.path.join(os.environ['RAINHOME'], 'base')
+
+  # everything but the compiler is loaded only when it's used
+  if args.repl:
+    from . import repl as R
+
+    C.Compiler.quiet = True
+    C.Compiler.verbose = args.verbose
+    C.Compiler.cache = not args.no_cache
+    C.Compiler.c_jobs = args.c_jobs
+    R.Repl().loop()
+    sys.exit(0)
+
+  if args.server is not None:
+    from . import client as K
+    from . import server as S
+
+    C.Compiler.verbose = args.verbose
+    C.Compiler.cache = not args.no_cache
+    S.Server(args.server or K.socket_path(), parser, build).serve()
+    sys.exit(0)
+
+  build(args)
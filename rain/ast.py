@@ -1,10 +1,11 @@
-import camel
-import fixedint
+import marshal
 import struct
 
-registry = camel.CamelRegistry()
-machine = camel.Camel([registry])
 tag_registry = {}
+node_types = []  # every node class, in the order they're defined
+
+# hashes are unsigned 64 bit ints, wrapping around
+hash_mask = (1 << 64) - 1
 
 
 # Base classes
@@ -16,8 +17,7 @@ class metanode(type):
 
   def __init__(cls, name, bases, attrs):
     super().__init__(name, bases, attrs)
-    registry.dumper(cls, cls.__tag__, version=cls.__version__)(cls.dump)
-    registry.loader(cls.__tag__, version=cls.__version__)(cls.load)
+    node_types.append(cls)
     tag_registry[cls.__tag__] = cls
 
   def dump(cls, self):
@@ -276,7 +276,7 @@ class int_node(value_node, literal_node):
   __tag__ = 'int'
 
   def hash(self):
-    return int(fixedint.UInt64(self.value))
+    return self.value & hash_mask
 
 
 class float_node(value_node, literal_node):
@@ -298,10 +298,7 @@ class str_node(value_node, literal_node):
   __tag__ = 'str'
 
   def hash(self):
-    val = fixedint.MutableUInt64(0)
-    for char in self.value:
-      val += ord(char)
-    return int(val)
+    return sum(map(ord, self.value)) & hash_mask
 
 
 class table_node(expr_node):
@@ -418,3 +415,85 @@ class hint_node(node):
 
   def __init__(self, msg):
     self.msg = msg
+
+
+# yaml format
+#
+# nodes are dumped with camel, which is only imported the first time it's
+# needed, since it takes a while to import along with yaml.
+
+class yaml_machine:
+  def __init__(self):
+    self.camel = None
+
+  def get(self):
+    if self.camel is None:
+      import camel
+
+      registry = camel.CamelRegistry()
+      for cls in node_types:
+        registry.dumper(cls, cls.__tag__, version=cls.__version__)(cls.dump)
+        registry.loader(cls.__tag__, version=cls.__version__)(cls.load)
+
+      self.camel = camel.Camel([registry])
+
+    return self.camel
+
+  def dump(self, val):
+    return self.get().dump(val)
+
+  def load(self, data):
+    return self.get().load(data)
+
+
+machine = yaml_machine()
+
+
+# binary format
+#
+# nodes are flattened into tuples of their tag and slots, then written with
+# marshal. real tuples (eg dict items) start with an empty tag instead.
+
+def flatten(val):
+  if isinstance(val, node):
+    return (val.__tag__,) + tuple(flatten(getattr(val, slot)) for slot in val.__slots__)
+
+  if isinstance(val, list):
+    return [flatten(item) for item in val]
+
+  if isinstance(val, tuple):
+    return ('',) + tuple(flatten(item) for item in val)
+
+  return val
+
+
+# the number of nodes in a tree
+def count(val):
+  if isinstance(val, node):
+    return 1 + sum(count(getattr(val, slot)) for slot in val.__slots__)
+
+  if isinstance(val, (list, tuple)):
+    return sum(count(item) for item in val)
+
+  return 0
+
+
+def inflate(val):
+  if type(val) is tuple:
+    if val[0]:
+      return tag_registry[val[0]](*(inflate(item) for item in val[1:]))
+
+    return tuple(inflate(item) for item in val[1:])
+
+  if type(val) is list:
+    return [inflate(item) for item in val]
+
+  return val
+
+
+def pack(val):
+  return marshal.dumps(flatten(val))
+
+
+def unpack(data):
+  return inflate(marshal.loads(data))
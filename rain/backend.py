@@ -0,0 +1,131 @@
+from . import cache as H
+from . import engine as E
+import llvmlite.binding as llvm
+import os
+import re
+import tempfile
+import time
+
+# optimization levels, as (speed, size)
+levels = {
+  '0': (0, 0),
+  '1': (1, 0),
+  '2': (2, 0),
+  '3': (3, 0),
+  's': (2, 1),
+  'z': (2, 2),
+}
+
+# how eagerly each level inlines, like clang
+thresholds = {
+  (2, 0): 225,
+  (3, 0): 275,
+  (2, 1): 75,
+  (2, 2): 25,
+}
+
+
+# count the instructions in some IR
+def count(llvm_ir):
+  return len(re.findall(r'^  [^ ;]', llvm_ir, re.M))
+
+
+# link IR files into one module, as bitcode
+def link_bitcode(ll_files):
+  E.initialize()
+
+  mods = []
+  for ll_file in ll_files:
+    with open(ll_file) as tmp:
+      mods.append(llvm.parse_assembly(tmp.read()))
+
+  for mod in mods[1:]:
+    mods[0].link_in(mod)
+
+  return mods[0].as_bitcode()
+
+
+class Backend:
+  '''Optimizes modules and emits object files in this process.
+
+  level is one of the keys of levels. passes, if given, replaces the standard
+  pipeline with a list of llvmlite pass names, like ['sroa', 'gvn'] - a pass
+  that takes an argument is given as 'function_inlining=225'.'''
+
+  def __init__(self, level='2', passes=None, cache=False):
+    E.initialize()
+
+    if level not in levels:
+      raise ValueError('Unknown optimization level {!r}'.format(level))
+
+    self.level = level
+    self.speed, self.size = levels[level]
+    self.passes = list(passes) if passes is not None else None
+    self.cache = cache
+    self.objects = {}  # IR file -> object file, for programs built together
+
+    for name in self.passes or []:
+      if not hasattr(llvm.ModulePassManager, 'add_{}_pass'.format(name.split('=')[0])):
+        raise ValueError('Unknown pass {!r}'.format(name))
+
+    target = llvm.Target.from_default_triple()
+    self.machine = target.create_target_machine(opt=self.speed, reloc='pic', codemodel='default')
+    self.host = H.digest(self.machine.triple, *map(str, llvm.llvm_version_info),
+                         level, *(self.passes or []))
+
+  def pass_manager(self):
+    pm = llvm.create_module_pass_manager()
+
+    if self.passes is None:
+      pmb = llvm.create_pass_manager_builder()
+      pmb.opt_level = self.speed
+      pmb.size_level = self.size
+      if (self.speed, self.size) in thresholds:
+        pmb.inlining_threshold = thresholds[self.speed, self.size]
+      pmb.populate(pm)
+
+    else:
+      for name in self.passes:
+        name, *args = name.split('=')
+        getattr(pm, 'add_{}_pass'.format(name))(*map(int, args))
+
+    return pm
+
+  # optimize some IR and emit it as an object file. returns the object file
+  # and (seconds, instructions before, instructions after), or None for
+  # stats when the object came from the cache or was already emitted
+  def compile(self, ll_file):
+    if ll_file in self.objects:
+      return self.objects[ll_file], None
+
+    path, stats = self.emit(ll_file)
+    self.objects[ll_file] = path
+    return path, stats
+
+  def emit(self, ll_file):
+    with open(ll_file) as tmp:
+      llvm_ir = tmp.read()
+
+    if self.cache:
+      path = H.object_path(llvm_ir, self.host)
+      if os.path.isfile(path):
+        return path, None
+
+    start = time.perf_counter()
+    mod = llvm.parse_assembly(llvm_ir)
+    mod.triple = self.machine.triple
+    mod.data_layout = str(self.machine.target_data)
+    mod.verify()
+
+    self.pass_manager().run(mod)
+    obj = self.machine.emit_object(mod)
+    stats = (time.perf_counter() - start, count(llvm_ir), count(str(mod)))
+
+    if self.cache and H.write(path, obj):
+      return path, stats
+
+    handle, path = tempfile.mkstemp(prefix=os.path.basename(ll_file), suffix='.o')
+    with os.fdopen(handle, 'wb') as tmp:
+      tmp.write(obj)
+
+    return path, stats
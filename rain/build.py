@@ -0,0 +1,212 @@
+from . import ast as A
+from . import compiler as C
+from . import module as M
+from . import trace as Z
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from itertools import count
+from orderedset import OrderedSet
+import os
+
+
+# split the import graph into strongly connected groups of modules. groups
+# come out with their imports first, and each group starts with the module
+# that a serial build would reach first
+def groups(graph, root):
+  index = {}
+  low = {}
+  stack = []
+  ret = []
+
+  def visit(file):
+    index[file] = low[file] = len(index)
+    stack.append(file)
+
+    for dep in graph[file]:
+      if dep not in index:
+        visit(dep)
+        low[file] = min(low[file], low[dep])
+      elif dep in stack:
+        low[file] = min(low[file], index[dep])
+
+    if low[file] == index[file]:
+      group = stack[stack.index(file):]
+      del stack[stack.index(file):]
+      ret.append(group)
+
+  visit(root)
+  return ret
+
+
+# Summaries ###################################################################
+
+# save the emitted state of a group of compilers on top of the modules it
+# imports
+def dump(comps, deps):
+  state = [(comp.file, comp.ll, comp.links, comp.libs, [mod.file for mod in comp.mods]) for comp in comps]
+  return state, M.dump([comp.mod for comp in comps], [comp.mod for comp in deps])
+
+
+# load the emitted state of a group of compilers into a session. the groups it
+# imports have to be loaded first
+def load(session, data):
+  known = {comp.file: comp.mod for comp in session.compilers.values() if comp.mod}
+  state, sums = data
+  mods = dict(known)
+  mods.update((mod.file, mod) for mod in M.load(sums, known))
+
+  comps = []
+  for file, ll, links, libs, names in state:
+    comp = session.get_compiler(file)
+    comps.append(comp)
+    comp.phase = C.Compiler.WRITE
+    comp.mod = mods[file]
+    comp.mod.session = session
+    comp.ll = ll
+    comp.links |= links
+    comp.libs |= libs
+    comp.mods = OrderedSet(mods[name] for name in names)
+
+  return comps
+
+
+# Workers #####################################################################
+
+# each worker keeps one session for the whole build, like a serial build
+# does. modules imported for their macros are parsed once per process, and
+# emitted groups are loaded once per process. every task carries the build's
+# settings, and the first task of a build in a process sets it up
+def setup(build, quiet, verbose, cache, tracing):
+  global worker, loaded, current
+
+  if current == build:
+    return
+  current = build
+
+  C.Compiler.quiet = quiet
+  C.Compiler.verbose = verbose
+  C.Compiler.cache = cache
+  worker = C.Session()
+  worker.compiling = False  # the main process compiles the C links
+  worker.tracer = Z.Tracer() if tracing else None
+  loaded = {}
+
+
+# the spans traced since the last call, for the main process
+def spans():
+  return worker.tracer.drain() if worker.tracer else []
+
+
+worker = None
+loaded = None
+current = None  # the build the worker is set up for
+builds = count()
+
+
+def front(settings, file):
+  setup(*settings)
+
+  comp = worker.get_compiler(file)
+  comp.read()
+  comp.parse()
+
+  return A.pack(comp.ast), C.imports(comp.file, comp.ast, worker.index), spans()
+
+
+# emit a group of modules on top of the emitted groups it imports. returns
+# the group's state for other workers, and where each module's IR went
+def back(settings, num, files, asts, units, target, main, phase):
+  setup(*settings)
+
+  deps = []
+  for dep, data in units:
+    if dep not in loaded:
+      loaded[dep] = load(worker, data)
+    deps += loaded[dep]
+
+  comps = []
+  for file in files:
+    comp = worker.get_compiler(file)
+    comp.target = target if file == main else None
+    comp.main = file == main
+    comp.ast = A.unpack(asts[file])
+    comp.phase = C.Compiler.PARSE
+    comps.append(comp)
+
+  if comps[0].main:
+    comps[0].goodies(phase)
+  else:
+    comps[0].goodies()
+
+  loaded[num] = comps
+  return dump(comps, deps), [(comp.file, comp.ll, comp.links, comp.libs) for comp in comps], spans()
+
+
+# Builds ######################################################################
+
+# build a program over a pool of processes. every module is parsed in
+# parallel, then each group of modules is emitted as soon as everything it
+# imports has been
+def build(comp, phase=C.phases.building, jobs=None):
+  if phase.value <= C.phases.parsing.value:
+    return comp.goodies(phase)
+
+  if phase == C.phases.building and comp.session.compiling is None:
+    comp.session.compiling = True
+
+  tracer = comp.session.tracer
+  build = os.getpid(), next(builds)
+  settings = (build, C.Compiler.quiet, C.Compiler.verbose, C.Compiler.cache, tracer is not None)
+  with ProcessPoolExecutor(jobs) as pool:
+    asts = {}
+    graph = {}
+
+    pending = {pool.submit(front, settings, comp.file): comp.file}
+    while pending:
+      done, _ = wait(pending, return_when=FIRST_COMPLETED)
+      for future in done:
+        file = pending.pop(future)
+        asts[file], graph[file], traced = future.result()
+        if tracer:
+          tracer.merge(traced)
+
+        for dep in graph[file]:
+          if dep not in graph and dep not in pending.values():
+            pending[pool.submit(front, settings, dep)] = dep
+
+    order = groups(graph, comp.file)
+    owner = {file: num for num, group in enumerate(order) for file in group}
+
+    # every group that each group imports, directly or not
+    needs = []
+    for num, group in enumerate(order):
+      deps = {owner[dep] for file in group for dep in graph[file]} - {num}
+      needs.append(deps.union(*(needs[dep] for dep in deps)))
+
+    units = {}
+    waiting = list(range(len(order)))
+    pending = {}
+    while waiting or pending:
+      for num in [num for num in waiting if needs[num] <= units.keys()]:
+        waiting.remove(num)
+        args = (num, order[num], {file: asts[file] for file in order[num]},
+                [(dep, units[dep]) for dep in sorted(needs[num])], comp.target, comp.file, phase)
+        pending[pool.submit(back, settings, *args)] = num
+
+      done, _ = wait(pending, return_when=FIRST_COMPLETED)
+      for future in done:
+        num = pending.pop(future)
+        units[num], states, traced = future.result()
+        if tracer:
+          tracer.merge(traced)
+
+        # the modules themselves stay in the workers. this side only needs
+        # to know what to compile and link
+        for file, ll, links, libs in states:
+          other = comp.session.get_compiler(file)
+          other.phase = C.Compiler.WRITE
+          other.ll = ll
+          other.links |= links
+          other.libs |= libs
+          other.start_links()
@@ -0,0 +1,435 @@
+from . import ast as A
+from os.path import join
+from collections import OrderedDict
+import hashlib
+import marshal
+import os
+import os.path
+import re
+import subprocess
+import sys
+import threading
+import time
+
+FORMAT = 1
+KEY_LENGTH = 20  # characters of a key that name its entry
+
+
+# hash a series of strings or bytes
+def digest(*parts):
+  hasher = hashlib.sha1()
+  for part in parts:
+    if isinstance(part, str):
+      part = part.encode('utf-8')
+    hasher.update(part)
+    hasher.update(b'\0')
+
+  return hasher.hexdigest()
+
+
+# digest of everything a parse depends on. macros are expanded while parsing,
+# so that's the whole compiler and the runtime macros run on (lib/ast.rn, the
+# builtins and their C) as well as the front end. any change to them
+# invalidates old entries
+def version():
+  global _version
+  if _version is None:
+    parts = [build_version()]
+
+    lib = os.getenv('RAINLIB')
+    if lib:
+      for base, dirs, names in sorted(os.walk(lib)):
+        dirs.sort()
+        for name in sorted(names):
+          if name.endswith(('.rn', '.c', '.h')):
+            with open(join(base, name), 'rb') as tmp:
+              parts += [os.path.relpath(join(base, name), lib), tmp.read()]
+
+    _version = digest(*parts)
+
+  return _version
+
+_version = None
+
+
+# whether a file is part of the installed library, under RAINLIB or RAINBASE
+def in_library(file):
+  path = os.path.abspath(file)
+  for var in ('RAINLIB', 'RAINBASE'):
+    if os.getenv(var):
+      base = os.path.abspath(os.environ[var])
+      if path.startswith(base + os.sep):
+        return True
+
+  return False
+
+
+# directory to keep one kind of cache entry in. defaults to __rncache__ next
+# to the source file when there is one, except for the library's own files,
+# whose directories may not be writable
+def directory(kind, file=None):
+  if os.getenv('RAIN_CACHE_DIR'):
+    return join(os.environ['RAIN_CACHE_DIR'], kind)
+
+  if file and not in_library(file):
+    return join(os.path.dirname(os.path.abspath(file)), '__rncache__', kind)
+
+  return join(os.path.expanduser('~'), '.cache', 'rain', kind)
+
+
+def read(path):
+  try:
+    with open(path, 'rb') as tmp:
+      return tmp.read()
+  except OSError:
+    return None
+
+
+# write an entry atomically; a cache that can't be written is just skipped.
+# returns whether it was written
+def write(path, data):
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as out:
+      out.write(data)
+    os.replace(tmp, path)
+    return True
+  except OSError:
+    return False
+
+
+# AST cache ###################################################################
+
+def ast_path(file, src):
+  key = digest(version(), src)
+  return join(directory('ast', file), '{}.{}.ast'.format(os.path.basename(file), key[:KEY_LENGTH]))
+
+
+# load a cached program. returns (ast, deps) or None, where deps is a list of
+# (file, digest) pairs for the imports it was parsed against
+def load_ast(file, src):
+  data = read(ast_path(file, src))
+  if data is None:
+    return None
+
+  try:
+    deps, packed = marshal.loads(data)
+    return A.unpack(packed), deps
+  except (EOFError, ValueError, TypeError, KeyError):
+    return None
+
+
+def save_ast(file, src, ast, deps):
+  try:
+    data = marshal.dumps((deps, A.pack(ast)))
+  except ValueError:
+    return
+
+  write(ast_path(file, src), data)
+
+
+# Build cache #################################################################
+
+# digest of the whole compiler - emitted IR depends on all of it
+def build_version():
+  global _build_version
+  if _build_version is None:
+    base = os.path.dirname(os.path.abspath(__file__))
+    parts = [str(FORMAT), sys.version]
+    for name in sorted(os.listdir(base)):
+      if name.endswith('.py'):
+        with open(join(base, name), 'rb') as tmp:
+          parts.append(tmp.read())
+
+    _build_version = digest(*parts)
+
+  return _build_version
+
+_build_version = None
+
+
+def imports_path(file, src_key):
+  return join(directory('build', file), '{}.{}.imp'.format(os.path.basename(file), src_key[:KEY_LENGTH]))
+
+
+# the modules that a source file imports, or None
+def load_imports(file, src_key):
+  data = read(imports_path(file, src_key))
+  if data is None:
+    return None
+
+  try:
+    return marshal.loads(data)
+  except (EOFError, ValueError, TypeError):
+    return None
+
+
+def save_imports(file, src_key, files):
+  write(imports_path(file, src_key), marshal.dumps(list(files)))
+
+
+# where a module's IR goes, keyed by everything it was emitted from
+def build_path(file, key):
+  return join(directory('build', file), '{}.{}.ll'.format(os.path.basename(file), key[:KEY_LENGTH]))
+
+
+# load a built module and any modules in a cycle with it. returns (members,
+# files, summary) or None. members are (file, ll, links, libs) for each module,
+# where links are ('module', file) or ('file', path) pairs. summary is the
+# summaries of the modules and the files of the modules each one imports, on
+# top of the modules named in files
+def load_build(file, key):
+  data = read(build_path(file, key)[:-3] + '.sum')
+  if data is None:
+    return None
+
+  try:
+    members, files, summary = marshal.loads(data)
+  except (EOFError, ValueError, TypeError):
+    return None
+
+  if not all(os.path.isfile(ll) for file, ll, links, libs in members):
+    return None
+
+  return members, files, summary
+
+
+def save_build(file, key, members, files, summary):
+  data = marshal.dumps((members, files, summary))
+  write(build_path(file, key)[:-3] + '.sum', data)
+
+
+# C links #####################################################################
+
+C_SIZE = 256 * 1024 * 1024  # bytes of compiled C to keep
+GRACE = 60 * 60  # seconds an entry is kept after it's used, whatever the size
+
+
+# every local header a C file includes, directly or not
+def headers(src):
+  found = []
+  todo = [os.path.abspath(src)]
+  while todo:
+    base = todo.pop()
+    with open(base) as tmp:
+      text = tmp.read()
+
+    for name in re.findall(r'^\s*#\s*include\s*"([^"]+)"', text, re.M):
+      path = os.path.normpath(join(os.path.dirname(base), name))
+      if path not in found and os.path.isfile(path):
+        found.append(path)
+        todo.append(path)
+
+  return sorted(found)
+
+
+# the size and mtime of a C file and its local headers, to tell whether it
+# changed since it was compiled. None if it can't be read
+def c_stamp(src):
+  try:
+    stamp = []
+    for path in [src] + headers(src):
+      stat = os.stat(path)
+      stamp.append((path, stat.st_mtime_ns, stat.st_size))
+  except OSError:
+    return None
+
+  return stamp
+
+
+# the version banner of a compiler, asked for once per process
+def tool_version(cmd):
+  if cmd not in _tool_versions:
+    try:
+      _tool_versions[cmd] = subprocess.check_output([cmd, '--version']).decode('utf-8', 'replace')
+    except (OSError, subprocess.CalledProcessError):
+      _tool_versions[cmd] = ''
+
+  return _tool_versions[cmd]
+
+_tool_versions = {}
+
+
+# the header search path a compiler reports for a C file, which follows its
+# sysroot and environment, and every header the file includes once they're
+# resolved, system headers too. returns (search, [path]), or None if the
+# compiler can't tell
+def c_deps(src, cmd):
+  try:
+    proc = subprocess.Popen([cmd, '-M', '-v', src], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+  except OSError:
+    return None
+
+  if proc.returncode != 0:
+    return None
+
+  out = out.decode('utf-8', 'replace').replace('\\\n', ' ')
+  err = err.decode('utf-8', 'replace')
+  search = re.search(r'^#include .*?^End of search list\.', err, re.M | re.S)
+
+  rules = out.split(':', 1)[1].strip() if ':' in out else ''
+  paths = [path.replace('\\ ', ' ') for path in re.split(r'(?<!\\)\s+', rules) if path]
+  if not paths:
+    return None
+
+  return (search.group(0) if search else ''), paths
+
+
+# where the compiled form of a C file goes, keyed by its source and headers,
+# the compiler, its header search path, and its flags
+def c_path(src, cmd, flags, suffix='.ll'):
+  parts = [str(FORMAT), tool_version(cmd)] + list(flags)
+
+  deps = c_deps(src, cmd)
+  if deps is None:
+    deps = '', [src] + headers(src)
+
+  search, paths = deps
+  parts.append(search)
+  for path in sorted(path for path in set(paths) | {src} if path == src or os.path.isfile(path)):
+    with open(path, 'rb') as tmp:
+      parts.append(tmp.read())
+
+  key = digest(*parts)
+  return join(directory('c'), '{}.{}{}'.format(os.path.basename(src), key[:KEY_LENGTH], suffix))
+
+
+# where a library built from some C IR goes, keyed by the IR and the compiler
+def runtime_path(lls, cmd, name):
+  parts = [str(FORMAT), tool_version(cmd)]
+  for ll in lls:
+    with open(ll, 'rb') as tmp:
+      parts.append(tmp.read())
+
+  key = digest(*parts)
+  base, ext = os.path.splitext(name)
+  return join(directory('lib'), '{}.{}{}'.format(base, key[:KEY_LENGTH], ext))
+
+
+# mark an entry as recently used. returns whether it's still there
+def touch(path):
+  try:
+    os.utime(path)
+    return True
+  except OSError:
+    return False
+
+
+# remove the least recently used entries of a kind past a total size. entries
+# used within the grace period are kept, since whoever used them may not have
+# read them yet
+def evict(kind, size):
+  cutoff = time.time() - GRACE
+  try:
+    entries = []
+    for entry in os.scandir(directory(kind)):
+      if entry.is_file() and not entry.name.endswith('.tmp'):
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for mtime, size, path in entries)
+    for mtime, entry_size, path in sorted(entries):
+      if total <= size or mtime > cutoff:
+        break
+
+      # it may have been used since it was listed
+      if os.stat(path).st_mtime <= cutoff:
+        os.remove(path)
+        total -= entry_size
+  except OSError:
+    pass
+
+
+# Libraries ###################################################################
+
+def libs_path(key):
+  return join(directory('libs'), '{}.libs'.format(key[:KEY_LENGTH]))
+
+
+# load where libraries were found, as {lib: path}, or None
+def load_libs(key):
+  data = read(libs_path(key))
+  if data is None:
+    return None
+
+  try:
+    return marshal.loads(data)
+  except (EOFError, ValueError, TypeError):
+    return None
+
+
+def save_libs(key, found):
+  write(libs_path(key), marshal.dumps(dict(found)))
+
+
+# Object cache ################################################################
+
+# machine code for a JIT-compiled module, keyed by its IR and the host it was
+# compiled for
+def object_path(ir, host):
+  key = digest(str(FORMAT), host, ir)
+  return join(directory('jit'), '{}.o'.format(key[:KEY_LENGTH]))
+
+
+def load_object(ir, host):
+  return read(object_path(ir, host))
+
+
+def save_object(ir, host, obj):
+  write(object_path(ir, host), obj)
+
+
+# Macro expansions ############################################################
+
+class LRU:
+  '''A dict that forgets its least recently used entries past a size.'''
+
+  def __init__(self, size):
+    self.size = size
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def get(self, key):
+    with self.lock:
+      if key not in self.entries:
+        return None
+
+      self.entries.move_to_end(key)
+      return self.entries[key]
+
+  def put(self, key, val):
+    with self.lock:
+      self.entries[key] = val
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.size:
+        self.entries.popitem(last=False)
+
+
+def expansion_path(file, key):
+  return join(directory('macro', file), '{}.exp'.format(key[:KEY_LENGTH]))
+
+
+# load a flattened macro expansion, or None
+def load_expansion(file, key):
+  data = read(expansion_path(file, key))
+  if data is None:
+    return None
+
+  try:
+    return marshal.loads(data)
+  except (EOFError, ValueError, TypeError):
+    return None
+
+
+def save_expansion(file, key, flat):
+  try:
+    data = marshal.dumps(flat)
+  except ValueError:
+    return
+
+  write(expansion_path(file, key), data)
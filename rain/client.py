@@ -0,0 +1,73 @@
+'''Builds a program on a compile server, started with rainc --server.
+
+Takes the same arguments as rainc:
+
+    python -m rain.client [-r] FILE [ARG ...]
+
+The server's output is streamed back as it's written. A program built with
+--run is run here, not in the server. This module only imports what it
+has to from the standard library, so that it starts quickly.
+'''
+
+import json
+import os
+import os.path
+import socket
+import sys
+
+
+# where the server listens unless told otherwise
+def socket_path():
+  tmp = os.getenv('TMPDIR', '/tmp')
+  return os.getenv('RAIN_SERVER') or os.path.join(tmp, 'rainc-{}.sock'.format(os.getuid()))
+
+
+# send a build to the server, writing its output to out as it arrives.
+# returns the server's reply: {'exit': code, 'run': [program, arg...] or None}
+def request(argv, path=None, out=None):
+  out = out or sys.stdout.buffer
+
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  with sock:
+    sock.connect(path or socket_path())
+    sock.sendall(json.dumps({'cwd': os.getcwd(), 'argv': list(argv)}).encode('utf-8') + b'\n')
+
+    # output, then a NUL and the reply
+    tail = None
+    while True:
+      data = sock.recv(65536)
+      if not data:
+        break
+
+      if tail is not None:
+        tail += data
+        continue
+
+      head, sep, rest = data.partition(b'\0')
+      out.write(head)
+      out.flush()
+      if sep:
+        tail = rest
+
+  if tail is None:
+    return {'exit': 1, 'run': None}
+
+  return json.loads(tail.decode('utf-8'))
+
+
+def main(argv):
+  try:
+    reply = request(argv)
+  except OSError as exc:
+    print("error: can't reach the compile server at {}: {}".format(socket_path(), exc))
+    return 1
+
+  if reply['exit'] or not reply['run']:
+    return reply['exit']
+
+  sys.stdout.flush()
+  os.execv(reply['run'][0], reply['run'])
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -1,8 +1,10 @@
 from . import ast as A
-from . import emit
+from . import cache as H
+from . import error as Q
+from . import index as N
 from . import lexer as L
-from . import module as M
-from . import parser as P
+from . import libs as I
+from . import trace as Z
 from contextlib import contextmanager
 from enum import Enum
 from orderedset import OrderedSet
@@ -10,61 +12,270 @@ from os import environ as ENV
 from os.path import join
 from termcolor import colored as X
 import os.path
+import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import traceback
 
-compilers = {}
-c_files = {}
+class Session:
+  '''State for one build.
+
+  Owns the compiler registry, the compiled C links, the lexer's bracket
+  state, and the index used to find modules, so several programs can be built
+  at once from different threads. Macro engines are shared by every session
+  in the process, and a forked session shares its compiled C, the pool clang
+  runs in, found libraries and directory listings with the one it came from.
+
+  A session that has compiled C keeps threads for it until it's closed.'''
+
+  def __init__(self):
+    self.compilers = {}
+    self.c_files = {}    # source -> (its stamp, future of its compiled IR)
+    self.c_pool = None   # runs clang, once there's something to compile
+    self.c_lock = threading.Lock()
+    self.compiling = None  # whether C links start as soon as they're found
+    self.resolver = None   # finds shared libraries, once one is needed
+    self.tracer = None     # a trace.Tracer, to time the build with
+    self.runtimes = {}     # (runtime IR, lto) -> built runtime library
+    self.ignore_whitespace = []
+    self.index = N.Index()
+    self.forked = False  # whether the C pool is another session's
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+    return False
+
+  # stop the threads that run clang, once what they're running is done. a
+  # forked session leaves the pool to the one it came from
+  def close(self):
+    if self.forked:
+      return
 
+    with self.c_lock:
+      pool, self.c_pool = self.c_pool, None
+
+    if pool is not None:
+      pool.shutdown()
+
+  # a session for one program of a batch. it starts from the modules that
+  # this one has emitted, other than main modules, and shares its compiled C,
+  # found libraries and directory listings. C is compiled again once its
+  # source changes
+  def fork(self):
+    session = Session()
+    session.compilers.update((file, comp) for file, comp in self.compilers.items() if not comp.main)
+    session.c_files = self.c_files
+    session.c_lock = self.c_lock
+    session.c_pool = self.pool()
+    session.forked = True
+    session.resolver = self.resolver
+    session.tracer = self.tracer
+    session.runtimes = self.runtimes
+    session.index = self.index.fork()
+    return session
+
+  # take in what a forked session emitted for a program, for the programs
+  # after it. its main module is left out, and so is anything that imports
+  # the main module back, since that links with the program's main function
+  def adopt(self, session, main):
+    for file, comp in session.compilers.items():
+      if comp.main or file in self.compilers:
+        continue
+      if main.ll in comp.links or (main.mod is not None and main.mod in comp.mods):
+        continue
 
-# USE THIS to get a new compiler. it fuzzy searches for the source file and
-# also prevents multiple compilers from being made for the same file
-def get_compiler(src, target=None, main=False):
-  abspath = os.path.abspath(src)
+      self.compilers[file] = comp
 
-  if abspath not in compilers:
-    compilers[abspath] = Compiler(abspath, target, main)
+    if self.resolver is None:
+      self.resolver = session.resolver
 
-  return compilers[abspath]
+  # time a phase of the build, if it's being traced. yields a dict for the
+  # span's arguments, or None
+  def span(self, name, module, **args):
+    if self.tracer is None:
+      return Z.untraced
 
+    return self.tracer.span(name, module, **args)
 
-def compile_c(src):
-  if src not in c_files:
-    clang = os.getenv('CLANG', 'clang')
+  # USE THIS to get a new compiler. it fuzzy searches for the source file and
+  # also prevents multiple compilers from being made for the same file
+  def get_compiler(self, src, target=None, main=False):
+    abspath = os.path.abspath(src)
+
+    if abspath not in self.compilers:
+      self.compilers[abspath] = Compiler(abspath, target, main, session=self)
+
+    return self.compilers[abspath]
+
+  # find the shared library files for some libraries, as given to -l
+  def find_libs(self, libs):
+    with self.span('find_libs', ' '.join(sorted(libs)), libs=len(libs)):
+      if self.resolver is None:
+        self.resolver = I.Resolver(cache=Compiler.cache)
+
+      paths = []
+      for lib in sorted(libs):
+        path = self.resolver.find(lib)
+        if path is None:
+          Q.abort("Can't find library {!r}", lib)
+        paths.append(path)
+
+      return paths
+
+  # the pool that clang runs in
+  def pool(self):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with self.c_lock:
+      if self.c_pool is None:
+        self.c_pool = ThreadPoolExecutor(Compiler.c_jobs or os.cpu_count() or 1)
+
+      return self.c_pool
+
+  # start compiling a C file in the background, unless it's compiled already,
+  # unchanged since, and its IR is still there. returns a future of its IR
+  def start_c(self, src):
+    pool = self.pool()
+    stamp = H.c_stamp(src)
+    with self.c_lock:
+      if src not in self.c_files or self.c_files[src][0] != stamp or evicted(self.c_files[src][1]):
+        self.c_files[src] = stamp, pool.submit(self.run_c, src)
+
+      return self.c_files[src][1]
+
+  # compile a C file to IR, waiting for it if it's already started
+  def compile_c(self, src):
+    return self.start_c(src).result()
 
-    handle, target = tempfile.mkstemp(prefix=os.path.basename(src), suffix='.ll')
+  # run clang on a C file. the IR is kept in the cache across builds
+  def run_c(self, src):
+    clang = os.getenv('CLANG', 'clang')
     flags = ['-O2', '-S', '-emit-llvm']
 
-    cmd = [clang, '-o', target, src] + flags
-    subprocess.check_call(cmd)
+    with self.span('compile_c', os.path.basename(src), cached=False) as info:
+      cached = H.c_path(src, clang, flags) if Compiler.cache else None
+      if cached and H.touch(cached):
+        if info is not None:
+          info['cached'] = True
+        return cached
+
+      handle, target = tempfile.mkstemp(prefix=os.path.basename(src), suffix='.ll')
+      os.close(handle)
+
+      cmd = [clang, '-o', target, src] + flags
+      subprocess.check_call(cmd)
+
+      data = H.read(target)
+      if info is not None and data is not None:
+        info['ir'] = len(data)
+      if cached and data is not None and H.write(cached, data):
+        os.remove(target)
+        target = cached
+        H.evict('c', H.C_SIZE)
+
+      return target
+
+  # build the runtime's C links into a static library, or into one bitcode
+  # file for link-time optimization. either is kept in the cache, keyed by
+  # the IR it's built from
+  def runtime_lib(self, srcs, lto=False):
+    lls = [future.result() for future in [self.start_c(src) for src in sorted(srcs)]]
+
+    key = tuple(lls), lto
+    if key not in self.runtimes or not os.path.isfile(self.runtimes[key]):
+      with self.span('runtime_lib', 'librain.bc' if lto else 'librain.a', files=len(srcs)):
+        self.runtimes[key] = self.build_runtime(lls, lto)
+
+    return self.runtimes[key]
+
+  def build_runtime(self, lls, lto):
+    clang = os.getenv('CLANG', 'clang')
+    name = 'librain.bc' if lto else 'librain.a'
+    cached = H.runtime_path(lls, clang, name) if Compiler.cache else None
+    if cached and H.touch(cached):
+      return cached
+
+    path = join(tempfile.mkdtemp(prefix='librain'), name)
+    if lto:
+      from . import backend as D
+
+      with open(path, 'wb') as tmp:
+        tmp.write(D.link_bitcode(lls))
+
+    else:
+      objs = [join(os.path.dirname(path), '{}.{}.o'.format(num, os.path.basename(ll)))
+              for num, ll in enumerate(lls)]
+      jobs = [self.pool().submit(subprocess.check_call, [clang, '-o', obj, ll, '-c', '-O2'])
+              for ll, obj in zip(lls, objs)]
+      for job in jobs:
+        job.result()
+
+      subprocess.check_call([os.getenv('AR', 'ar'), 'rcs', path] + objs)
 
-    c_files[src] = target
+    data = H.read(path)
+    if cached and data is not None and H.write(cached, data):
+      shutil.rmtree(os.path.dirname(path))
+      H.evict('lib', H.C_SIZE)
+      return cached
 
-  return c_files[src]
+    return path
 
 
-def compile_so(libs):
-  # I don't know how else to find these .so files other than just asking clang
-  # to make a .so file out of all of them
+# whether a finished compile's output has been evicted from the cache since
+def evicted(future):
+  return future.done() and future.exception() is None and not os.path.isfile(future.result())
 
-  clang = os.getenv('CLANG', 'clang')
 
-  handle, target = tempfile.mkstemp(prefix='slibs', suffix='.so')
-  libs = ['-l' + lib for lib in libs]
+# the session used when none is given
+default_session = Session()
 
-  cmd = [clang, '-shared', '-o', target] + libs
-  subprocess.check_call(cmd)
 
-  return target
+def get_compiler(src, target=None, main=False, session=None):
+  return (session or default_session).get_compiler(src, target, main)
+
+
+def compile_c(src, session=None):
+  return (session or default_session).compile_c(src)
+
+
+def find_libs(libs, session=None):
+  return (session or default_session).find_libs(libs)
+
+
+# the module that everything but itself is linked with
+def builtin():
+  return os.path.abspath(join(ENV['RAINLIB'], '_pkg.rn'))
+
+
+# whether a link is part of the runtime, which is linked as one library
+def in_runtime(link):
+  base = os.path.abspath(ENV['RAINLIB'])
+  return link.endswith('.c') and os.path.abspath(link).startswith(base + os.sep)
+
+
+# find the modules that a program imports, in the order they're emitted
+def imports(file, ast, index=N.files):
+  base, fname = os.path.split(file)
+  deps = [] if file == builtin() else [builtin()]
+
+  for node in ast.stmts:
+    if isinstance(node, A.import_node):
+      dep = index.find_rain(node.name, paths=[base])
+      if dep:
+        deps.append(os.path.abspath(dep))
+
+  return deps
 
 
 def reset_compilers():
-  global compilers
-  global c_files
-  compilers = {}
-  c_files = {}
+  global default_session
+  default_session.close()
+  default_session = Session()
 
 
 class phases(Enum):
@@ -74,7 +285,37 @@ class phases(Enum):
   building = 3
 
 
+# build several programs in one pass. each module that isn't one of the
+# programs' main module is emitted once, and its IR and compiled C links are
+# shared by every program that imports it. only the main modules and the
+# final links are done once per program. a program's modules are only kept
+# for the ones after it once it's built. returns the main compilers
+def batch(srcs, phase=phases.building, targets=None, session=None, links=()):
+  session = session or default_session
+  targets = targets or [None] * len(srcs)
+
+  comps = []
+  for src, target in zip(srcs, targets):
+    with session.fork() as own:
+      comp = own.get_compiler(src, target, main=True)
+      comp.links.update(links)
+      comp.goodies(phase)
+      if phase == phases.building:
+        comp.compile()
+
+      session.adopt(own, comp)
+      comps.append(comp)
+
+  return comps
+
+
 class Compiler:
+  '''Takes a module through each phase of the build.
+
+  Only the lexer is loaded up front. The parser, the emitter and llvmlite
+  are imported by the phases that use them, so a command that stops early,
+  or finds everything in the build cache, doesn't pay for loading them.'''
+
   NONE  = 0
   READ  = 1
   LEX   = 2
@@ -85,10 +326,16 @@ class Compiler:
 
   quiet = False
   verbose = False
+  cache = True  # load and save parsed programs and built modules
+  low_memory = False  # shrink modules once their IR is written
+  c_jobs = None  # C links compiled at once, or one per CPU
+  backend = None  # a backend.Backend to emit objects with, instead of clang
+  lto = False     # link with the runtime's bitcode, so it can be inlined
 
-  def __init__(self, file, target=None, main=False):
+  def __init__(self, file, target=None, main=False, session=None):
     self.file = file
-    self.qname, self.mname = M.find_name(file)
+    self.session = session or default_session
+    self.qname, self.mname = self.session.index.find_name(file)
 
     self.vprint('{:>10} {} from {}', 'using', X(self.qname, 'green'), X(self.file, 'blue'))
 
@@ -100,8 +347,14 @@ class Compiler:
     self.libs = set()
 
     self.phase = Compiler.NONE
+    self.src = None     # set after reading
+    self.hash = None    # digest of the source, once it's needed
+    self.key = None     # build cache key, set before writing
+    self.tokens = None  # set after lexing
+    self.parser = None  # set after parsing, unless fetched from the build cache
     self.stream = None  # set after lexing
     self.ast = None     # set after parsing
+    self.deps = []      # (file, digest) of every module the AST depends on
     self.mod = None     # set before emitting
     self.ll = None      # set after writing
 
@@ -115,6 +368,10 @@ class Compiler:
     if cls.verbose:
       print(msg.format(*args), end=end)
 
+  # time a phase of this module, if the build is being traced
+  def span(self, name, **args):
+    return self.session.span(name, self.qname, **args)
+
   @contextmanager
   def okay(self, fmt, *args):
     msg = fmt.format(*args)
@@ -134,40 +391,345 @@ class Compiler:
     if self.mod is not None:
       return
 
+    # a program that's going to be compiled can compile its C links while
+    # the rest of it is emitted
+    if phase == phases.building and self.main and self.session.compiling is None:
+      self.session.compiling = True
+
     # do everything but compile
     with self.okay(phase.name):
       self.read()
-      self.lex()
 
+      # an unchanged module is loaded from the build cache, skipping the rest
+      building = phase == phases.building and self.cache
+      if building and self.phase < Compiler.EMIT:
+        with self.span('fetch') as info:
+          fetched = self.fetch()
+          if info is not None:
+            info['hit'] = fetched
+
+        if fetched:
+          self.start_links()
+          return
+
+      # parsing lexes on its own, unless the AST is cached
+      if phase == phases.lexing:
+        self.lex()
       if phase.value > phases.lexing.value:
         self.parse()
+      if building and self.ast is not None:
+        H.save_imports(self.file, self.checksum(), imports(self.file, self.ast, self.session.index))
       if phase.value > phases.parsing.value:
         self.emit()
 
       self.write(phase)
+      if building:
+        self.store()
+
+      self.start_links()
+
+      if self.low_memory and self.mod is not None:
+        self.shrink()
 
   def read(self):
     if self.phase >= Compiler.READ:
       return
     self.phase = Compiler.READ
 
-    with open(self.file) as tmp:
-      self.src = tmp.read()
+    with self.span('read') as info:
+      with open(self.file) as tmp:
+        self.src = tmp.read()
+
+      if info is not None:
+        info['bytes'] = len(self.src)
+
+  # digest of the source. modules emitted by another process may never have
+  # read it here
+  def checksum(self):
+    if self.hash is None:
+      if self.src is None:
+        with open(self.file) as tmp:
+          self.src = tmp.read()
+
+      self.hash = H.digest(self.src)
+
+    return self.hash
 
   def lex(self):
     if self.phase >= Compiler.LEX:
       return
     self.phase = Compiler.LEX
 
-    self.stream = L.stream(self.src)
+    with self.span('lex') as info:
+      self.tokens = L.lex(self.src, file=self.file, session=self.session)
+      self.stream = iter(self.tokens)
+
+      if info is not None:
+        info['tokens'] = len(self.tokens)
 
   def parse(self):
     if self.phase >= Compiler.PARSE:
       return
+
+    # circular imports may ask for this module again while it's loading
+    if self.tokens is None and self.cache:
+      self.phase = Compiler.PARSE
+      with self.span('load') as info:
+        loaded = self.load()
+        if info is not None:
+          info['hit'] = loaded
+          info['nodes'] = A.count(self.ast) if loaded else 0
+
+      if loaded:
+        return
+
+      self.phase = Compiler.READ
+
+    self.lex()
+    self.phase = Compiler.PARSE
+
+    from . import parser as P
+
+    with self.span('parse', tokens=len(self.tokens)) as info:
+      self.parser = P.context(self.stream, file=self.file, session=self.session)
+      self.ast = P.program(self.parser)
+
+      if info is not None:
+        info['nodes'] = A.count(self.ast)
+
+    self.find_deps()
+    if self.cache:
+      H.save_ast(self.file, self.src, self.ast, self.deps)
+
+  # the modules the AST depends on, from the imports it was parsed with
+  def find_deps(self):
+    self.deps = []
+    for comp in self.parser.imports:
+      self.deps.append((comp.file, H.digest(comp.src)))
+      self.deps.extend(comp.deps)
+
+  # try to load the AST from the cache. imported macros can change how a
+  # module parses, so an entry is only good while its imports are unchanged
+  def load(self):
+    from . import parser as P
+
+    cached = H.load_ast(self.file, self.src)
+    if cached is None:
+      return False
+
+    ast, deps = cached
+    for file, key in deps:
+      try:
+        with open(file) as tmp:
+          if H.digest(tmp.read()) != key:
+            return False
+      except OSError:
+        return False
+
+    self.vprint('{:>10} {}', 'cached', X(self.qname, 'green'))
+
+    self.parser = P.context(iter([]), file=self.file, session=self.session)
+    self.ast = ast
+    self.deps = deps
+
+    P.restore(self.parser, ast)
+    return True
+
+  # apply a text edit to an already parsed module, replacing src[start:stop]
+  # with text. only the top-level statements it touches are lexed and parsed
+  # again; anything later than parsing has to be redone
+  def edit(self, start, stop, text):
+    from . import parser as P
+
+    self.read()
+
+    # a cached AST has no tokens to splice into, so parse it for real
+    if self.tokens is None and self.phase >= Compiler.PARSE:
+      self.phase = Compiler.READ
+
+    self.lex()
+    self.parse()
+
+    self.src = P.reparse(self.parser, self.src, self.tokens, self.ast, start, stop, text)
+    self.stream = iter(self.tokens)
+    self.find_deps()
+
     self.phase = Compiler.PARSE
+    self.hash = None
+    self.key = None
+    self.mods = OrderedSet()
+    self.mod = None
+    self.ll = None
+    self.links = set()
+    self.libs = set()
+
+  # Build cache ###############################################################
+
+  # the source digest of every module this one imports, directly or not, and
+  # the modules it's in an import cycle with, from the imports saved for each
+  # source. returns ({file: digest}, [file]), or None when some aren't known
+  def closure(self):
+    sums = {}
+    graph = {}
+    todo = [self]
+    while todo:
+      comp = todo.pop()
+      if comp.file in sums:
+        continue
+
+      try:
+        sums[comp.file] = comp.checksum()
+      except OSError:
+        return None
+
+      graph[comp.file] = H.load_imports(comp.file, sums[comp.file])
+      if graph[comp.file] is None:
+        return None
+
+      todo.extend(self.session.get_compiler(file) for file in graph[comp.file])
+
+    # the cycle is everything that imports this module back
+    group = [self.file]
+    for file in group:
+      group.extend(dep for dep in graph if file in graph[dep] and dep not in group)
+
+    return sums, group
+
+  # the build cache key: the compiler, the macro runtime, and the sources of
+  # everything the module is emitted from. a cycle of modules is cached as a
+  # whole by the module that was reached first, since their IR depends on it.
+  # returns (key, group), or (None, None)
+  def build_key(self):
+    closure = self.closure()
+    if closure is None:
+      return None, None
+
+    sums, group = closure
+    with open(join(ENV['RAINLIB'], 'ast.rn')) as tmp:
+      runtime = tmp.read()
+
+    sums = sorted('{}:{}'.format(file, key) for file, key in sums.items())
+    return H.digest(H.build_version(), runtime, str(self.main), self.file, *sums), group
+
+  # load the module from the build cache, along with any modules in a cycle
+  # with it. the modules they import are loaded (or built) first
+  def fetch(self):
+    from . import module as M
+
+    key, group = self.build_key()
+    if key is None:
+      return False
+
+    # the rest of a cycle can't be loaded once it's started building itself
+    comps = [self.session.get_compiler(file) for file in group]
+    if any(comp.mod is not None or comp.phase >= Compiler.EMIT for comp in comps[1:]):
+      return False
+
+    entry = H.load_build(self.file, key)
+    if entry is None:
+      return False
+
+    members, files, summary = entry
+    known = {}
+    for file in files:
+      comp = self.session.get_compiler(file)
+      comp.goodies()
+      known.update((mod.file, mod) for mod in comp.imported())
+
+    sums, imports = summary
+    mods = dict(known)
+    mods.update((mod.file, mod) for mod in M.load(sums, known))
+    for (file, ll, links, libs), names in zip(members, imports):
+      comp = self.session.get_compiler(file)
+      comp.phase = Compiler.WRITE
+      comp.mod = mods[file]
+      comp.mod.session = self.session
+      comp.mods = OrderedSet(mods[name] for name in names)
+      comp.ll = ll
+      comp.libs |= set(libs)
+
+    # links to other modules go to wherever their IR is now
+    for file, ll, links, libs in members:
+      comp = self.session.get_compiler(file)
+      for kind, link in links:
+        if kind == 'module':
+          other = self.session.get_compiler(link)
+          other.goodies()
+          link = other.ll
+
+        comp.links.add(link)
+
+      self.vprint('{:>10} {}', 'unchanged', X(comp.qname, 'green'))
+
+    return True
+
+  # the macros the module defines. a module fetched from the build cache is
+  # only parsed once an importer asks for them
+  def macros(self):
+    if self.parser is None:
+      phase, self.phase = self.phase, Compiler.READ
+      self.parse()
+      self.phase = phase
+
+    return self.parser.macros
+
+  # every module that the module's values can refer to: the modules it
+  # imports, the modules those import, and so on
+  def imported(self):
+    ret = OrderedSet()
+    todo = list(self.mods)
+    while todo:
+      mod = todo.pop()
+      if mod not in ret:
+        ret.add(mod)
+        todo.extend(self.session.get_compiler(mod.file).mods)
+
+    return ret
+
+  # save the written module to the build cache, once it and any modules in a
+  # cycle with it are all written. the IR of modules they link with is
+  # recorded as those modules, so they can be fetched in turn
+  def store(self):
+    from . import module as M
+
+    if self.key is None:
+      return
+
+    key, group = self.key
+    comps = [self.session.get_compiler(file) for file in group]
+    group = {comp.mod for comp in comps}
+
+    lls = {comp.ll: comp.file for comp in self.session.compilers.values() if comp.ll}
+    members = []
+    for comp in comps:
+      links = sorted(('module', lls[link]) if link in lls else ('file', link) for link in comp.links)
+      members.append((comp.file, comp.ll, links, sorted(comp.libs)))
+
+    known = OrderedSet(mod for comp in comps for mod in comp.mods if mod not in group)
+    imported = OrderedSet(mod for comp in comps for mod in comp.imported() if mod not in group)
+    imports = [[mod.file for mod in comp.mods] for comp in comps]
+    summary = M.dump([comp.mod for comp in comps], list(imported)), imports
 
-    self.parser = P.context(self.stream, file=self.file)
-    self.ast = P.program(self.parser)
+    H.save_build(self.file, key, members, [mod.file for mod in known], summary)
+
+  # once the IR is written, keep only what importers need: a summary of the
+  # module, its links and libs, and its macros
+  def shrink(self):
+    from . import module as M
+    from . import parser as P
+
+    old = self.mod
+    self.mod, = M.summarize([old], [mod for mod in self.imported() if mod is not old])
+    self.mods = OrderedSet(self.mod if mod is old else mod for mod in self.mods)
+
+    macros = self.parser.macros
+    self.parser = P.context(iter([]), file=self.file, session=self.session)
+    self.parser.macros = macros
+
+    self.src = None
+    self.tokens = None
+    self.stream = None
+    self.ast = None
 
   def link(self, other):
     if other.ll:
@@ -182,11 +744,21 @@ class Compiler:
       return
     self.phase = Compiler.EMIT
 
-    self.mod = M.Module(self.file)
+    with self.span('emit') as info:
+      if info is not None:
+        info['nodes'] = A.count(self.ast)
+
+      self.emit_module()
+
+  def emit_module(self):
+    from . import emit  # the AST's emit methods
+    from . import module as M
+
+    self.mod = M.Module(self.file, session=self.session)
     self.mods.add(self.mod)
 
     # always link with lib/_pkg.rn
-    builtin = get_compiler(join(ENV['RAINLIB'], '_pkg.rn'))
+    builtin = self.session.get_compiler(join(ENV['RAINLIB'], '_pkg.rn'))
     if self is not builtin:  # unless we ARE lib/_pkg.rn
       builtin.goodies()
 
@@ -202,13 +774,13 @@ class Compiler:
     # compile the imports
     imports, links, libs = self.ast.emit(self.mod)
     for mod in imports:
-      comp = get_compiler(mod)
+      comp = self.session.get_compiler(mod)
       comp.goodies()  # should be done during import but might as well be safe
 
       # add the module's IR as well as all of its imports' IR
       self.link(comp)
 
-    self.mods |= OrderedSet(get_compiler(mod).mod for mod in imports)
+    self.mods |= OrderedSet(self.session.get_compiler(mod).mod for mod in imports)
     self.links |= set(links)
     self.libs |= set(libs)
 
@@ -227,6 +799,13 @@ class Compiler:
       return
     self.phase = Compiler.WRITE
 
+    with self.span('write') as info:
+      size = self.write_file(phase)
+      if info is not None and size is not None:
+        info['ir'] = size
+
+  # write out the results of a phase. returns the size of the IR, if any
+  def write_file(self, phase):
     if phase == phases.lexing:
       with open(self.target or self.mname + '.lex', 'w') as tmp:
         for token in self.stream:
@@ -238,49 +817,136 @@ class Compiler:
         tmp.write(A.machine.dump(self.ast))
 
     elif phase == phases.emitting:
+      llvm_ir = self.mod.ir
       with open(self.target or self.mname + '.ll', 'w') as tmp:
-        tmp.write(self.mod.ir)
+        tmp.write(llvm_ir)
+
+      return len(llvm_ir)
 
     elif phase == phases.building:
+      llvm_ir = self.mod.ir
+      self.key = None
+      if self.cache:
+        self.key = self.build_key()
+        key, group = self.key
+
+        # in the middle of a cycle, the IR can only be found by its contents
+        others = [self.session.get_compiler(file) for file in (group or [])[1:]]
+        if key is None or any(comp.phase < Compiler.WRITE for comp in others):
+          self.key = None
+          key = H.digest(H.build_version(), llvm_ir)
+
+        if H.write(H.build_path(self.file, key), llvm_ir.encode('utf-8')):
+          self.ll = H.build_path(self.file, key)
+          return len(llvm_ir)
+
+        self.key = None
+
       handle, name = tempfile.mkstemp(prefix=self.qname + '.', suffix='.ll')
       with os.fdopen(handle, 'w') as tmp:
-        tmp.write(self.mod.ir)
+        tmp.write(llvm_ir)
 
       self.ll = name
+      return len(llvm_ir)
+
+  # start compiling the C links found so far, if the program will be compiled
+  def start_links(self):
+    if self.session.compiling:
+      for link in self.links:
+        if not link.endswith('.ll'):
+          self.session.start_c(link)
 
   def compile_links(self):
     drop = set()
     add = set()
 
+    # all at once, then wait for each
+    for link in self.links:
+      if not link.endswith('.ll'):
+        self.session.start_c(link)
+
     for link in self.links:
       if link.endswith('.ll'):
         continue
 
-      target = compile_c(link)
+      with self.span('wait_c'):
+        target = self.session.compile_c(link)
 
       drop.add(link)
       add.add(target)
 
     self.links = (self.links | add) - drop
 
-    return compile_so(self.libs)
-
   def compile(self):
     if self.phase >= Compiler.COMP:
       return
     self.phase = Compiler.COMP
 
-    self.compile_links()
-
     with self.okay('compiling'):
+      # the runtime is linked as one prebuilt library, not file by file
+      runtime = {link for link in self.links if in_runtime(link)}
+      self.links -= runtime
+      self.compile_links()
+
+      main, links = self.ll, list(self.links)
+      if Compiler.backend:
+        main, links = self.emit_objects()
+
+      links = sorted(links)
+      if runtime:
+        links.append(self.session.runtime_lib(runtime, lto=Compiler.lto))
+
       target = self.target or self.mname
       clang = os.getenv('CLANG', 'clang')
-      flags = ['-O2']
+      flags = ['-O2'] + (['-flto'] if Compiler.lto else [])
       libs = ['-l' + lib for lib in self.libs]
-      cmd = [clang, '-o', target, self.ll] + flags + libs + list(self.links)
-      subprocess.check_call(cmd)
+      cmd = [clang, '-o', target, main] + flags + links + libs
+      with self.span('link', files=len(links) + 1, libs=len(libs)):
+        subprocess.check_call(cmd)
+
+  # optimize the IR of every Rain module in the program and emit it as an
+  # object file in this process, so clang only compiles the C links. returns
+  # the main object and the links to use instead
+  def emit_objects(self):
+    comps = {comp.ll: comp for comp in self.session.compilers.values() if comp.ll}
+
+    objs = {}
+    for ll in [self.ll] + sorted(self.links):
+      if ll not in comps:
+        continue
 
-  def run(self):
+      with self.session.span('optimize', comps[ll].qname) as info:
+        objs[ll], stats = Compiler.backend.compile(ll)
+        if info is not None:
+          info['cached'] = stats is None
+          if stats is not None:
+            info['before'], info['after'] = stats[1:]
+
+      if stats is None:
+        self.vprint('{:>10} {} (cached)', 'optimized', X(comps[ll].qname, 'green'))
+      else:
+        secs, before, after = stats
+        self.vprint('{:>10} {} in {:.3f}s, {} to {} instructions', 'optimized',
+                    X(comps[ll].qname, 'green'), secs, before, after)
+
+    return objs[self.ll], [objs.get(link, link) for link in self.links]
+
+  def run(self, args=[]):
     with self.okay('running'):
       target = self.target or self.mname
-      subprocess.check_call([os.path.abspath(target)])
+      subprocess.check_call([os.path.abspath(target)] + list(args))
+
+  # run the program in this process instead of building an executable.
+  # returns its exit code
+  def jit(self, args=[]):
+    from . import engine as E
+
+    with self.okay('jitting'), self.span('jit'):
+      self.compile_links()
+      eng = E.Engine(ll_file=self.ll, cache=Compiler.cache)
+      eng.link_file(*self.links)
+      eng.add_lib(*self.session.find_libs(self.libs))
+      eng.finalize()
+
+    with self.okay('running'):
+      return eng.main([self.target or self.mname] + list(args))
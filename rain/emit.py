@@ -269,14 +269,14 @@ def emit(self, module):
   # add the module's directory to the lookup path
   if getattr(module, 'file', None):
     base, name = os.path.split(module.file)
-    file = M.find_rain(self.name, paths=[base])
+    file = module.index.find_rain(self.name, paths=[base])
   else:
-    file = M.find_rain(self.name)
+    file = module.index.find_rain(self.name)
 
   if not file:
     Q.abort("Can't find module {!r}", self.name)
 
-  comp = C.get_compiler(file)
+  comp = C.get_compiler(file, session=module.session)
   comp.goodies()
 
   module.import_from(comp.mod)
@@ -296,7 +296,7 @@ def emit(self, module):
     Q.abort("Can't link file {!r} at non-global scope", self.name)
 
   base, name = os.path.split(module.file)
-  file = M.find_file(self.name, paths=[base])
+  file = module.index.find_file(self.name, paths=[base])
   return file
 
 
@@ -309,10 +309,10 @@ def emit(self, module):
 def expand(self, module):
   typ = T.vfunc(T.arg, *[T.arg for x in self.params])
 
-  func_node(self.params, self.body).emit(module, name='macro.func.real')
-  real_func = module.find_func(typ, 'macro.func.real')
+  func_node(self.params, self.body).emit(module, name=module.mangle('macro.func.real'))
+  real_func = module.find_func(typ, module.mangle('macro.func.real'))
 
-  main_func = module.add_func(typ, name='macro.func.main')
+  main_func = module.add_func(typ, name=module.mangle('macro.func.main'))
   main_func.attributes.personality = module.extern('rain_personality_v0')
   main_func.args[0].add_attribute('sret')
   with module.add_func_body(main_func):
@@ -1,19 +1,40 @@
 from . import ast as A
+from . import cache as H
 from . import types as T
 from . import error as Q
 import ctypes as ct
 import llvmlite.binding as llvm
+import sys
+
+libc = ct.CDLL(None)
+
+
+# LLVM only needs to be set up once per process
+initialized = False
+
+
+def initialize():
+  global initialized
+  if initialized:
+    return
+
+  llvm.initialize()
+  llvm.initialize_native_target()
+  llvm.initialize_native_asmprinter()  # yes, even this one
+  initialized = True
 
 
 class Engine:
-  def __init__(self, ll_file=None, llvm_ir=None):
-    llvm.initialize()
-    llvm.initialize_native_target()
-    llvm.initialize_native_asmprinter()  # yes, even this one
+  hits = 0    # modules loaded from the object cache
+  misses = 0  # modules compiled and saved to it
+
+  def __init__(self, ll_file=None, llvm_ir=None, cache=False):
+    initialize()
 
     # Create a target machine representing the host
     target = llvm.Target.from_default_triple()
     target_machine = target.create_target_machine()
+    self.host = H.digest(target_machine.triple, *map(str, llvm.llvm_version_info))
 
     # And an execution engine with a backing module
     if ll_file:
@@ -24,6 +45,14 @@ class Engine:
       self.main_mod = self.compile_ir('')
 
     self.engine = llvm.create_mcjit_compiler(self.main_mod, target_machine)
+    if cache:
+      self.engine.set_object_cache(self.save_object, self.load_object)
+
+    # resolved once per engine and reused
+    self.funcs = {}  # (name, *types) -> ctypes function
+    self.globals = {}  # (name, type) -> pointer
+    self.metas = {}  # AST tag -> pointer to its metatable
+    self.keys = {}  # table key -> box
 
   def add_lib(self, *libs):
     for lib in libs:
@@ -50,26 +79,69 @@ class Engine:
     self.main_mod = mod
     self.engine.add_module(mod)
 
+  # add another module to the engine. it can use anything already added
+  def add_ir(self, llvm_ir):
+    mod = self.compile_ir(llvm_ir)
+    self.engine.add_module(mod)
+    return mod
+
+  def add_file(self, ll_file):
+    with open(ll_file) as tmp:
+      return self.add_ir(tmp.read())
+
+  # object cache callbacks. MCJIT asks for a module's machine code before
+  # generating it, and hands over whatever it had to generate
+  def load_object(self, mod):
+    obj = H.load_object(str(mod), self.host)
+    if obj is not None:
+      Engine.hits += 1
+    return obj
+
+  def save_object(self, mod, obj):
+    Engine.misses += 1
+    H.save_object(str(mod), self.host, obj)
+
   def finalize(self):
     self.engine.finalize_object()
 
   def get_func(self, name, *types):
-    func_typ = ct.CFUNCTYPE(*types)
-    func_ptr = self.engine.get_function_address(name)
-    return func_typ(func_ptr)
+    key = (name,) + types
+    if key not in self.funcs:
+      func_typ = ct.CFUNCTYPE(*types)
+      func_ptr = self.engine.get_function_address(name)
+      if not func_ptr:  # not compiled yet
+        return func_typ(func_ptr)
+
+      self.funcs[key] = func_typ(func_ptr)
+
+    return self.funcs[key]
 
   def get_global(self, name, typ):
-    addr = self.engine.get_global_value_address(name)
-    ptr = ct.cast(ct.c_void_p(addr), typ)
-    return ptr
+    key = (name, typ)
+    if key not in self.globals:
+      addr = self.engine.get_global_value_address(name)
+      ptr = ct.cast(ct.c_void_p(addr), typ)
+      if not addr:
+        return ptr
+
+      self.globals[key] = ptr
+
+    return self.globals[key]
 
-  def main(self):
+  # run the program's main with the given arguments and return its exit code
+  def main(self, argv=None):
     main = self.get_func('main', ct.c_int, ct.c_int, ct.POINTER(ct.c_char_p))
 
-    argc = ct.c_int(1)
-    argv_0 = ct.c_char_p("test".encode("utf-8"))
+    args = [arg.encode('utf-8') for arg in (argv or sys.argv[:1])]
+    argc = ct.c_int(len(args))
+    argv = (ct.c_char_p * (len(args) + 1))(*args, None)
 
-    return main(argc, ct.byref(argv_0))
+    # keep the program's output in order with ours
+    sys.stdout.flush()
+    try:
+      return main(argc, argv)
+    finally:
+      libc.fflush(None)
 
 
   # rain_get
@@ -113,50 +185,85 @@ class Engine:
     set_meta(ct.byref(table_box), meta_ptr)
 
 
-  # converting between Rain and Python AST
+  # bulk table access
 
-  def to_rain(self, val):
-    if isinstance(val, list):
-      table_box = T.cbox.to_rain(None)
-      self.rain_set_table(table_box)
+  def rain_set_table_from(self, table_box, meta_ptr, items):
+    set_from = self.get_func('rain_set_table_from', None, T.carg, T.carg, T.carg, T.carg, ct.c_int)
+    keys = (T.cbox * len(items))(*(self.key(key) for key, val in items))
+    vals = (T.cbox * len(items))(*(val for key, val in items))
+    set_from(ct.byref(table_box), meta_ptr, keys, vals, len(items))
 
-      ast_ptr = self.get_global('core.ast.exports', T.carg)
-      meta_ptr = self.rain_get_ptr_py(ast_ptr, 'list')
-      self.rain_set_env(table_box, meta_ptr)
+  # a table's own items, by key. only int and string keys are returned
+  def rain_table_items(self, table_box, size=16):
+    table_items = self.get_func('rain_table_items', ct.c_int, T.carg, T.carg, T.carg, ct.c_int)
 
-      for i, n in enumerate(val):
-        self.rain_put_py(table_box, i, self.to_rain(n))
+    while True:
+      keys = (T.cbox * size)()
+      vals = (T.cbox * size)()
+      count = table_items(ct.byref(table_box), keys, vals, size)
+      if count <= size:
+        break
 
-      return table_box
+      size = count
 
-    elif isinstance(val, A.node):
-      table_box = T.cbox.to_rain(None)
-      self.rain_set_table(table_box)
+    ret = {}
+    for key, val in zip(keys[:count], vals[:count]):
+      if key.type in (T.typi.int, T.typi.str):
+        ret[key.to_py()] = val
 
+    return ret
+
+  # boxes for keys are made once and shared between tables
+  def key(self, key):
+    if key not in self.keys:
+      self.keys[key] = T.cbox.to_rain(key)
+
+    return self.keys[key]
+
+
+  # converting between Rain and Python AST
+
+  def meta(self, tag):
+    if tag not in self.metas:
       ast_ptr = self.get_global('core.ast.exports', T.carg)
-      meta_ptr = self.rain_get_ptr_py(ast_ptr, val.__tag__)
-      self.rain_set_env(table_box, meta_ptr)
+      self.metas[tag] = self.rain_get_ptr_py(ast_ptr, tag)
 
-      slots = [self.to_rain(getattr(val, key, None)) for key in val.__slots__]
+    return self.metas[tag]
 
-      tag_in = T.cbox.to_rain(val.__tag__)
-      self.rain_put_py(table_box, 'tag', tag_in)
+  def to_rain(self, val):
+    if isinstance(val, list):
+      items = [(i, self.to_rain(n)) for i, n in enumerate(val)]
+
+      table_box = T.cbox.to_rain(None)
+      self.rain_set_table_from(table_box, self.meta('list'), items)
+      return table_box
 
-      for key, box in zip(val.__slots__, slots):
-        self.rain_put_py(table_box, key, box)
+    elif isinstance(val, A.node):
+      items = [('tag', self.key(val.__tag__))]
+      items += [(key, self.to_rain(getattr(val, key, None))) for key in val.__slots__]
 
+      table_box = T.cbox.to_rain(None)
+      self.rain_set_table_from(table_box, self.meta(val.__tag__), items)
       return table_box
 
     return T.cbox.to_rain(val)
 
   def to_py(self, box):
     if box.type == T.typi.table:
-      tag_box = self.rain_get_py(box, 'tag')
-      tag = self.to_py(tag_box)
+      # read everything the table has at once, and only look up keys that
+      # it might inherit one at a time
+      items = self.rain_table_items(box)
+
+      def get(key):
+        if key in items:
+          return items[key]
+        return self.rain_get_py(box, key)
+
+      tag = self.to_py(get('tag'))
 
       if tag:
         node_type = A.tag_registry[tag]
-        slots = [self.to_py(self.rain_get_py(box, slot)) for slot in node_type.__slots__]
+        slots = [self.to_py(get(slot)) for slot in node_type.__slots__]
 
         return node_type(*slots)
 
@@ -164,7 +271,7 @@ class Engine:
         res = []
         i = 0
         while True:
-          next = self.to_py(self.rain_get_py(box, i))
+          next = self.to_py(get(i))
           if next is None:
             break
 
@@ -0,0 +1,148 @@
+from os.path import join
+import os
+import os.path
+import re
+
+name_chars = re.compile('[^a-z0-9]')
+
+
+# get default paths
+def get_paths():
+  return ['.'] + os.getenv('RAINPATH', '').split(':') + [os.environ['RAINBASE'], os.environ['RAINLIB']]
+
+
+# normalize a name - remove all special characters and cases
+def normalize_name(name):
+  return name_chars.sub('', name.lower())
+
+
+# looks modules up straight from the file system
+class Files:
+  isfile = staticmethod(os.path.isfile)
+  isdir = staticmethod(os.path.isdir)
+
+  # find a rain file from a module identifier
+  def find_rain(self, src, paths=[]):
+    paths = paths + get_paths()
+
+    for path in paths:
+      if self.isfile(join(path, src) + '.rn'):
+        return join(path, src) + '.rn'
+      elif self.isfile(join(path, src)) and src.endswith('.rn'):
+        return join(path, src)
+      elif self.isdir(join(path, src)) and self.isfile(join(path, src, '_pkg.rn')):
+        return join(path, src, '_pkg.rn')
+
+  # find any file from a string
+  def find_file(self, src, paths=[]):
+    paths = paths + get_paths()
+
+    for path in paths:
+      if self.isfile(join(path, src)):
+        return join(path, src)
+
+  # find a module name
+  def find_name(self, src):
+    path = os.path.abspath(src)
+    path, name = os.path.split(path)
+    fname, ext = os.path.splitext(name)
+
+    if fname == '_pkg':
+      _, fname = os.path.split(path)
+
+    mname = normalize_name(fname)
+
+    proot = list(self.package(path))
+    if not src.endswith('_pkg.rn'):
+      proot.append(mname)
+
+    qname = '.'.join(proot)
+
+    return (qname, mname)
+
+  # the names of the packages a directory is nested in
+  def package(self, path):
+    proot = []
+    while path and self.isfile(join(path, '_pkg.rn')):
+      path, name = os.path.split(path)
+      proot.insert(0, normalize_name(name))
+
+    return proot
+
+
+class Index(Files):
+  '''Looks modules up from cached directory listings.
+
+  Each directory is listed once and kept until its mtime changes, so a lookup
+  costs one stat per search path instead of several. Package roots are
+  memoized, and forgotten whenever a listing changes.'''
+
+  def __init__(self, listings=None):
+    self.listings = {} if listings is None else listings
+    self.packages = {}
+
+  # an index for another build. it shares the listings, which are checked
+  # against their directories, but not the package roots, which aren't
+  def fork(self):
+    return Index(self.listings)
+
+  # map the names in a directory to 'file' or 'dir', or None if it isn't one
+  def listing(self, path):
+    path = os.path.abspath(path)
+
+    try:
+      mtime = os.stat(path).st_mtime_ns
+    except OSError:
+      return None
+
+    if path in self.listings and self.listings[path][0] == mtime:
+      return self.listings[path][1]
+
+    try:
+      names = {}
+      for entry in os.scandir(path):
+        if entry.is_dir():
+          names[entry.name] = 'dir'
+        elif entry.is_file():
+          names[entry.name] = 'file'
+    except OSError:
+      return None
+
+    self.listings[path] = (mtime, names)
+    self.packages.clear()
+    return names
+
+  def kind(self, path):
+    head, tail = os.path.split(path)
+    if tail in ('', '.', '..'):
+      return 'dir' if self.listing(path) is not None else None
+
+    names = self.listing(head or '.')
+    return names.get(tail) if names else None
+
+  def isfile(self, path):
+    return self.kind(path) == 'file'
+
+  def isdir(self, path):
+    return self.kind(path) == 'dir'
+
+  def package(self, path):
+    if path not in self.packages:
+      self.packages[path] = super().package(path)
+
+    return self.packages[path]
+
+
+files = Files()
+
+
+def find_rain(src, paths=[]):
+  return files.find_rain(src, paths)
+
+
+def find_file(src, paths=[]):
+  return files.find_file(src, paths)
+
+
+def find_name(src):
+  return files.find_name(src)
@@ -1,4 +1,4 @@
-from . import module as M
+from . import index as N
 from .token import bool_token
 from .token import coord
 from .token import dedent_token
@@ -11,11 +11,12 @@ from .token import name_token
 from .token import newline_token
 from .token import null_token
 from .token import operator_token
+from .token import source
 from .token import string_token
 from .token import symbol_token
 from .token import table_token
+from .token import token_array
 from collections import OrderedDict
-from termcolor import colored as X
 import re
 
 OPERATORS = (
@@ -35,110 +36,138 @@ KEYWORDS = (
 )
 
 
-def factory(data, *, pos=coord()):
-  if data.lower() in KEYWORDS:
-    return keyword_token(data.lower(), pos=pos)
-  elif data.lower() in KW_OPERATORS:
-    return operator_token(data.lower(), pos=pos)
-  else:
-    return name_token(M.normalize_name(data), pos=pos)
+keyword_set = frozenset(KEYWORDS)
+kw_operator_set = frozenset(KW_OPERATORS)
 
 
-raw = OrderedDict()
-raw[r'#.*'] = None
-raw[r'""|"(.*?[^\\])"'] = string_token
-raw[r'(?:0|[1-9][0-9]*)\.[0-9]+'] = float_token
-raw[r'0|[1-9][0-9]*'] = int_token
-raw[r'true|false'] = bool_token
-raw[r'null'] = null_token
-raw[r'table'] = table_token
-raw[r'[a-zA-Z_][a-zA-Z0-9_]*'] = factory
-raw['|'.join(re.escape(x) for x in OPERATORS)] = operator_token
-raw[r'.'] = symbol_token
+# sort out keywords, keyword operators, and names
+def classify(data):
+  lower = data.lower()
+  if lower in keyword_set:
+    return keyword_token, lower
+  elif lower in kw_operator_set:
+    return operator_token, lower
+  else:
+    return name_token, N.normalize_name(data)
 
-rules = OrderedDict()
-for k, v in raw.items():
-  rules[re.compile(k)] = v
 
-indent = re.compile('^[ ]*')
+def factory(data, *, pos=coord()):
+  kind, value = classify(data)
+  return kind(value, pos=pos)
 
-ignore_whitespace = []
 
+# each rule is a named group in one master pattern, tried in this order
+raw = OrderedDict()
+raw['space'] = (r'[^\S\n]+', None)
+raw['comment'] = (r'#.*', None)
+raw['string'] = (r'""|"(?:.*?[^\\])"', string_token)
+raw['float'] = (r'(?:0|[1-9][0-9]*)\.[0-9]+', float_token)
+raw['int'] = (r'0|[1-9][0-9]*', int_token)
+raw['bool'] = (r'true|false', bool_token)
+raw['null'] = (r'null', null_token)
+raw['table'] = (r'table', table_token)
+raw['name'] = (r'[a-zA-Z_][a-zA-Z0-9_]*', name_token)
+raw['operator'] = ('|'.join(re.escape(x) for x in OPERATORS), operator_token)
+raw['symbol'] = (r'.', symbol_token)
+
+master = re.compile('|'.join('(?P<{}>{})'.format(name, rule) for name, (rule, kind) in raw.items()))
+rules = {name: kind for name, (rule, kind) in raw.items()}
+
+indent = re.compile('[ ]*')
+
+opening = frozenset('[{(')
+closing = frozenset(']})')
+
+
+# lex a whole source file into a packed token array
+def lex(text, file=None, session=None):
+  tokens = token_array(source(text, file=file))
+  add = tokens.append
+
+  # brackets that are still open - whitespace is ignored inside them
+  if session:
+    ignore_whitespace = session.ignore_whitespace
+    del ignore_whitespace[:]
+  else:
+    ignore_whitespace = []
 
-def stream(source):
   indents = [0]
-  line = 1
-  col = 1
+  line_start = 0
+  pos = 0
+  end = len(text)
 
-  def skip(amt):
-    nonlocal source, col
-    source = source[amt:]
-    col += amt
+  match = master.match
+  match_indent = indent.match
 
   last = None
-  while source:
-    if source[0] == '\n':
+  while pos < end:
+    if text[pos] == '\n':
       # skip repeated newlines
-      while source and source[0] == '\n':
-        skip(1)
-        col = 1
-        line += 1
+      while pos < end and text[pos] == '\n':
+        pos += 1
+        line_start = pos
 
       # get this line's indentation
-      depth = indent.match(source)
-      depth_amt = len(depth.group(0))
+      depth_amt = match_indent(text, pos).end() - pos
 
       # skip this line if it was just an indentation
-      if source and source[depth_amt] == '\n':
-        skip(1)
-        col = 1
-        line += 1
+      if pos + depth_amt < end and text[pos + depth_amt] == '\n':
+        pos += depth_amt
         continue
 
+      # trailing indentation at the end of the file is just whitespace
+      if pos + depth_amt == end:
+        depth_amt = 0
+        pos = end
+
       # handle indents
       if not ignore_whitespace:
         if depth_amt > indents[-1]:
-          last = indent_token(pos=coord(line, col, len=depth_amt))
-          yield last
+          last = indent_token
+          add(last, None, line_start, depth_amt)
           indents.append(depth_amt)
 
         # handle newlines at the same indentation
         else:
-          if not isinstance(last, (type(None), indent_token, newline_token)):
-            last = newline_token(pos=coord(line, col))
-            yield last
+          if last not in (None, indent_token, newline_token):
+            last = newline_token
+            add(last, None, line_start)
 
         # handle dedents
         while depth_amt < indents[-1]:
-          last = newline_token(pos=coord(line, col))
-          yield dedent_token(pos=coord(line, col))
-          yield last
+          last = newline_token
+          add(dedent_token, None, line_start)
+          add(last, None, line_start)
           del indents[-1]
 
-      skip(depth_amt)
-      if not source:
+      pos += depth_amt
+      if pos >= end:
         break
 
-    # skip internal whitespace
-    if source[0].isspace():
-      skip(1)
-      continue
-
     # tokenize
-    for rule, kind in rules.items():
-      match = rule.match(source)
-      if match:
-        value = match.group(0)
-        if kind:
-          last = kind(value, pos=coord(line, col, len=len(value)))
-
-          if last in (symbol_token('['), symbol_token('{'), symbol_token('(')):
-            ignore_whitespace.append(True)
-          elif last in (symbol_token(']'), symbol_token('}'), symbol_token(')')):
-            ignore_whitespace.pop()
-
-          yield last
-        skip(len(value))
-        break
+    found = match(text, pos)
+    kind = rules[found.lastgroup]
+    if kind:
+      data = found.group()
+      if kind is name_token:
+        kind, value = classify(data)
+      else:
+        value = kind.convert(data)
+
+      if kind is symbol_token:
+        if value in opening:
+          ignore_whitespace.append(True)
+        elif value in closing:
+          ignore_whitespace.pop()
+
+      last = kind
+      add(kind, value, pos, len(data))
+
+    pos = found.end()
+
+  add(end_token, None, pos)
+  return tokens
+
 
-  yield end_token(pos=coord(line, col))
+def stream(text, file=None, session=None):
+  return iter(lex(text, file=file, session=session))
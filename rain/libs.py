@@ -0,0 +1,194 @@
+from . import cache as H
+from collections import Counter
+from os.path import join
+import glob
+import os
+import os.path
+import re
+import struct
+import sys
+
+LD_CACHE = '/etc/ld.so.cache'
+LD_CONF = '/etc/ld.so.conf'
+
+OLD_MAGIC = b'ld.so-1.7.0'
+NEW_MAGIC = b'glibc-ld.so.cache1.1'
+
+
+# directories listed in an ld.so.conf, following its includes
+def conf_dirs(path=LD_CONF, seen=None):
+  seen = seen if seen is not None else set()
+  if path in seen:
+    return []
+  seen.add(path)
+
+  try:
+    with open(path) as tmp:
+      lines = tmp.read().splitlines()
+  except OSError:
+    return []
+
+  dirs = []
+  for line in lines:
+    line = line.split('#')[0].strip()
+    if line.startswith('include '):
+      pattern = line.split(None, 1)[1]
+      if not os.path.isabs(pattern):
+        pattern = join(os.path.dirname(path), pattern)
+      for conf in sorted(glob.glob(pattern)):
+        dirs += conf_dirs(conf, seen)
+    elif line:
+      dirs.append(line)
+
+  return dirs
+
+
+# the directories that libraries are searched for in, in order
+def search_dirs():
+  dirs = []
+  for var in ('LD_LIBRARY_PATH', 'LIBRARY_PATH'):
+    dirs += os.getenv(var, '').split(os.pathsep)
+
+  dirs += conf_dirs()
+  dirs += ['/lib64', '/usr/lib64', '/lib', '/usr/lib', '/usr/local/lib']
+
+  ret = []
+  for tmp in dirs:
+    if tmp and tmp not in ret:
+      ret.append(tmp)
+
+  return ret
+
+
+# read the libraries in ld.so.cache for this machine's architecture, as
+# {file name: path}. only the newer format is understood, which every glibc
+# since 2.32 writes; older caches carry it after the old one
+def parse_cache(data):
+  start = 0
+  if data.startswith(OLD_MAGIC):
+    nlibs, = struct.unpack_from('=I', data, 12)
+    start = (16 + nlibs * 12 + 7) & ~7
+
+  if not data.startswith(NEW_MAGIC, start):
+    return {}
+
+  def string(offset):
+    end = data.index(b'\0', start + offset)
+    return data[start + offset:end].decode('utf-8', 'replace')
+
+  try:
+    nlibs, = struct.unpack_from('=I', data, start + 20)
+    entries = []
+    for num in range(nlibs):
+      flags, key, value = struct.unpack_from('=iII', data, start + 48 + num * 24)
+      entries.append((flags, string(key), string(value)))
+  except (struct.error, ValueError):
+    return {}
+
+  # entries for other architectures are in there too. the native one is the
+  # one most libraries are for
+  if not entries:
+    return {}
+  native = Counter(flags for flags, key, value in entries).most_common(1)[0][0]
+
+  ret = {}
+  for flags, key, value in entries:
+    if flags == native and key not in ret:
+      ret[key] = value
+
+  return ret
+
+
+# the file names a library could have, as given to -l. ':name' is a file name
+def file_names(lib):
+  if lib.startswith(':'):
+    return [lib[1:]]
+  if sys.platform == 'darwin':
+    return ['lib{}.dylib'.format(lib)]
+  return ['lib{}.so'.format(lib)]
+
+
+# some .so files are linker scripts that name the real library, like libc.so
+# and libm.so. returns the file to load in place of one, or None
+def loadable(path):
+  try:
+    with open(path, 'rb') as tmp:
+      head = tmp.read(4096)
+  except OSError:
+    return None
+
+  if b'\0' in head:  # not text, so not a script
+    return path
+
+  for name in re.findall(r'[^\s()]+\.so[.\d]*', head.decode('utf-8', 'replace')):
+    if os.path.isfile(name):
+      return name
+
+  return None
+
+
+# sort key for versioned file names, so libfoo.so.10 comes after libfoo.so.9
+def version_key(name):
+  return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+class Resolver:
+  '''Finds shared libraries like the linker does, without running it.
+
+  Libraries are searched for in the linker's directories first, then in
+  ld.so.cache. Results are kept for the resolver's lifetime and in the cache
+  directory, keyed by the search directories and the state of ld.so.cache.'''
+
+  def __init__(self, cache=True):
+    self.dirs = search_dirs()
+    self.found = {}
+    self.ld_cache = None  # parsed once something isn't found on disk
+
+    try:
+      stat = os.stat(LD_CACHE)
+      state = '{}:{}'.format(stat.st_mtime_ns, stat.st_size)
+    except OSError:
+      state = ''
+
+    self.key = H.digest(*self.dirs, state) if cache else None
+    if self.key:
+      self.found.update(H.load_libs(self.key) or {})
+
+  # the path of a library, or None if it can't be found
+  def find(self, lib):
+    path = self.found.get(lib)
+    if path and os.path.exists(path):
+      return path
+
+    path = self.search(lib)
+    if path:
+      self.found[lib] = path
+      if self.key:
+        H.save_libs(self.key, self.found)
+
+    return path
+
+  def search(self, lib):
+    names = file_names(lib)
+    for name in names:
+      for base in self.dirs:
+        path = loadable(join(base, name))
+        if path:
+          return path
+
+    if self.ld_cache is None:
+      data = H.read(LD_CACHE)
+      self.ld_cache = parse_cache(data) if data else {}
+
+    for name in names:
+      if name in self.ld_cache:
+        return self.ld_cache[name]
+
+    # only a versioned library might be installed, like libgc.so.1 without
+    # the libgc.so that comes with its headers
+    if not lib.startswith(':'):
+      versions = [key for key in self.ld_cache if key.startswith(names[0] + '.')]
+      if versions:
+        return self.ld_cache[max(versions, key=version_key)]
+
+    return None
@@ -3,71 +3,18 @@ from . import error as Q
 from . import scope as S
 from . import token as K
 from . import types as T
+from .index import Files
+from .index import Index
+from .index import files
+from .index import find_file
+from .index import find_name
+from .index import find_rain
+from .index import get_paths
+from .index import name_chars
+from .index import normalize_name
 from contextlib import contextmanager
 from llvmlite import binding
 from llvmlite import ir
-from os.path import isdir, isfile
-from os.path import join
-import os.path
-import re
-
-name_chars = re.compile('[^a-z0-9]')
-
-
-# get default paths
-def get_paths():
-  return ['.'] + os.getenv('RAINPATH', '').split(':') + [os.environ['RAINBASE'], os.environ['RAINLIB']]
-
-
-# normalize a name - remove all special characters and cases
-def normalize_name(name):
-  return name_chars.sub('', name.lower())
-
-
-# find a rain file from a module identifier
-def find_rain(src, paths=[]):
-  paths = paths + get_paths()
-
-  for path in paths:
-    if isfile(join(path, src) + '.rn'):
-      return join(path, src) + '.rn'
-    elif isfile(join(path, src)) and src.endswith('.rn'):
-      return join(path, src)
-    elif isdir(join(path, src)) and isfile(join(path, src, '_pkg.rn')):
-      return join(path, src, '_pkg.rn')
-
-
-# find any file from a string
-def find_file(src, paths=[]):
-  paths = paths + get_paths()
-
-  for path in paths:
-    if os.path.isfile(join(path, src)):
-      return join(path, src)
-
-
-# find a module name
-def find_name(src):
-  path = os.path.abspath(src)
-  path, name = os.path.split(path)
-  fname, ext = os.path.splitext(name)
-
-  if fname == '_pkg':
-    _, fname = os.path.split(path)
-
-  mname = normalize_name(fname)
-
-  proot = []
-  while path and os.path.isfile(join(path, '_pkg.rn')):
-    path, name = os.path.split(path)
-    proot.insert(0, normalize_name(name))
-
-  if not src.endswith('_pkg.rn'):
-    proot.append(mname)
-
-  qname = '.'.join(proot)
-
-  return (qname, mname)
 
 
 # partially apply a context manager
@@ -128,14 +75,15 @@ class Module(S.Scope):
       key = key.value
     return normalize_name(key)
 
-  def __init__(self, file=None, name=None):
+  def __init__(self, file=None, name=None, session=None):
     S.Scope.__init__(self)
+    self.session = session
 
     if name:
       self.qname = self.mname = name
     else:
       self.file = file
-      self.qname, self.mname = find_name(self.file)
+      self.qname, self.mname = self.index.find_name(self.file)
 
     self.llvm = ir.Module(name=self.qname)
     self.llvm.triple = binding.get_default_triple()
@@ -183,6 +131,11 @@ class Module(S.Scope):
   def ir(self):
     return str(self.llvm)
 
+  # where to look up imports
+  @property
+  def index(self):
+    return self.session.index if self.session else files
+
   @property
   def is_global(self):
     return (not self.builder)
@@ -468,3 +421,213 @@ class Module(S.Scope):
 
   def extract(self, container, idx):
     return self.builder.extract_value(container, idx)
+
+
+# Summaries ###################################################################
+#
+# once a module is emitted, its importers only need its names, its globals and
+# the declarations in its LLVM module. its IR is already in its .ll file, so a
+# summary is plain data: a table of its declarations and of its names, with
+# their types and constants spelled out, which loads again through the public
+# ir API. anything that belongs to another module is saved as its file and
+# name and looked up again on load, so every summary shares its imports with
+# the others
+
+# the attributes that emitting hangs on values
+extras = ('arr_ptr', 'bound', 'initializer', 'key', 'lpt_ptr', 'mod')
+
+
+def save_type(typ):
+  if isinstance(typ, ir.IdentifiedStructType):
+    return ('named', typ.name)
+  if isinstance(typ, ir.LiteralStructType):
+    return ('struct', [save_type(elem) for elem in typ.elements])
+  if isinstance(typ, ir.ArrayType):
+    return ('array', save_type(typ.element), typ.count)
+  if isinstance(typ, ir.PointerType):
+    return ('ptr', save_type(typ.pointee))
+  if isinstance(typ, ir.FunctionType):
+    return ('func', save_type(typ.return_type), [save_type(arg) for arg in typ.args], typ.var_arg)
+  if isinstance(typ, ir.IntType):
+    return ('int', typ.width)
+  if isinstance(typ, ir.DoubleType):
+    return ('double',)
+  if isinstance(typ, ir.FloatType):
+    return ('float',)
+  if isinstance(typ, ir.VoidType):
+    return ('void',)
+
+  raise TypeError("Can't summarize type {!s}".format(typ))
+
+
+def load_type(data):
+  kind, *args = data
+  if kind == 'named':
+    return ir.global_context.get_identified_type(args[0])
+  if kind == 'struct':
+    return ir.LiteralStructType([load_type(elem) for elem in args[0]])
+  if kind == 'array':
+    return ir.ArrayType(load_type(args[0]), args[1])
+  if kind == 'ptr':
+    return ir.PointerType(load_type(args[0]))
+  if kind == 'func':
+    return ir.FunctionType(load_type(args[0]), [load_type(arg) for arg in args[1]], var_arg=args[2])
+  if kind == 'int':
+    return ir.IntType(args[0])
+  if kind == 'double':
+    return ir.DoubleType()
+  if kind == 'float':
+    return ir.FloatType()
+  if kind == 'void':
+    return ir.VoidType()
+
+  raise TypeError("Unknown type {!r}".format(data))
+
+
+# owners maps the id of every global that can be referred to by its file
+def save_value(val, owners):
+  if isinstance(val, Module):
+    return ('module', val.file)
+  if isinstance(val, (ir.GlobalVariable, ir.Function)):
+    return ('global', owners[id(val)], val.name)
+  if isinstance(val, A.node):
+    return ('node', A.flatten(val))
+  if not isinstance(val, ir.Constant):
+    return ('raw', val)
+
+  attrs = {name: save_value(getattr(val, name), owners) for name in extras if hasattr(val, name)}
+  if isinstance(val, ir.FormattedConstant):
+    return ('text', save_type(val.type), val.constant, attrs)
+
+  const = val.constant
+  if isinstance(const, (list, tuple)):
+    const = [save_value(item, owners) for item in const]
+  elif isinstance(const, bytearray):
+    const = bytes(const)
+
+  return ('const', save_type(val.type), const, attrs)
+
+
+# mods maps files to every module that can be referred to
+def load_value(data, mods):
+  kind, *args = data
+  if kind == 'module':
+    return mods[args[0]]
+  if kind == 'global':
+    return mods[args[0]].llvm.get_global(args[1])
+  if kind == 'node':
+    return A.inflate(args[0])
+  if kind == 'raw':
+    return args[0]
+
+  typ, const, attrs = args
+  if kind == 'text':
+    val = ir.FormattedConstant(load_type(typ), const)
+  elif isinstance(const, list):
+    val = ir.Constant(load_type(typ), [load_value(item, mods) for item in const])
+  elif isinstance(const, bytes):
+    val = ir.Constant(load_type(typ), bytearray(const))
+  else:
+    val = ir.Constant(load_type(typ), const)
+
+  for name, attr in attrs.items():
+    setattr(val, name, load_value(attr, mods))
+
+  return val
+
+
+# a module's plain attributes, its declarations and its names. owners maps the
+# id of every global that can be referred to by its file, and origins maps the
+# names of the globals in known modules to their files. the declarations that
+# import_from copied out of those are saved as the originals, which have the
+# same type and initializer
+def save(mod, owners, origins):
+  decls = []
+  for val in mod.llvm.global_values:
+    if isinstance(val, ir.Function):
+      decls.append(('func', val.name, save_type(val.ftype)))
+    elif val.linkage == 'available_externally' and val.name in origins:
+      decls.append(('copy', val.name, origins[val.name]))
+    else:
+      init = None if val.initializer is None else save_value(val.initializer, owners)
+      attrs = {name: save_value(getattr(val, name), owners) for name in extras if hasattr(val, name) and name != 'initializer'}
+      decls.append(('var', val.name, save_type(val.value_type), val.linkage, init, attrs))
+
+  return {
+    'state': {key: val for key, val in vars(mod).items() if val is None or isinstance(val, (int, str))},
+    'triple': mod.llvm.triple,
+    'decls': decls,
+    'names': [(name, save_value(val, owners)) for name, val in mod.globals.items()],
+    'exports': save_value(mod.exports, owners),
+    'name_ptr': save_value(mod.name_ptr, owners),
+  }
+
+
+# save the modules in mods, on top of the modules in known
+def dump(mods, known):
+  owners = {}
+  origins = {}
+  for mod in list(known) + list(mods):
+    for val in mod.llvm.global_values:
+      owners[id(val)] = mod.file
+      if mod in known and isinstance(val, ir.GlobalVariable) and val.linkage != 'available_externally':
+        origins[val.name] = mod.file
+
+  return [save(mod, owners, origins) for mod in mods]
+
+
+# load modules saved with dump. known maps files to the modules they were
+# saved on top of. loaded modules have no session
+def load(data, known):
+  mods = dict(known)
+  ret = []
+  for summary in data:
+    mod = Module.__new__(Module)
+    S.Scope.__init__(mod)
+    vars(mod).update(summary['state'])
+    mod.session = None
+    mod.llvm = ir.Module(name=mod.qname)
+    mod.llvm.triple = summary['triple']
+    mods[mod.file] = mod
+    ret.append(mod)
+
+  # every declaration has to exist before anything can refer to it
+  for mod, summary in zip(ret, data):
+    for kind, name, *args in summary['decls']:
+      if kind == 'func':
+        ir.Function(mod.llvm, load_type(args[0]), name=name)
+      elif kind == 'copy':
+        origin = mods[args[0]].llvm.get_global(name)
+        glob = ir.GlobalVariable(mod.llvm, origin.value_type, name=name)
+        glob.linkage = 'available_externally'
+        glob.initializer = origin.initializer
+      else:
+        glob = ir.GlobalVariable(mod.llvm, load_type(args[0]), name=name)
+        glob.linkage = args[1]
+
+  for mod, summary in zip(ret, data):
+    for kind, name, *args in summary['decls']:
+      if kind == 'var':
+        glob = mod.llvm.get_global(name)
+        if args[2] is not None:
+          glob.initializer = load_value(args[2], mods)
+        for attr, val in args[3].items():
+          setattr(glob, attr, load_value(val, mods))
+
+    for name, val in summary['names']:
+      mod.globals[name] = load_value(val, mods)
+
+    mod.exports = load_value(summary['exports'], mods)
+    mod.name_ptr = load_value(summary['name_ptr'], mods)
+
+  return ret
+
+
+# replace mods with their summaries. known are the modules they import
+def summarize(mods, known):
+  session = mods[0].session if mods else None
+  ret = load(dump(mods, known), {mod.file: mod for mod in known})
+  for mod in ret:
+    mod.session = session
+
+  return ret
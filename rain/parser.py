@@ -1,20 +1,30 @@
 from . import ast as A
+from . import cache as H
 from . import compiler as C
-from . import engine as E
 from . import error as Q
-from . import module as M
+from . import index as N
+from . import lexer as L
 from . import token as K
-from . import types as T
+from bisect import bisect_left
+from bisect import bisect_right
 from ctypes import byref
+from itertools import chain
+from itertools import count
 from os import environ as ENV
 from os.path import join
 import os.path
+import threading
 
 end = K.end_token()
 indent = K.indent_token()
 dedent = K.dedent_token()
 newline = K.newline_token()
 
+# the keywords, symbols and operators the grammar uses, made once
+kw = {name: K.keyword_token(name) for name in L.KEYWORDS}
+sym = {name: K.symbol_token(name) for name in '()[]{}=,.:?@'}
+op = {name: K.operator_token(name) for name in L.OPERATORS}
+
 binary_ops = {
   '::': 100,
 
@@ -36,20 +46,100 @@ binary_ops = {
   '|': 30,
 }
 
+# every macro in the process runs in one engine per build of lib/ast.rn. the
+# library and everything it links with are compiled once, and each macro is
+# added on top as its own small module
+runtimes = {}  # digest of the linked IR -> engine
+runtime_files = {}  # ast.ll -> digest
+runtime_lock = threading.Lock()
+macro_count = count()
+
+
+def runtime(session=None):
+  from . import engine as E  # llvmlite is only loaded once a macro is used
+
+  # compile builtins
+  builtin = C.get_compiler(join(ENV['RAINLIB'], '_pkg.rn'), session=session)
+  builtin.goodies()
+
+  # compile lib.ast
+  ast = C.get_compiler(join(ENV['RAINLIB'], 'ast.rn'), session=session)
+  ast.goodies()
+
+  with runtime_lock:
+    if ast.ll not in runtime_files:
+      ast.compile_links()
+
+      # the same library built by another session can share the engine
+      parts = []
+      for file in [ast.ll] + sorted(ast.links):
+        with open(file) as tmp:
+          parts.append(tmp.read())
+      key = H.digest(*parts, *sorted(ast.libs))
+
+      if key not in runtimes:
+        eng = E.Engine(ll_file=ast.ll, cache=C.Compiler.cache)
+        eng.link_file(*ast.links)
+        eng.add_lib(*ast.session.find_libs(ast.libs))
+        eng.finalize()
+        runtimes[key] = eng
+
+      runtime_files[ast.ll] = key
+
+    key = runtime_files[ast.ll]
+    return key, runtimes[key]
+
+
+# expansions of macros, flattened and keyed by the macro and its arguments.
+# recent ones are kept in memory, and all of them on disk when caching is on
+expansions = H.LRU(1024)
+
+
+# whether a flattened tree uses a name anywhere
+def mentions(flat, name):
+  if type(flat) is tuple:
+    if flat == ('name', name):
+      return True
+    return any(mentions(item, name) for item in flat[1:])
+
+  if type(flat) is list:
+    return any(mentions(item, name) for item in flat)
+
+  return False
+
+
 class macro:
-  def __init__(self, name, node, parses):
+  def __init__(self, name, node, parses, session=None):
     self.name = name
     self.parses = parses
-    mod = M.Module(name=name)
 
-    # compile builtins
-    builtin = C.get_compiler(join(ENV['RAINLIB'], '_pkg.rn'))
-    builtin.goodies()
+    # a macro that makes symbols gives a different result every time. others
+    # are keyed by their code and the runtime they were compiled against
+    key, self.eng = runtime(session)
+    flat = A.flatten(node)
+    self.cacheable = not mentions(flat, 'gensym')
+    self.key = H.digest(H.version(), name, repr(flat), key)
+
+    # the macro itself is compiled the first time an expansion isn't cached
+    self.node = node
+    self.session = session
+    self.main = None
+
+  def compile(self):
+    with (self.session or C.default_session).span('jit_macro', self.name):
+      self.compile_macro()
+
+  def compile_macro(self):
+    from . import emit
+    from . import engine as E
+    from . import module as M
 
-    # compile lib.ast and use its links/libs
-    ast = C.get_compiler(join(ENV['RAINLIB'], 'ast.rn'))
-    ast.goodies()
-    so = ast.compile_links()
+    node, session = self.node, self.session
+
+    # macros share an engine, so their symbols need names of their own
+    mod = M.Module(name='macro{}.{}'.format(next(macro_count), self.name), session=session)
+
+    builtin = C.get_compiler(join(ENV['RAINLIB'], '_pkg.rn'), session=session)
 
     # import builtins
     for name, val in builtin.mod.globals.items():
@@ -72,23 +162,48 @@ class macro:
     ])), let=True).emit(mod)
 
     node.expand(mod)
+    self.main = mod.mangle('macro.func.main')
 
-    # create the execution engine and link everthing
-    self.eng = E.Engine(llvm_ir=mod.ir)
-    self.eng.link_file(ast.ll, *ast.links)
-    self.eng.add_lib(so)
-    self.eng.finalize()
+    # add the macro to the shared engine
+    with runtime_lock:
+      self.eng.add_ir(mod.ir)
+      self.eng.finalize()
+
+    C.Compiler.vprint('{:>10} {} (object cache: {} hits, {} misses)', 'jitted',
+                      self.name, E.Engine.hits, E.Engine.misses)
 
   def parse(self, ctx):
     return [fn(ctx) for fn in self.parses]
 
   def expand(self, ctx):
     args = self.parse(ctx)
+    if not self.cacheable:
+      return self.call(args)
+
+    key = H.digest(self.key, repr(A.flatten(args)))
+    flat = expansions.get(key)
+    if flat is None and C.Compiler.cache:
+      flat = H.load_expansion(ctx.file, key)
+
+    if flat is None:
+      flat = A.flatten(self.call(args))
+      if C.Compiler.cache:
+        H.save_expansion(ctx.file, key, flat)
+
+    # every use gets its own copy of the nodes
+    expansions.put(key, flat)
+    return A.inflate(flat)
+
+  def call(self, args):
+    from . import types as T
+
+    if self.main is None:
+      self.compile()
 
     arg_boxes = [self.eng.to_rain(arg) for arg in args]
 
     ret_box = T.cbox(0, 0, 0)
-    func = self.eng.get_func('macro.func.main', T.carg, *[T.carg] * len(self.parses))
+    func = self.eng.get_func(self.main, T.carg, *[T.carg] * len(self.parses))
     func(byref(ret_box), *[byref(arg) for arg in arg_boxes])
     new_node = self.eng.to_py(ret_box)
 
@@ -96,28 +211,45 @@ class macro:
 
 
 class context:
-  def __init__(self, stream, *, file=None):
+  def __init__(self, stream, *, file=None, session=None):
     self.file = file
-    self.qname, self.mname = M.find_name(file)
+    self.session = session
+    self.files = session.index if session else N.files
+    self.qname, self.mname = self.files.find_name(file)
 
     self.stream = stream
-    self.peek = next(stream)
+    self.index = -1     # index of self.token in the stream
+    self.starts = []    # token index of each top-level statement
+    self.imports = []   # compilers of imported modules
+    self.peek = next(stream, K.end_token())
     self.next()
 
     self.macros = {}
 
   def next(self):
+    self.index += 1
     self.token = self.peek
+    self.key = (type(self.token), getattr(self.token, 'value', None))
     try:
       self.peek = next(self.stream)
     except StopIteration:
       self.peek = K.end_token()
 
+  # time a phase of parsing this module, if the build is being traced
+  def span(self, name, **args):
+    return (self.session or C.default_session).span(name, self.qname, **args)
+
   def register_macro(self, name, node, parses):
-    self.macros[name] = macro(self.qname + ':' + name, node, parses)
+    with self.span('macro', macro=name):
+      self.macros[name] = macro(self.qname + ':' + name, node, parses, session=self.session)
 
   def expand_macro(self, name):
-    return self.macros[name].expand(self)
+    with self.span('expand', macro=name) as info:
+      ret = self.macros[name].expand(self)
+      if info is not None:
+        info['nodes'] = A.count(ret)
+
+      return ret
 
   def expect(self, *tokens):
     return self.token in tokens
@@ -146,6 +278,7 @@ class context:
 def program(ctx):
   stmts = []
   while not ctx.expect(end):
+    ctx.starts.append(ctx.index)
     stmts.append(stmt(ctx))
     ctx.require(newline)
 
@@ -154,6 +287,93 @@ def program(ctx):
   return A.program_node(stmts)
 
 
+# re-lex and re-parse only the top-level statements touched by an edit that
+# replaces src[start:stop] with text. ctx, tokens and ast are the context,
+# token array and program that src was parsed into. they're updated in place
+# and the new source is returned
+def reparse(ctx, src, tokens, ast, start, stop, text):
+  new_src = src[:start] + text + src[stop:]
+  delta = len(new_src) - len(src)
+
+  starts = ctx.starts
+  total = len(starts)
+
+  # statements are split at the start of their first line. the tokens that
+  # close a statement sit at the start of the next one, so an edit there
+  # belongs to both
+  lines = tokens.src
+  begins = [0] + [lines.line_start(tokens.offsets[idx]) for idx in starts[1:]]
+
+  first = max(bisect_left(begins, start) - 1, 0)
+  last = min(bisect_right(begins, stop, first + 1), total)
+
+  while True:
+    lo = begins[first] if first < total else 0
+    hi = begins[last] if last < total else len(src)
+    region = new_src[lo:hi + delta]
+
+    # an indented first line belongs to the statement before it
+    if first > 0 and region.startswith(' '):
+      first -= 1
+      continue
+
+    part = L.lex(region, file=ctx.file, session=ctx.session)
+
+    # macros are expanded while parsing, so everything after a changed macro
+    # or import has to be parsed again
+    if last < total:
+      scoped = any(isinstance(node, (A.macro_node, A.import_node)) for node in ast.stmts[first:last])
+      if scoped or 'macro' in part.values or 'import' in part.values:
+        last = total
+        continue
+
+    break
+
+  # splice the new tokens in, dropping the region's EOF unless it's the end
+  lo_idx = starts[first] if first > 0 else 0
+  hi_idx = starts[last] if last < total else len(tokens)
+  size = len(part) if last == total else len(part) - 1
+
+  tokens.splice(lo_idx, hi_idx, part, size, lo, delta)
+  lines.splice(lo, hi, part.src, delta)
+
+  # parse the new statements and splice them in too. like in a full parse,
+  # they only see the macros from the statements before them
+  sub = context(chain(tokens.slice(lo_idx, lo_idx + size), [K.end_token()]), file=ctx.file, session=ctx.session)
+  base, fname = os.path.split(ctx.file)
+  for node in ast.stmts[:first]:
+    if isinstance(node, A.import_node):
+      import_macros(sub, ctx.files.find_rain(node.name, paths=[base]), node.rename)
+    elif isinstance(node, A.macro_node):
+      sub.macros[node.name] = ctx.macros[node.name]
+
+  node = program(sub)
+
+  # a region that runs to the end has seen every macro and import there is
+  if last == total:
+    ctx.macros = sub.macros
+    ctx.imports = sub.imports
+
+  shift = size - (hi_idx - lo_idx)
+  ast.stmts[first:last] = node.stmts
+  starts[first:] = [lo_idx + idx for idx in sub.starts] + [idx + shift for idx in starts[last:]]
+
+  return new_src
+
+
+# set up a context for a program that was loaded instead of parsed, so that
+# its imports and macros are available just as if it had been parsed
+def restore(ctx, ast):
+  base, fname = os.path.split(ctx.file)
+
+  for node in ast.stmts:
+    if isinstance(node, A.import_node):
+      import_macros(ctx, ctx.files.find_rain(node.name, paths=[base]), node.rename)
+
+    elif isinstance(node, A.macro_node):
+      ctx.register_macro(node.name, node, [macro_types[x] for x in node.types])
+
+
 # block :: INDENT (stmt NEWLINE)+ DEDENT
 def block(ctx):
   stmts = []
@@ -190,173 +410,227 @@ def block(ctx):
 #       | 'save' compound
 #       | assn_prefix ('=' compound | fnargs | ':' NAME  fnargs)
 def stmt(ctx):
-  if ctx.consume(K.keyword_token('let')):
-    lhs = A.name_node(ctx.require(K.name_token).value)
-    ctx.require(K.symbol_token('='))
+  rule = stmt_rules.get(ctx.key)
+  if rule:
+    return rule(ctx)
+
+  return assn_stmt(ctx)
+
+
+# statement rules, keyed on the (type, value) of their first token
+stmt_rules = {}
+
+
+def stmt_rule(token):
+  def wrap(func):
+    stmt_rules[type(token), token.value] = func
+    return func
+
+  return wrap
+
+
+@stmt_rule(kw['let'])
+def let_stmt(ctx):
+  ctx.next()
+  lhs = A.name_node(ctx.require(K.name_token).value)
+  ctx.require(sym['='])
+  rhs = compound(ctx)
+  return A.assn_node(lhs, rhs, let=True)
+
+
+@stmt_rule(kw['export'])
+def export_stmt(ctx):
+  ctx.next()
+  name = ctx.require(K.name_token).value
+
+  if ctx.consume(sym['=']):
     rhs = compound(ctx)
-    return A.assn_node(lhs, rhs, let=True)
+    return A.assn_node(A.name_node(name), rhs, export=True)
 
-  if ctx.consume(K.keyword_token('export')):
-    name = ctx.require(K.name_token).value
+  if ctx.consume(kw['as']):
+    ctx.require(kw['foreign'])
+    rename = ctx.require(K.string_token, K.name_token).value
+    return A.export_foreign_node(name, rename)
 
-    if ctx.consume(K.symbol_token('=')):
-      rhs = compound(ctx)
-      return A.assn_node(A.name_node(name), rhs, export=True)
-
-    if ctx.consume(K.keyword_token('as')):
-      ctx.require(K.keyword_token('foreign'))
-      rename = ctx.require(K.string_token, K.name_token).value
-      return A.export_foreign_node(name, rename)
-
-  if ctx.consume(K.keyword_token('import')):
-    name = ctx.require(K.name_token, K.string_token)
-    base, fname = os.path.split(ctx.file)
-    file = M.find_rain(name.value, paths=[base])
-
-    if not file:
-      Q.abort("Can't find module {!r}", name.value, pos=name.pos(file=ctx.file))
-
-    name = name.value
-    rename = None
-    if ctx.consume(K.keyword_token('as')):
-      rename = ctx.require(K.name_token).value
-
-    comp = C.get_compiler(file)
-    comp.read()
-    comp.lex()
-    comp.parse()
-
-    prefix = rename or comp.mname
-    for key, val in comp.parser.macros.items():
-      ctx.macros[prefix + '.' + key] = val
-
-    return A.import_node(name, rename)
-
-  if ctx.consume(K.keyword_token('macro')):
-    type_options = {
-      'compound': compound,
-      'expr': binexpr,
-      'args': fnargs,
-      'params': fnparams,
-      'block': block,
-      'argblock': fnargblock,
-      'stmt': stmt,
-      'name': lambda x: x.require(K.name_token).value,
-      'namestr': lambda x: x.require(K.name_token, K.string_token).value,
-      'string': lambda x: x.require(K.string_token).value,
-      'int': lambda x: x.require(K.int_token).value,
-      'float': lambda x: x.require(K.float_token).value,
-      'bool': lambda x: x.require(K.bool_token).value,
-    }
-
-    name = ctx.require(K.name_token)
-    if name.value in ctx.macros:
-      Q.abort('Redefinition of macro {!r}', name.value, pos=name.pos(file=ctx.file))
-
-    name = name.value
-    types = fnparams(ctx, tokens=[K.name_token(n) for n in type_options])
-    ctx.require(K.keyword_token('as'))
-    params = fnparams(ctx)
-    body = block(ctx)
 
-    node = A.macro_node(name, types, params, body)
-    ctx.register_macro(name, node, [type_options[x] for x in types])
-    return node
+@stmt_rule(kw['import'])
+def import_stmt(ctx):
+  ctx.next()
+  name = ctx.require(K.name_token, K.string_token)
+  base, fname = os.path.split(ctx.file)
+  file = ctx.files.find_rain(name.value, paths=[base])
 
-  if ctx.expect(K.symbol_token('@')):
-    return macro_exp(ctx)
+  if not file:
+    Q.abort("Can't find module {!r}", name.value, pos=name.pos(file=ctx.file))
 
-  if ctx.consume(K.keyword_token('link')):
-    name = ctx.require(K.string_token).value
-    return A.link_node(name)
+  name = name.value
+  rename = None
+  if ctx.consume(kw['as']):
+    rename = ctx.require(K.name_token).value
 
-  if ctx.consume(K.keyword_token('library')):
-    name = ctx.require(K.string_token).value
-    return A.lib_node(name)
+  import_macros(ctx, file, rename)
 
-  if ctx.expect(K.keyword_token('if')):
-    return if_stmt(ctx)
+  return A.import_node(name, rename)
 
-  if ctx.consume(K.keyword_token('catch')):
-    name = ctx.require(K.name_token).value
-    body = block(ctx)
-    return A.catch_node(name, body)
 
-  if ctx.consume(K.keyword_token('for')):
-    names = [ctx.require(K.name_token).value]
-    while ctx.consume(K.symbol_token(',')):
-      names.append(ctx.require(K.name_token).value)
+# parse an imported module and make its macros available
+def import_macros(ctx, file, rename=None):
+  comp = C.get_compiler(file, session=ctx.session)
+  comp.read()
+  comp.parse()
+  ctx.imports.append(comp)
 
-    ctx.require(K.keyword_token('in'))
+  prefix = rename or comp.mname
+  for key, val in comp.macros().items():
+    ctx.macros[prefix + '.' + key] = val
 
-    funcs = [binexpr(ctx)]
-    while ctx.consume(K.symbol_token(',')):
-      funcs.append(binexpr(ctx))
 
-    body = block(ctx)
+@stmt_rule(kw['macro'])
+def macro_stmt(ctx):
+  ctx.next()
+  name = ctx.require(K.name_token)
+  if name.value in ctx.macros:
+    Q.abort('Redefinition of macro {!r}', name.value, pos=name.pos(file=ctx.file))
 
-    return A.for_node(names, funcs, body)
+  name = name.value
+  types = fnparams(ctx, tokens=[K.name_token(n) for n in macro_types])
+  ctx.require(kw['as'])
+  params = fnparams(ctx)
+  body = block(ctx)
 
-  if ctx.consume(K.keyword_token('with')):
-    func = binexpr(ctx)
+  node = A.macro_node(name, types, params, body)
+  ctx.register_macro(name, node, [macro_types[x] for x in types])
+  return node
 
-    if ctx.consume(K.keyword_token('as')):
-      params = fnparams(ctx, parens=False)
-    else:
-      params = []
 
-    body = block(ctx)
-    return A.with_node(func, params, body)
+@stmt_rule(kw['link'])
+def link_stmt(ctx):
+  ctx.next()
+  name = ctx.require(K.string_token).value
+  return A.link_node(name)
 
-  if ctx.consume(K.keyword_token('while')):
-    pred = binexpr(ctx)
-    body = block(ctx)
-    return A.while_node(pred, body)
 
-  if ctx.consume(K.keyword_token('until')):
-    pred = binexpr(ctx)
-    body = block(ctx)
-    return A.until_node(pred, body)
+@stmt_rule(kw['library'])
+def lib_stmt(ctx):
+  ctx.next()
+  name = ctx.require(K.string_token).value
+  return A.lib_node(name)
 
-  if ctx.consume(K.keyword_token('loop')):
-    body = block(ctx)
-    return A.loop_node(body)
 
-  if ctx.consume(K.keyword_token('pass')):
-    return A.pass_node()
+@stmt_rule(kw['catch'])
+def catch_stmt(ctx):
+  ctx.next()
+  name = ctx.require(K.name_token).value
+  body = block(ctx)
+  return A.catch_node(name, body)
+
+
+@stmt_rule(kw['for'])
+def for_stmt(ctx):
+  ctx.next()
+  names = [ctx.require(K.name_token).value]
+  while ctx.consume(sym[',']):
+    names.append(ctx.require(K.name_token).value)
+
+  ctx.require(kw['in'])
+
+  funcs = [binexpr(ctx)]
+  while ctx.consume(sym[',']):
+    funcs.append(binexpr(ctx))
+
+  body = block(ctx)
+
+  return A.for_node(names, funcs, body)
 
-  if ctx.consume(K.keyword_token('break')):
-    if ctx.consume(K.keyword_token('if')):
-      return A.break_node(binexpr(ctx))
 
-    return A.break_node()
+@stmt_rule(kw['with'])
+def with_stmt(ctx):
+  ctx.next()
+  func = binexpr(ctx)
 
-  if ctx.consume(K.keyword_token('continue')):
-    if ctx.consume(K.keyword_token('if')):
-      return A.cont_node(binexpr(ctx))
+  if ctx.consume(kw['as']):
+    params = fnparams(ctx, parens=False)
+  else:
+    params = []
 
-    return A.cont_node()
+  body = block(ctx)
+  return A.with_node(func, params, body)
 
-  if ctx.consume(K.keyword_token('return')):
-    if ctx.expect(newline):
-      return A.return_node()
 
-    return A.return_node(compound(ctx))
+@stmt_rule(kw['while'])
+def while_stmt(ctx):
+  ctx.next()
+  pred = binexpr(ctx)
+  body = block(ctx)
+  return A.while_node(pred, body)
 
-  if ctx.consume(K.keyword_token('save')):
-    return A.save_node(compound(ctx))
 
+@stmt_rule(kw['until'])
+def until_stmt(ctx):
+  ctx.next()
+  pred = binexpr(ctx)
+  body = block(ctx)
+  return A.until_node(pred, body)
+
+
+@stmt_rule(kw['loop'])
+def loop_stmt(ctx):
+  ctx.next()
+  body = block(ctx)
+  return A.loop_node(body)
+
+
+@stmt_rule(kw['pass'])
+def pass_stmt(ctx):
+  ctx.next()
+  return A.pass_node()
+
+
+@stmt_rule(kw['break'])
+def break_stmt(ctx):
+  ctx.next()
+  if ctx.consume(kw['if']):
+    return A.break_node(binexpr(ctx))
+
+  return A.break_node()
+
+
+@stmt_rule(kw['continue'])
+def cont_stmt(ctx):
+  ctx.next()
+  if ctx.consume(kw['if']):
+    return A.cont_node(binexpr(ctx))
+
+  return A.cont_node()
+
+
+@stmt_rule(kw['return'])
+def return_stmt(ctx):
+  ctx.next()
+  if ctx.expect(newline):
+    return A.return_node()
+
+  return A.return_node(compound(ctx))
+
+
+@stmt_rule(kw['save'])
+def save_stmt(ctx):
+  ctx.next()
+  return A.save_node(compound(ctx))
+
+
+def assn_stmt(ctx):
   lhs = assn_prefix(ctx)
 
-  if ctx.consume(K.symbol_token('=')):
+  if ctx.consume(sym['=']):
     rhs = compound(ctx)
     return A.assn_node(lhs, rhs, let=False)
 
-  if ctx.expect(K.symbol_token('(')):
+  if ctx.expect(sym['(']):
     args = fnargs(ctx)
     return A.call_node(lhs, args)
 
-  if ctx.consume(K.symbol_token(':')):
+  if ctx.consume(sym[':']):
     name = ctx.require(K.name_token).value
     rhs = A.str_node(name)
     args = fnargs(ctx)
@@ -364,16 +638,17 @@ def stmt(ctx):
 
 
 # if_stmt :: 'if' binexpr block (NEWLINE 'else' (if_stmt | block))?
+@stmt_rule(kw['if'])
 def if_stmt(ctx):
-  ctx.require(K.keyword_token('if'))
+  ctx.require(kw['if'])
   pred = binexpr(ctx)
   body = block(ctx)
   els = None
 
-  if ctx.peek == K.keyword_token('else'):
+  if ctx.peek == kw['else']:
     ctx.require(newline)
-    ctx.require(K.keyword_token('else'))
-    if ctx.expect(K.keyword_token('if')):
+    ctx.require(kw['else'])
+    if ctx.expect(kw['if']):
       els = if_stmt(ctx)
     else:
       els = block(ctx)
@@ -382,13 +657,14 @@ def if_stmt(ctx):
 
 
 # macro_exp :: '@' NAME ('.' NAME)* ***
+@stmt_rule(sym['@'])
 def macro_exp(ctx):
-  ctx.require(K.symbol_token('@'))
+  ctx.require(sym['@'])
   name = ctx.require(K.name_token)
   pos = name.pos(file=ctx.file)
   name = name.value
 
-  while ctx.consume(K.symbol_token('.')):
+  while ctx.consume(sym['.']):
     name += '.' + ctx.require(K.name_token).value
     pos.len = len(name)
 
@@ -406,15 +682,15 @@ def assn_prefix(ctx):
 
   while True:
 
-    if ctx.consume(K.symbol_token('.')):
+    if ctx.consume(sym['.']):
       name = ctx.require(K.name_token).value
       rhs = A.str_node(name)
       lhs = A.idx_node(lhs, rhs)
       continue
 
-    if ctx.consume(K.symbol_token('[')):
+    if ctx.consume(sym['[']):
       rhs = binexpr(ctx)
-      ctx.require(K.symbol_token(']'))
+      ctx.require(sym[']'])
       lhs = A.idx_node(lhs, rhs)
       continue
 
@@ -425,17 +701,17 @@ def assn_prefix(ctx):
 
 # array_expr :: '[' (binexpr (',' binexpr)*)? ','? ']'
 def array_expr(ctx):
-  ctx.require(K.symbol_token('['))
+  ctx.require(sym['['])
   arr = []
-  if not ctx.expect(K.symbol_token(']')):
+  if not ctx.expect(sym[']']):
     arr.append(binexpr(ctx))
-    while not ctx.expect(K.symbol_token(']')):
-      ctx.require(K.symbol_token(','))
-      if ctx.expect(K.symbol_token(']')):
+    while not ctx.expect(sym[']']):
+      ctx.require(sym[','])
+      if ctx.expect(sym[']']):
         break
       arr.append(binexpr(ctx))
 
-  ctx.require(K.symbol_token(']'))
+  ctx.require(sym[']'])
   return arr
 
 
@@ -446,11 +722,11 @@ def dict_item(ctx):
   if key:
     key = A.str_node(key.value)
   else:
-    ctx.require(K.symbol_token('['))
+    ctx.require(sym['['])
     key = binexpr(ctx)
-    ctx.require(K.symbol_token(']'))
+    ctx.require(sym[']'])
 
-  ctx.require(K.symbol_token('='))
+  ctx.require(sym['='])
   val = binexpr(ctx)
 
   return key, val
@@ -458,32 +734,32 @@ def dict_item(ctx):
 
 # dict_expr :: '{' (dict_item (',' dict_item)*)? ','? '}'
 def dict_expr(ctx):
-  ctx.require(K.symbol_token('{'))
+  ctx.require(sym['{'])
   items = []
-  if not ctx.expect(K.symbol_token('}')):
+  if not ctx.expect(sym['}']):
     items.append(dict_item(ctx))
-    while not ctx.expect(K.symbol_token('}')):
-      ctx.require(K.symbol_token(','))
-      if ctx.expect(K.symbol_token('}')):
+    while not ctx.expect(sym['}']):
+      ctx.require(sym[','])
+      if ctx.expect(sym['}']):
         break
       items.append(dict_item(ctx))
 
-  ctx.require(K.symbol_token('}'))
+  ctx.require(sym['}'])
 
   return items
 
 
 # fnargs :: '(' (binexpr (',' binexpr)*)? ')'
 def fnargs(ctx):
-  ctx.require(K.symbol_token('('))
+  ctx.require(sym['('])
   args = []
-  if not ctx.expect(K.symbol_token(')')):
+  if not ctx.expect(sym[')']):
     args.append(binexpr(ctx))
-    while not ctx.expect(K.symbol_token(')')):
-      ctx.require(K.symbol_token(','))
+    while not ctx.expect(sym[')']):
+      ctx.require(sym[','])
       args.append(binexpr(ctx))
 
-  ctx.require(K.symbol_token(')'))
+  ctx.require(sym[')'])
   return args
 
 
@@ -504,16 +780,16 @@ def fnargblock(ctx):
 # fnparams :: '(' (NAME (',' NAME)*)? ')'
 def fnparams(ctx, parens=True, tokens=[K.name_token]):
   if parens:
-    ctx.require(K.symbol_token('('))
+    ctx.require(sym['('])
 
   params = []
   if ctx.expect(*tokens):
     params.append(ctx.require(*tokens).value)
-    while ctx.consume(K.symbol_token(',')):
+    while ctx.consume(sym[',']):
       params.append(ctx.require(*tokens).value)
 
   if parens:
-    ctx.require(K.symbol_token(')'))
+    ctx.require(sym[')'])
 
   return params
 
@@ -522,13 +798,13 @@ def fnparams(ctx, parens=True, tokens=[K.name_token]):
 #           | 'func' fnparams ('->' binexpr | block)
 #           | binexpr
 def compound(ctx):
-  if ctx.expect(K.symbol_token('@')):
+  if ctx.expect(sym['@']):
     return macro_exp(ctx)
 
-  if ctx.consume(K.keyword_token('func')):
+  if ctx.consume(kw['func']):
     params = fnparams(ctx)
 
-    if ctx.consume(K.operator_token('->')):
+    if ctx.consume(op['->']):
       exp = binexpr(ctx)
       return A.func_node(params, A.return_node(exp))
 
@@ -543,9 +819,10 @@ def binexpr(ctx):
   lhs = unexpr(ctx)
   pairs = []
 
-  while ctx.expect(K.operator_token):
-    op = ctx.require(K.operator_token)
-    pairs.append((op.value, unexpr(ctx)))
+  while type(ctx.token) is K.operator_token:
+    oper = ctx.token.value
+    ctx.next()
+    pairs.append((oper, unexpr(ctx)))
 
   if pairs:
     lhs = bin_merge(lhs, pairs)
@@ -553,26 +830,27 @@ def binexpr(ctx):
   return lhs
 
 
-def bin_merge(lhs, pairs):
-  op, rhs = pairs[0]
-  pairs = pairs[1:]
-  for nop, next in pairs:
-    if binary_ops[nop] > binary_ops[op]:
-      rhs = bin_merge(rhs, pairs)
+# group the (operator, operand) pairs after lhs, from pairs[start] on. an
+# operator that binds tighter than the one before it takes the whole rest of
+# the chain as its right-hand side, so a - b * c - d is a - ((b * c) - d)
+def bin_merge(lhs, pairs, start=0):
+  oper, rhs = pairs[start]
+  for num in range(start + 1, len(pairs)):
+    nop, nxt = pairs[num]
+    if binary_ops[nop] > binary_ops[oper]:
+      rhs = bin_merge(rhs, pairs, num)
       break
-    else:
-      lhs = A.binary_node(lhs, rhs, op)
-      op = nop
-      rhs = next
-      pairs = pairs[1:]
 
-  return A.binary_node(lhs, rhs, op)
+    lhs = A.binary_node(lhs, rhs, oper)
+    oper, rhs = nop, nxt
+
+  return A.binary_node(lhs, rhs, oper)
 
 
 # unexpr :: ('-' | '!') simple
 #         | simple
 def unexpr(ctx):
-  if ctx.expect(K.operator_token('-'), K.operator_token('!')):
+  if ctx.expect(op['-'], op['!']):
     return A.unary_node(ctx.require(K.operator_token).value, simple(ctx))
 
   return simple(ctx)
@@ -584,21 +862,21 @@ def unexpr(ctx):
 #         | dict_expr
 #         | primary
 def simple(ctx):
-  if ctx.consume(K.keyword_token('func')):
+  if ctx.consume(kw['func']):
     params = fnparams(ctx)
-    ctx.require(K.operator_token('->'))
+    ctx.require(op['->'])
     exp = binexpr(ctx)
     return A.func_node(params, A.return_node(exp))
 
-  if ctx.consume(K.keyword_token('foreign')):
+  if ctx.consume(kw['foreign']):
     name = ctx.require(K.name_token, K.string_token).value
     params = fnparams(ctx)
     return A.foreign_node(name, params)
 
-  if ctx.expect(K.symbol_token('[')):
+  if ctx.expect(sym['[']):
     return A.array_node(array_expr(ctx))
 
-  if ctx.expect(K.symbol_token('{')):
+  if ctx.expect(sym['{']):
     return A.dict_node(dict_expr(ctx))
 
   return primary(ctx)
@@ -609,36 +887,36 @@ def primary(ctx):
   node = prefix(ctx)
 
   while True:
-    if ctx.consume(K.symbol_token('?')):
+    if ctx.consume(sym['?']):
       args = fnargs(ctx)
       node = A.call_node(node, args, catch=True)
       continue
 
-    if ctx.expect(K.symbol_token('(')):
+    if ctx.expect(sym['(']):
       args = fnargs(ctx)
       node = A.call_node(node, args)
       continue
 
-    if ctx.consume(K.symbol_token(':')):
+    if ctx.consume(sym[':']):
       name = ctx.require(K.name_token).value
       rhs = A.str_node(name)
 
-      catch = bool(ctx.consume(K.symbol_token('?')))
+      catch = bool(ctx.consume(sym['?']))
 
       args = fnargs(ctx)
       node = A.meth_node(node, rhs, args, catch=catch)
 
       continue
 
-    if ctx.consume(K.symbol_token('.')):
+    if ctx.consume(sym['.']):
       name = ctx.require(K.name_token).value
       rhs = A.str_node(name)
       node = A.idx_node(node, rhs)
       continue
 
-    if ctx.consume(K.symbol_token('[')):
+    if ctx.consume(sym['[']):
       rhs = binexpr(ctx)
-      ctx.require(K.symbol_token(']'))
+      ctx.require(sym[']'])
       node = A.idx_node(node, rhs)
       continue
 
@@ -650,27 +928,64 @@ def primary(ctx):
 # prefix :: '(' binexpr ')'
 #         | NAME | INT | FLOAT | BOOL | STRING | NULL | TABLE
 def prefix(ctx):
-  if ctx.consume(K.symbol_token('(')):
+  rule = prefix_rules.get(type(ctx.token))
+  if rule:
+    return rule(ctx)
+
+  return A.name_node(ctx.require(K.name_token).value)
+
+
+def paren_expr(ctx):
+  if ctx.consume(sym['(']):
     node = binexpr(ctx)
-    ctx.require(K.symbol_token(')'))
+    ctx.require(sym[')'])
     return node
 
-  if ctx.expect(K.int_token):
-    return A.int_node(ctx.require(K.int_token).value)
+  return A.name_node(ctx.require(K.name_token).value)
 
-  if ctx.expect(K.float_token):
-    return A.float_node(ctx.require(K.float_token).value)
 
-  if ctx.expect(K.bool_token):
-    return A.bool_node(ctx.require(K.bool_token).value)
+def literal(node_type):
+  def rule(ctx):
+    value = ctx.token.value
+    ctx.next()
+    return node_type(value)
 
-  if ctx.expect(K.string_token):
-    return A.str_node(ctx.require(K.string_token).value)
+  return rule
 
-  if ctx.consume(K.null_token):
-    return A.null_node()
 
-  if ctx.consume(K.table_token):
-    return A.table_node()
+def constant(node_type):
+  def rule(ctx):
+    ctx.next()
+    return node_type()
 
-  return A.name_node(ctx.require(K.name_token).value)
+  return rule
+
+
+# prefix rules, keyed on the type of the first token
+prefix_rules = {
+  K.symbol_token: paren_expr,
+  K.int_token: literal(A.int_node),
+  K.float_token: literal(A.float_node),
+  K.bool_token: literal(A.bool_node),
+  K.string_token: literal(A.str_node),
+  K.null_token: constant(A.null_node),
+  K.table_token: constant(A.table_node),
+}
+
+
+# parsers for each macro parameter type
+macro_types = {
+  'compound': compound,
+  'expr': binexpr,
+  'args': fnargs,
+  'params': fnparams,
+  'block': block,
+  'argblock': fnargblock,
+  'stmt': stmt,
+  'name': lambda x: x.require(K.name_token).value,
+  'namestr': lambda x: x.require(K.name_token, K.string_token).value,
+  'string': lambda x: x.require(K.string_token).value,
+  'int': lambda x: x.require(K.int_token).value,
+  'float': lambda x: x.require(K.float_token).value,
+  'bool': lambda x: x.require(K.bool_token).value,
+}
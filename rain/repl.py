@@ -0,0 +1,221 @@
+from . import ast as A
+from . import compiler as C
+from . import emit
+from . import engine as E
+from . import error as Q
+from . import lexer as L
+from . import module as M
+from . import parser as P
+from . import types as T
+from contextlib import redirect_stdout
+from ctypes import byref
+from os import environ as ENV
+from os.path import join
+from termcolor import colored as X
+import io
+import os
+import os.path
+import sys
+
+
+class Repl:
+  '''Evaluates Rain code an input at a time.
+
+  The builtins and their runtime are compiled into one engine when the REPL
+  starts. Each input is emitted into a small module of its own, which imports
+  everything the inputs before it defined, and is added to the engine on top.'''
+
+  def __init__(self, session=None):
+    self.session = session or C.Session()
+    self.file = join(os.getcwd(), 'repl.rn')  # imports are found from here
+    self.count = 0
+
+    self.builtin = self.session.get_compiler(join(ENV['RAINLIB'], '_pkg.rn'))
+    self.builtin.goodies()
+    self.builtin.compile_links()
+
+    self.eng = E.Engine(ll_file=self.builtin.ll, cache=C.Compiler.cache)
+    self.eng.link_file(*self.builtin.links)
+    self.eng.add_lib(*self.session.find_libs(self.builtin.libs))
+    self.eng.finalize()
+
+    self.added = {self.builtin.ll} | self.builtin.links  # IR already in the engine
+    self.libs = set(self.builtin.libs)
+    self.mods = []  # modules made from earlier inputs
+    self.macros = {}
+
+  def context(self, src):
+    ctx = P.context(L.stream(src, file=self.file, session=self.session),
+                    file=self.file, session=self.session)
+    ctx.macros = self.macros
+    return ctx
+
+  # parse an input. returns ('expr', node) for a lone expression, whose value
+  # gets printed, or ('stmts', [node]). errors are printed unless quiet, and
+  # raise SystemExit
+  def parse(self, src, quiet=False):
+    with redirect_stdout(io.StringIO()):
+      try:
+        ctx = self.context(src)
+        expr = P.compound(ctx)
+        ctx.consume(P.newline)
+        if ctx.expect(P.end):
+          return 'expr', expr
+      except SystemExit:
+        pass
+
+    with redirect_stdout(io.StringIO() if quiet else sys.stdout):
+      ctx = self.context(src)
+      stmts = []
+      while not ctx.expect(P.end):
+        token = ctx.token
+        stmt = P.stmt(ctx)
+        if stmt is None:
+          Q.abort('Expected a statement', pos=token.pos(file=self.file))
+
+        stmts.append(stmt)
+        ctx.require(P.newline)
+
+      return 'stmts', stmts
+
+  # whether an input stops where it's waiting for an indented block
+  def incomplete(self, src):
+    ctx = self.context(src)
+    with redirect_stdout(io.StringIO()):
+      try:
+        while not ctx.expect(P.end):
+          P.stmt(ctx)
+          ctx.require(P.newline)
+        return False
+      except SystemExit:
+        pass
+
+    return ctx.token == P.end or (ctx.token == P.newline and ctx.peek == P.end)
+
+  # emit an input into a module of its own. returns the module and the files
+  # it imported
+  def emit(self, kind, nodes):
+    self.count += 1
+    mod = M.Module(name='repl{}'.format(self.count), session=self.session)
+    mod.file = self.file
+
+    # builtins and everything defined so far
+    for other in [self.builtin.mod] + self.mods:
+      for name, val in other.globals.items():
+        mod[name] = val
+      mod.import_from(other)
+
+    if kind == 'expr':
+      nodes = [A.return_node(nodes)]
+
+    # declarations happen at global scope, so later inputs can see them, and
+    # everything else runs in a function
+    imports = []
+    body = []
+    for node in nodes:
+      if isinstance(node, (A.import_node, A.link_node, A.lib_node, A.macro_node)):
+        ret = mod.emit(node)
+        if isinstance(node, A.import_node):
+          imports.append(ret)
+        elif isinstance(node, A.link_node):
+          self.add_files([ret])
+        elif isinstance(node, A.lib_node):
+          self.add_libs([ret])
+
+      elif isinstance(node, A.assn_node) and isinstance(node.lhs, A.name_node) and (node.let or node.export):
+        mod[node.lhs] = mod.add_global(T.box, name=mod.mangle(node.lhs.value))
+        mod[node.lhs].initializer = T.null
+        body.append(A.assn_node(node.lhs, node.rhs))
+
+      else:
+        body.append(node)
+
+    typ = T.vfunc(T.arg)
+    A.func_node([], A.block_node(body)).emit(mod, name=mod.mangle('real'))
+    real = mod.find_func(typ, mod.mangle('real'))
+
+    # run(ret, exc) stores an uncaught exception in exc instead of aborting
+    run = mod.add_func(T.vfunc(T.arg, T.arg), name=mod.mangle('run'))
+    run.attributes.personality = mod.extern('rain_personality_v0')
+    with mod.add_func_body(run):
+      with mod.add_catch() as catch:
+        mod.call(real, run.args[0], unwind=mod.catch)
+        catch(run.args[1], mod.builder.block)
+
+      mod.builder.ret_void()
+
+    return mod, imports
+
+  def add_files(self, files):
+    for file in files:
+      if file not in self.added:
+        self.eng.add_file(file)
+        self.added.add(file)
+
+  def add_libs(self, libs):
+    libs = set(libs) - self.libs
+    if libs:
+      self.eng.add_lib(*self.session.find_libs(libs))
+      self.libs |= libs
+
+  # evaluate an input and print its value, if it has one
+  def eval(self, src):
+    try:
+      kind, nodes = self.parse(src)
+      mod, imports = self.emit(kind, nodes)
+
+      # add the IR of whatever the input imported, then the input's own
+      for file in imports:
+        comp = self.session.get_compiler(file)
+        if comp.ll not in self.added:
+          comp.compile_links()
+          self.add_files(sorted(comp.links) + [comp.ll])
+          self.add_libs(comp.libs)
+
+      self.eng.add_ir(mod.ir)
+      self.eng.finalize()
+    except SystemExit:
+      return
+
+    self.mods.append(mod)
+
+    ret_box = T.cbox.to_rain(None)
+    exc_box = T.cbox.to_rain(None)
+    run = self.eng.get_func(mod.mangle('run'), None, T.carg, T.carg)
+    show = self.eng.get_func('rain_print', None, T.carg)
+
+    sys.stdout.flush()
+    run(byref(ret_box), byref(exc_box))
+    E.libc.fflush(None)
+
+    if exc_box.type != T.typi.null:
+      print('{}: '.format(X('error', 'red')), end='', flush=True)
+      show(byref(exc_box))
+    elif ret_box.type != T.typi.null:
+      show(byref(ret_box))
+    E.libc.fflush(None)
+
+  def read(self):
+    lines = [input('>>> ')]
+    if self.incomplete(lines[0] + '\n'):
+      while True:
+        line = input('... ')
+        if not line.strip():
+          break
+        lines.append(line)
+
+    return '\n'.join(lines) + '\n'
+
+  def loop(self):
+    while True:
+      try:
+        src = self.read()
+      except KeyboardInterrupt:
+        print()
+        continue
+      except EOFError:
+        print()
+        return
+
+      if src.strip():
+        self.eval(src)
@@ -0,0 +1,139 @@
+from . import cache as H
+from . import compiler as C
+from . import libs as I
+import json
+import os
+import os.path
+import socket
+import sys
+import traceback
+
+
+class Server:
+  '''Builds programs for clients on a Unix socket, one at a time.
+
+  The builtins are emitted once, when the server starts, and every build
+  starts from them for as long as their sources are unchanged. Compiled C
+  links, found libraries and the module index are shared between builds too.
+
+  A client sends one line of JSON, {"cwd": ..., "argv": [...]}, with argv as
+  rainc would take it. Everything the build prints is sent back as it's
+  written, followed by a NUL and the reply, {"exit": code, "run": program}.
+  When the build asked to be run, the client runs it.'''
+
+  def __init__(self, path, parser, build):
+    self.path = path
+    self.parser = parser
+    self.build = build
+    self.warm = None
+    self.warm_up()
+
+  # emit the builtins, and start compiling their C links
+  def warm_up(self):
+    quiet, C.Compiler.quiet = C.Compiler.quiet, True
+
+    if self.warm is not None:
+      self.warm.close()
+
+    self.warm = C.Session()
+    self.warm.compiling = True
+    self.warm.resolver = I.Resolver(cache=C.Compiler.cache)
+    self.warm.get_compiler(C.builtin()).goodies()
+
+    self.sums = {file: comp.checksum() for file, comp in self.warm.compilers.items()}
+
+    C.Compiler.quiet = quiet
+
+  # a session for one build, which starts from the warm builtins
+  def session(self):
+    for file, key in self.sums.items():
+      try:
+        with open(file) as tmp:
+          changed = H.digest(tmp.read()) != key
+      except OSError:
+        changed = True
+
+      if changed:
+        self.warm_up()
+        break
+
+    return self.warm.fork()
+
+  def serve(self):
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.bind(self.path)
+      sock.listen(16)
+      print('serving builds on {}'.format(self.path), flush=True)
+
+      while True:
+        conn, addr = sock.accept()
+        with conn:
+          try:
+            self.handle(conn)
+          except OSError:  # the client hung up
+            pass
+
+    except KeyboardInterrupt:
+      pass
+
+    finally:
+      sock.close()
+      self.warm.close()
+      if os.path.exists(self.path):
+        os.remove(self.path)
+
+  # run one build, with its output going to the client
+  def handle(self, conn):
+    with conn.makefile('rb') as tmp:
+      req = json.loads(tmp.readline().decode('utf-8'))
+
+    reply = {'exit': 0, 'run': None}
+    cwd = os.getcwd()
+
+    # clang writes to the same place as the compiler
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2), sys.stdout, sys.stderr
+    os.dup2(conn.fileno(), 1)
+    os.dup2(conn.fileno(), 2)
+    sys.stdout = sys.stderr = open(conn.fileno(), 'w', buffering=1, closefd=False)
+
+    try:
+      os.chdir(req['cwd'])
+      args = self.parser.parse_args(req['argv'])
+      if args.repl or args.jit or args.server is not None:
+        self.parser.error("--repl, --jit and --server can't be used with the server")
+
+      run, args.run = args.run, False
+      comp = self.build(args, self.session())
+      if run:
+        reply['run'] = [os.path.abspath(comp.target or comp.mname)] + args.args
+
+    except SystemExit as exc:
+      reply['exit'] = exc.code if isinstance(exc.code, int) else int(exc.code is not None)
+
+    except Exception:
+      reply['exit'] = 1
+      try:
+        traceback.print_exc()
+      except OSError:  # the client hung up
+        pass
+
+    finally:
+      try:
+        sys.stdout.close()
+      except OSError:  # the client hung up, with output still buffered
+        pass
+
+      sys.stdout, sys.stderr = saved[2:]
+      os.dup2(saved[0], 1)
+      os.dup2(saved[1], 2)
+      os.close(saved[0])
+      os.close(saved[1])
+      os.chdir(cwd)
+
+    conn.sendall(b'\0' + json.dumps(reply).encode('utf-8'))
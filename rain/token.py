@@ -1,4 +1,13 @@
+from array import array
+from bisect import bisect_right
+import re
+
+newlines = re.compile('\n')
+
+
 class coord:
+  __slots__ = ['line', 'col', 'file', 'len']
+
   def __init__(self, line=0, col=0, file=None, len=1):
     self.line = line
     self.col = col
@@ -27,7 +36,76 @@ class coord:
   def __repr__(self):
     return '<{!s}>'.format(self)
 
+
+# line-start table for one source file - turns offsets into lines and columns
+class source:
+  __slots__ = ['file', 'lines']
+
+  def __init__(self, text='', file=None):
+    self.file = file
+    self.lines = array('I', [0])
+    self.lines.extend(match.end() for match in newlines.finditer(text))
+
+  def locate(self, offset):
+    idx = bisect_right(self.lines, offset) - 1
+    return idx + 1, offset - self.lines[idx] + 1
+
+  # offset of the start of the line containing offset
+  def line_start(self, offset):
+    return self.lines[bisect_right(self.lines, offset) - 1]
+
+  # replace the lines in text[start:stop] with the lines from another source
+  # that was made from the replacement text
+  def splice(self, start, stop, other, delta):
+    lo = bisect_right(self.lines, start)
+    hi = bisect_right(self.lines, stop)
+
+    tail = array('I', (line + delta for line in self.lines[hi:]))
+    self.lines[lo:] = array('I', (line + start for line in other.lines[1:]))
+    self.lines.extend(tail)
+
+
+# packed position of a token - reads like a coord, but only stores an offset
+class span:
+  __slots__ = ['src', 'offset', 'len']
+
+  def __init__(self, src, offset, len=1):
+    self.src = src
+    self.offset = offset
+    self.len = len
+
+  @property
+  def line(self):
+    return self.src.locate(self.offset)[0]
+
+  @property
+  def col(self):
+    return self.src.locate(self.offset)[1]
+
+  @property
+  def file(self):
+    return self.src.file
+
+  def __call__(self, **kwargs):
+    line, col = self.src.locate(self.offset)
+    return coord(line, col, self.src.file, self.len)(**kwargs)
+
+  def __str__(self):
+    return str(self())
+
+  def __repr__(self):
+    return '<{!s}>'.format(self)
+
+
+kinds = []
+
+
 class metatoken(type):
+  def __init__(cls, name, bases, attrs):
+    super().__init__(name, bases, attrs)
+    cls.kind = len(kinds)
+    kinds.append(cls)
+
   def __str__(self):
     if getattr(self, 'name', None):
       return self.name
@@ -39,9 +117,18 @@ class metatoken(type):
 
 
 class token(metaclass=metatoken):
+  __slots__ = ['pos']
+
   def __init__(self, *, pos=coord()):
     self.pos = pos
 
+  # build a token from an already-converted value
+  @classmethod
+  def unpack(cls, value, pos):
+    self = cls.__new__(cls)
+    self.pos = pos
+    return self
+
   def __eq__(self, other):
     return type(self) is type(other)
 
@@ -56,26 +143,42 @@ class token(metaclass=metatoken):
 
 class end_token(token):
   name = 'EOF'
+  __slots__ = []
 
 
 # Rain
 
 class indent_token(token):
   name = 'indent'
+  __slots__ = []
 
 
 class dedent_token(token):
   name = 'dedent'
+  __slots__ = []
 
 
 class newline_token(token):
   name = 'newline'
+  __slots__ = []
 
 
 class value_token(token):
+  __slots__ = ['value']
+
   def __init__(self, value, *, pos=coord()):
     super().__init__(pos=pos)
+    self.value = self.convert(value)
+
+  @classmethod
+  def unpack(cls, value, pos):
+    self = super().unpack(value, pos)
     self.value = value
+    return self
+
+  @staticmethod
+  def convert(value):
+    return value
 
   def __eq__(self, other):
     typ = type(self) is other
@@ -93,55 +196,127 @@ class value_token(token):
 
 class keyword_token(value_token):
   name = 'keyword'
+  __slots__ = []
 
 
 class name_token(value_token):
   name = 'name'
+  __slots__ = []
 
 
 class symbol_token(value_token):
   name = 'symbol'
+  __slots__ = []
 
 
 class operator_token(value_token):
   name = 'operator'
+  __slots__ = []
 
 
 class int_token(value_token):
   name = 'int'
+  __slots__ = []
 
-  def __init__(self, value, *, pos=coord()):
-    super().__init__(int(value), pos=pos)
+  convert = int
 
 
 class float_token(value_token):
   name = 'float'
+  __slots__ = []
 
-  def __init__(self, value, *, pos=coord()):
-    super().__init__(float(value), pos=pos)
+  convert = float
 
 
 class bool_token(value_token):
   name = 'bool'
+  __slots__ = []
 
-  def __init__(self, value, *, pos=coord()):
-    super().__init__(value.lower() == 'true', pos=pos)
+  @staticmethod
+  def convert(value):
+    return value.lower() == 'true'
 
 
 class string_token(value_token):
   name = 'string'
-
-  def __init__(self, value, *, pos=coord()):
-    super().__init__(self.unescape(value), pos=pos)
+  __slots__ = []
 
   @staticmethod
-  def unescape(data):
+  def convert(data):
     return bytes(data[1:-1].encode('utf-8')).decode('unicode_escape')
 
 
 class null_token(value_token):
-  pass
+  __slots__ = []
 
 
 class table_token(value_token):
-  pass
+  __slots__ = []
+
+
+# Packed token streams
+
+class token_array:
+  '''A lexed file stored as parallel arrays.
+
+  Each token is a kind code, an index into a table of interned values, and an
+  offset and length into the source. Token objects are only built when the
+  array is indexed or iterated.'''
+
+  __slots__ = ['src', 'kinds', 'vids', 'offsets', 'lens', 'values', 'interned']
+
+  def __init__(self, src=None):
+    self.src = src or source()
+    self.kinds = array('B')
+    self.vids = array('I')
+    self.offsets = array('I')
+    self.lens = array('I')
+    self.values = [None]
+    self.interned = {}
+
+  def intern(self, value):
+    key = (type(value), value)
+    vid = self.interned.get(key)
+    if vid is None:
+      vid = self.interned[key] = len(self.values)
+      self.values.append(value)
+
+    return vid
+
+  def append(self, kind, value, offset, size=1):
+    self.kinds.append(kind.kind)
+    self.vids.append(self.intern(value))
+    self.offsets.append(offset)
+    self.lens.append(size)
+
+  # replace tokens[lo:hi] with the first `count` tokens of another array that
+  # was lexed from text starting at offset `base`. every token after them is
+  # moved by `delta` characters
+  def splice(self, lo, hi, other, count, base, delta):
+    vids = [self.intern(value) for value in other.values]
+
+    tail = array('I', (offset + delta for offset in self.offsets[hi:]))
+    self.offsets[lo:] = array('I', (offset + base for offset in other.offsets[:count]))
+    self.offsets.extend(tail)
+
+    self.kinds[lo:hi] = other.kinds[:count]
+    self.vids[lo:hi] = array('I', (vids[vid] for vid in other.vids[:count]))
+    self.lens[lo:hi] = other.lens[:count]
+
+  # iterate over tokens[start:stop]
+  def slice(self, start, stop):
+    return (self[idx] for idx in range(start, stop))
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def __getitem__(self, idx):
+    kind = kinds[self.kinds[idx]]
+    pos = span(self.src, self.offsets[idx], self.lens[idx])
+    return kind.unpack(self.values[self.vids[idx]], pos)
+
+  def __iter__(self):
+    src = self.src
+    values = self.values
+    for kind, vid, offset, size in zip(self.kinds, self.vids, self.offsets, self.lens):
+      yield kinds[kind].unpack(values[vid], span(src, offset, size))
@@ -0,0 +1,123 @@
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+# the order phases are listed in, when they happen
+order = ['fetch', 'read', 'lex', 'load', 'parse', 'macro', 'expand', 'jit_macro', 'emit', 'write',
+         'compile_c', 'wait_c', 'find_libs', 'runtime_lib', 'optimize', 'link', 'jit']
+
+
+# stands in for a span when nothing is being traced. yields None for the
+# span's arguments, so sizes that take work to count can be skipped
+class Untraced:
+  def __enter__(self):
+    return None
+
+  def __exit__(self, *exc):
+    return False
+
+
+untraced = Untraced()
+
+
+class Tracer:
+  '''Records how long each phase of a build takes, per module.
+
+  Spans nest by time, like the phases do: a module imported for its macros is
+  parsed inside the span of the module importing it. Each span also keeps the
+  time spent in it outside of any spans inside it, so the summary adds up to
+  the build. Spans on other threads, like C compiles, nest on their own, and
+  spans from build processes can be merged in.'''
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.spans = []  # (name, module, pid, tid, start, secs, own secs, args)
+    self.lock = threading.Lock()
+    self.local = threading.local()
+
+  # time a phase of a module. yields a dict to record sizes in, like the
+  # number of tokens, as the span's arguments
+  @contextmanager
+  def span(self, name, module, **args):
+    stack = self.local.__dict__.setdefault('stack', [])
+    inner = [0.0]
+    stack.append(inner)
+
+    start = time.perf_counter()
+    try:
+      yield args
+    finally:
+      secs = time.perf_counter() - start
+      stack.pop()
+      if stack:
+        stack[-1][0] += secs
+
+      span = (name, module, os.getpid(), threading.get_ident(), start, secs, secs - inner[0], args)
+      with self.lock:
+        self.spans.append(span)
+
+  # hand over the spans recorded so far, for another process to merge
+  def drain(self):
+    with self.lock:
+      spans, self.spans = self.spans, []
+
+    return spans
+
+  # add spans recorded in another process. perf_counter is the same clock in
+  # every process, so they line up as they are
+  def merge(self, spans):
+    with self.lock:
+      self.spans.extend(spans)
+
+  # Output ####################################################################
+
+  # the time spent in each phase, then in each module, as lines of a table
+  def table(self):
+    phases = {}
+    modules = {}
+    for name, module, pid, tid, start, secs, own, args in self.spans:
+      calls, total = phases.get(name, (0, 0.0))
+      phases[name] = calls + 1, total + own
+      modules[module] = modules.get(module, 0.0) + own
+
+    wall = time.perf_counter() - self.start
+    names = sorted(phases, key=lambda name: order.index(name) if name in order else len(order))
+
+    lines = ['{:>12} {:>7} {:>10} {:>6}'.format('phase', 'count', 'time', '%')]
+    for name in names:
+      calls, total = phases[name]
+      lines.append('{:>12} {:>7} {:>8.1f}ms {:>5.1f}%'.format(name, calls, total * 1000, 100 * total / wall))
+    lines.append('{:>12} {:>7} {:>8.1f}ms'.format('wall', '', wall * 1000))
+
+    lines.append('')
+    lines.append('{:>12} {:>10}  {}'.format('', 'time', 'module'))
+    for module in sorted(modules, key=modules.get, reverse=True):
+      lines.append('{:>12} {:>8.1f}ms  {}'.format('', modules[module] * 1000, module))
+
+    return lines
+
+  # the spans as Chrome trace events, for chrome://tracing or Perfetto
+  def events(self):
+    threads = {}
+    events = []
+    for name, module, pid, tid, start, secs, own, args in self.spans:
+      tid = threads.setdefault((pid, tid), len(threads))
+      events.append({
+        'name': name,
+        'cat': 'rain',
+        'ph': 'X',
+        'ts': round((start - self.start) * 1e6, 3),
+        'dur': round(secs * 1e6, 3),
+        'pid': pid,
+        'tid': tid,
+        'args': dict(args, module=module),
+      })
+
+    return sorted(events, key=lambda event: (event['ts'], -event['dur']))
+
+  def write(self, path):
+    import json
+
+    with open(path, 'w') as tmp:
+      json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, tmp)
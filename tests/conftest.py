@@ -0,0 +1,11 @@
+import os
+import shutil
+import tempfile
+
+# keep the caches the tests write out of the source tree and the user's home
+def pytest_configure(config):
+  os.environ['RAIN_CACHE_DIR'] = tempfile.mkdtemp(prefix='rain-cache.')
+
+
+def pytest_unconfigure(config):
+  shutil.rmtree(os.environ.pop('RAIN_CACHE_DIR'), ignore_errors=True)
@@ -0,0 +1,39 @@
+import os
+import pytest
+import rain.backend as D
+
+IR = '''define i32 @seven() {
+  %a = alloca i32
+  store i32 3, i32* %a
+  %b = load i32, i32* %a
+  %c = add i32 %b, 4
+  ret i32 %c
+}
+'''
+
+def test_count():
+  assert D.count(IR) == 5
+  assert D.count('; comment\n@x = global i32 0\n') == 0
+
+def test_backend(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir))
+  ll = tmpdir.join('seven.ll')
+  ll.write(IR)
+
+  back = D.Backend('2', cache=True)
+  obj, (secs, before, after) = back.compile(str(ll))
+  assert os.path.getsize(obj) > 0
+  assert before == 5 and after < before
+
+  # the second time comes from the cache
+  assert back.compile(str(ll)) == (obj, None)
+
+  # custom passes
+  obj, (secs, before, after) = D.Backend('0', ['sroa', 'instruction_combining']).compile(str(ll))
+  assert after < before
+
+def test_bad_options():
+  with pytest.raises(ValueError):
+    D.Backend('4')
+  with pytest.raises(ValueError):
+    D.Backend('2', ['no_such'])
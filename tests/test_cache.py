@@ -0,0 +1,175 @@
+import os
+import rain.ast as A
+import rain.cache as H
+import rain.compiler as C
+
+def test_lru():
+  lru = H.LRU(2)
+  lru.put('a', 1)
+  lru.put('b', 2)
+  assert lru.get('a') == 1
+
+  lru.put('c', 3)
+  assert lru.get('b') is None
+  assert lru.get('a') == 1
+  assert lru.get('c') == 3
+  assert len(lru) == 2
+
+def test_expansion(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir))
+  node = A.block_node([A.call_node(A.name_node('print'), [A.str_node('hi')])])
+  key = H.digest('macro', 'args')
+
+  assert H.load_expansion('test.rn', key) is None
+  H.save_expansion('test.rn', key, A.flatten(node))
+  assert A.machine.dump(A.inflate(H.load_expansion('test.rn', key))) == A.machine.dump(node)
+
+def test_version(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAINLIB', str(tmpdir))
+  monkeypatch.setattr(H, '_version', None)
+  tmpdir.join('ast.rn').write('# macro runtime\n')
+  tmpdir.mkdir('ops').join('ops.c').write('int x;\n')
+  first = H.version()
+
+  # the macro runtime and its C change what macros expand to
+  for path in ('ast.rn', 'ops/ops.c'):
+    old = tmpdir.join(path).read()
+    tmpdir.join(path).write(old + '\n')
+    monkeypatch.setattr(H, '_version', None)
+    assert H.version() != first
+
+    tmpdir.join(path).write(old)
+    monkeypatch.setattr(H, '_version', None)
+    assert H.version() == first
+
+def test_save_ast(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir))
+  src = 'let x = 1\n'
+
+  # marshal can't write every value a macro might leave in the tree
+  node = A.program_node([A.str_node(object())])
+  H.save_ast('test.rn', src, node, [])
+  assert H.load_ast('test.rn', src) is None
+
+def test_directory(tmpdir, monkeypatch):
+  monkeypatch.delenv('RAIN_CACHE_DIR')
+  monkeypatch.setenv('HOME', str(tmpdir.join('home')))
+  monkeypatch.setenv('RAINLIB', str(tmpdir.join('core')) + os.sep)
+  monkeypatch.setenv('RAINBASE', str(tmpdir.join('base')))
+
+  # the library's files are cached in the home directory, others next to them
+  home = str(tmpdir.join('home', '.cache', 'rain', 'ast'))
+  assert H.directory('ast', str(tmpdir.join('core', 'a.rn'))) == home
+  assert H.directory('ast', str(tmpdir.join('base', 'b', '_pkg.rn'))) == home
+  assert H.directory('ast', str(tmpdir.join('src', 'c.rn'))) == str(tmpdir.join('src', '__rncache__', 'ast'))
+  assert H.directory('ast', str(tmpdir.join('core2.rn'))) == str(tmpdir.join('__rncache__', 'ast'))
+  assert H.directory('ast') == home
+
+def test_build(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  monkeypatch.setattr(C.Compiler, 'quiet', True)
+  monkeypatch.setattr(C.Compiler, 'cache', True)
+
+  tmpdir.join('lib.rn').write('export f = func()\n  print("lib")\n')
+  main = tmpdir.join('main.rn')
+  main.write('import lib\n\nlet main = func()\n  lib.f()\n')
+
+  def build():
+    session = C.Session()
+    comp = session.get_compiler(str(main), main=True)
+    comp.goodies()
+    return {other.qname: other for other in session.compilers.values()}
+
+  first = build()
+  assert all(comp.ast is not None for comp in first.values())
+
+  # nothing changed, so nothing is parsed
+  second = build()
+  assert all(comp.ast is None for comp in second.values())
+  for name, comp in second.items():
+    assert comp.ll == first[name].ll
+    assert comp.links == first[name].links
+    assert comp.libs == first[name].libs
+
+  # only the changed module and the modules importing it are rebuilt
+  tmpdir.join('lib.rn').write('export f = func()\n  print("changed")\n')
+  third = build()
+  assert third['lib'].ast is not None and third['main'].ast is not None
+  assert third['core'].ast is None
+  assert third['main'].ll != first['main'].ll
+
+def test_c_links(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  monkeypatch.setattr(C.Compiler, 'cache', True)
+
+  # a stand-in for clang that logs each run, and says the file includes a
+  # local header and a system one
+  log = tmpdir.join('log')
+  system = tmpdir.mkdir('sys').join('sys.h')
+  clang = tmpdir.join('clang')
+  clang.write('#!/bin/sh\n[ "$1" = --version ] && exit 0\n'
+              '[ "$1" = -M ] && echo "lib.o: $3 {} \\\\" && echo " {}" && exit 0\n'
+              'echo "$3" >> {}\necho "; $3" > "$2"\n'.format(tmpdir.join('lib.h'), system, log))
+  clang.chmod(0o755)
+  monkeypatch.setenv('CLANG', str(clang))
+
+  src = tmpdir.join('lib.c')
+  src.write('#include "lib.h"\n#include <sys.h>\n')
+  tmpdir.join('lib.h').write('int x;\n')
+  system.write('int z;\n')
+
+  def compile_c():
+    with C.Session() as session:
+      return session.compile_c(str(src))
+
+  first = compile_c()
+  second = compile_c()
+  assert first == second
+  assert log.read().count('\n') == 1
+
+  # headers are part of the key, system ones too
+  tmpdir.join('lib.h').write('int y;\n')
+  second = compile_c()
+  assert second != first
+  assert log.read().count('\n') == 2
+
+  system.write('int w;\n')
+  assert compile_c() not in (first, second)
+  assert log.read().count('\n') == 3
+
+def test_c_evicted(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  monkeypatch.setattr(C.Compiler, 'cache', True)
+
+  log = tmpdir.join('log')
+  clang = tmpdir.join('clang')
+  clang.write('#!/bin/sh\n[ "$1" = --version ] && exit 0\n[ "$1" = -M ] && exit 1\n'
+              'echo "$3" >> {}\necho "; $3" > "$2"\n'.format(log))
+  clang.chmod(0o755)
+  monkeypatch.setenv('CLANG', str(clang))
+
+  src = tmpdir.join('lib.c')
+  src.write('int x;\n')
+
+  # a session compiles a file again once its IR is gone from the cache
+  with C.Session() as session:
+    first = session.compile_c(str(src))
+    os.remove(first)
+    assert session.compile_c(str(src)) == first
+    assert os.path.isfile(first)
+    assert log.read().count('\n') == 2
+
+def test_evict(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir))
+  for num, name in enumerate(['old', 'mid', 'new']):
+    path = os.path.join(H.directory('c'), name)
+    H.write(path, b'x' * 10)
+    os.utime(path, (num, num))
+
+  H.evict('c', 25)
+  assert sorted(os.listdir(H.directory('c'))) == ['mid', 'new']
+
+  # entries used recently are kept, whatever the size
+  H.touch(os.path.join(H.directory('c'), 'mid'))
+  H.evict('c', 0)
+  assert sorted(os.listdir(H.directory('c'))) == ['mid']
@@ -0,0 +1,147 @@
+import json
+import pytest
+import rain.compiler as C
+import rain.trace as Z
+import time
+
+# a stand-in for clang that takes a while, and fails on files named bad.c
+def fake_clang(tmpdir, monkeypatch):
+  clang = tmpdir.join('clang')
+  clang.write('#!/bin/sh\n[ "$1" = --version ] && exit 0\n[ "$1" = -M ] && exit 1\nsleep 0.5\n'
+              'case "$3" in *bad.c) exit 1;; esac\necho "; $3" > "$2"\n')
+  clang.chmod(0o755)
+  monkeypatch.setenv('CLANG', str(clang))
+  monkeypatch.setattr(C.Compiler, 'cache', False)
+  monkeypatch.setattr(C.Compiler, 'quiet', True)
+
+def test_c_jobs(tmpdir, monkeypatch):
+  fake_clang(tmpdir, monkeypatch)
+  monkeypatch.setattr(C.Compiler, 'c_jobs', 4)
+
+  srcs = [str(tmpdir.join('{}.c'.format(name))) for name in 'abcd']
+
+  start = time.perf_counter()
+  with C.Session() as session:
+    futures = [session.start_c(src) for src in srcs]
+    outs = [session.compile_c(src) for src in srcs]
+  assert time.perf_counter() - start < 1.5
+
+  assert [future.result() for future in futures] == outs
+  for src, out in zip(srcs, outs):
+    with open(out) as tmp:
+      assert tmp.read() == '; {}\n'.format(src)
+
+def test_c_error(tmpdir, monkeypatch):
+  fake_clang(tmpdir, monkeypatch)
+
+  with C.Session() as session:
+    comp = session.get_compiler(str(tmpdir.join('main.rn')), main=True)
+    comp.links.add(str(tmpdir.join('bad.c')))
+    with pytest.raises(SystemExit):
+      comp.compile()
+
+def test_runtime_lib(tmpdir, monkeypatch):
+  fake_clang(tmpdir, monkeypatch)
+  monkeypatch.setattr(C.Compiler, 'cache', True)
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  monkeypatch.setenv('RAINLIB', str(tmpdir.join('core')))
+
+  ar = tmpdir.join('ar')
+  ar.write('#!/bin/sh\nshift\nout="$1"\nshift\ncat "$@" > "$out"\n')
+  ar.chmod(0o755)
+  monkeypatch.setenv('AR', str(ar))
+
+  tmpdir.mkdir('core')
+  srcs = [str(tmpdir.join('core', name)) for name in ('a.c', 'b.c')]
+  for src in srcs:
+    with open(src, 'w') as tmp:
+      tmp.write('int x;\n')
+
+  assert C.in_runtime(srcs[0])
+  assert not C.in_runtime(str(tmpdir.join('other.c')))
+  assert not C.in_runtime(str(tmpdir.join('core', 'a.ll')))
+
+  with C.Session() as session:
+    lib = session.runtime_lib(srcs)
+    with open(lib) as tmp:
+      assert tmp.read() == ''.join('; {}\n'.format(session.compile_c(src)) for src in srcs)
+
+  # built once
+  start = time.perf_counter()
+  with C.Session() as session:
+    assert session.runtime_lib(srcs) == lib
+  assert time.perf_counter() - start < 0.5
+
+def test_close(tmpdir, monkeypatch):
+  fake_clang(tmpdir, monkeypatch)
+
+  # forks share the pool, which closing the session shuts down
+  session = C.Session()
+  with session.fork() as fork:
+    fork.compile_c(str(tmpdir.join('a.c')))
+  assert session.c_pool is not None
+
+  pool = session.c_pool
+  session.close()
+  assert session.c_pool is None
+  with pytest.raises(RuntimeError):
+    pool.submit(print)
+
+def test_trace(tmpdir, monkeypatch):
+  monkeypatch.setattr(C.Compiler, 'quiet', True)
+  monkeypatch.setattr(C.Compiler, 'cache', False)
+
+  tmpdir.join('lib.rn').write('export f = func()\n  print("lib")\n')
+  main = tmpdir.join('main.rn')
+  main.write('import lib\n\nlet main = func()\n  lib.f()\n')
+
+  session = C.Session()
+  session.tracer = Z.Tracer()
+  comp = session.get_compiler(str(main), main=True, target=str(tmpdir.join('main.ll')))
+  comp.goodies(C.phases.emitting)
+
+  spans = {(name, module): (start, secs, args) for name, module, pid, tid, start, secs, own, args
+           in session.tracer.spans}
+  for phase in ('read', 'lex', 'parse', 'emit', 'write'):
+    assert (phase, 'main') in spans
+    assert (phase, 'lib') in spans
+
+  assert spans['lex', 'main'][2]['tokens'] > 0
+  assert spans['parse', 'main'][2]['nodes'] > 0
+  assert spans['write', 'main'][2]['ir'] == len(tmpdir.join('main.ll').read())
+
+  # lib is parsed for its macros while main is parsed
+  start, secs, args = spans['parse', 'main']
+  lib_start, lib_secs, args = spans['parse', 'lib']
+  assert start <= lib_start and lib_start + lib_secs <= start + secs
+
+  tracer = session.tracer
+  tracer.write(str(tmpdir.join('trace.json')))
+  events = json.loads(tmpdir.join('trace.json').read())['traceEvents']
+  assert len(events) == len(tracer.spans)
+  assert all(event['ph'] == 'X' and 'module' in event['args'] for event in events)
+
+  table = tracer.table()
+  assert table[0].split() == ['phase', 'count', 'time', '%']
+  assert any(line.split()[0] == 'parse' for line in table[1:])
+
+  # nothing is recorded without a tracer
+  with C.Session().span('parse', 'main') as info:
+    assert info is None
+
+def test_edit(tmpdir, monkeypatch):
+  monkeypatch.setattr(C.Compiler, 'quiet', True)
+  monkeypatch.setattr(C.Compiler, 'cache', False)
+
+  src = 'library "m"\n\nlet main = func()\n  print("main")\n'
+  tmpdir.join('main.rn').write(src)
+
+  comp = C.Session().get_compiler(str(tmpdir.join('main.rn')), main=True, target=str(tmpdir.join('main.ll')))
+  comp.goodies(C.phases.emitting)
+  assert 'm' in comp.libs
+  libs = comp.libs - {'m'}
+
+  # the library is gone once its statement is, and the imports' are back
+  comp.edit(0, src.index('\n') + 1, '')
+  comp.goodies(C.phases.emitting)
+  assert comp.libs == libs
@@ -0,0 +1,24 @@
+import ctypes as ct
+import os
+import rain.engine as E
+
+def test_object_cache(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir))
+  ir = 'define i32 @seven() {\n  ret i32 7\n}\n'
+
+  hits, misses = E.Engine.hits, E.Engine.misses
+  eng = E.Engine(cache=True)
+  eng.add_ir(ir)
+  eng.finalize()
+  assert eng.get_func('seven', ct.c_int)() == 7
+  assert E.Engine.hits == hits
+  assert E.Engine.misses > misses
+  assert os.listdir(str(tmpdir.join('jit')))
+
+  hits, misses = E.Engine.hits, E.Engine.misses
+  eng = E.Engine(cache=True)
+  eng.add_ir(ir)
+  eng.finalize()
+  assert eng.get_func('seven', ct.c_int)() == 7
+  assert E.Engine.hits > hits
+  assert E.Engine.misses == misses
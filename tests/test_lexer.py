@@ -123,3 +123,37 @@ def test_prints():
   assert repr(K.end_token()) == '<EOF>'
   assert str(K.int_token(5)) == 'int 5'
   assert repr(K.int_token(5)) == '<int 5>'
+
+def test_positions():
+  stream = L.stream('let x = 1\n'
+                    '  \n'      # blank line with indentation
+                    '\n'
+                    'if x\n'
+                    '  print("a")\n')
+
+  tokens = list(stream)
+  coords = [(tok.pos.line, tok.pos.col, tok.pos.len) for tok in tokens]
+
+  assert tokens[0] == K.keyword_token('let')
+  assert coords[0] == (1, 1, 3)
+  assert coords[3] == (1, 9, 1)
+  assert tokens[4] == K.newline_token()
+  assert tokens[5] == K.keyword_token('if')
+  assert coords[5] == (4, 1, 2)
+  assert tokens[7] == K.indent_token()
+  assert coords[7] == (5, 1, 2)
+  assert coords[8] == (5, 3, 5)
+  assert coords[10] == (5, 9, 3)
+
+def test_packed():
+  tokens = L.lex('let x = "a"\nlet y = "a"\n', file='packed.rn')
+
+  assert len(tokens) == 11
+  assert list(tokens) == list(L.stream('let x = "a"\nlet y = "a"\n'))
+  assert tokens.values.count('a') == 1
+
+  assert tokens[5] == K.keyword_token('let')
+  assert tokens[5].pos.line == 2
+  assert tokens[5].pos.col == 1
+  assert str(tokens[8].pos) == 'packed.rn:2:9: '
+  assert tokens[8].pos(len=5).len == 5
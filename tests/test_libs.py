@@ -0,0 +1,62 @@
+import rain.libs as L
+import struct
+
+# build an ld.so.cache in the newer format
+def ld_cache(entries):
+  strings = b''
+  offsets = []
+  base = 48 + 24 * len(entries)
+  for flags, key, value in entries:
+    offsets.append((flags, base + len(strings), base + len(strings) + len(key) + 1))
+    strings += key.encode() + b'\0' + value.encode() + b'\0'
+
+  data = L.NEW_MAGIC + struct.pack('=IIB3xI12x', len(entries), len(strings), 2, 0)
+  for flags, key, value in offsets:
+    data += struct.pack('=iIIIQ', flags, key, value, 0, 0)
+  return data + strings
+
+def test_parse_cache():
+  data = ld_cache([
+    (0x303, 'libgc.so.1', '/lib64/libgc.so.1'),
+    (0x303, 'libz.so.1', '/lib64/libz.so.1'),
+    (0x003, 'libgc.so.1', '/lib32/libgc.so.1'),
+  ])
+  assert L.parse_cache(data) == {'libgc.so.1': '/lib64/libgc.so.1', 'libz.so.1': '/lib64/libz.so.1'}
+  assert L.parse_cache(b'garbage') == {}
+
+def test_conf_dirs(tmpdir):
+  tmpdir.mkdir('conf.d')
+  tmpdir.join('conf.d', 'a.conf').write('/opt/a/lib\n# comment\n')
+  tmpdir.join('conf.d', 'b.conf').write('/opt/b/lib  # trailing\n')
+  tmpdir.join('ld.so.conf').write('include conf.d/*.conf\n/opt/main/lib\n')
+  assert L.conf_dirs(str(tmpdir.join('ld.so.conf'))) == ['/opt/a/lib', '/opt/b/lib', '/opt/main/lib']
+
+def test_resolver(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  libs = tmpdir.mkdir('libs')
+  monkeypatch.setenv('LD_LIBRARY_PATH', str(libs))
+
+  libs.join('libfoo.so').write_binary(b'\x7fELF\0')
+  libs.join('libbar.so.2').write_binary(b'\x7fELF\0')
+  libs.join('libbar.so').write('/* GNU ld script */\nGROUP ( {} )\n'.format(libs.join('libbar.so.2')))
+  libs.join('libgc.so.1').write_binary(b'\x7fELF\0')
+
+  cache = tmpdir.join('ld.so.cache')
+  cache.write_binary(ld_cache([
+    (0x303, 'libgc.so.1', str(libs.join('libgc.so.1'))),
+    (0x303, 'libgc.so.0', '/old/libgc.so.0'),
+  ]))
+  monkeypatch.setattr(L, 'LD_CACHE', str(cache))
+
+  resolver = L.Resolver()
+  assert resolver.find('foo') == str(libs.join('libfoo.so'))
+  assert resolver.find('bar') == str(libs.join('libbar.so.2'))
+  assert resolver.find(':libgc.so.1') == str(libs.join('libgc.so.1'))
+  assert resolver.find('missing') is None
+
+  # only a versioned library, found through ld.so.cache
+  assert L.Resolver(cache=False).find('gc') == str(libs.join('libgc.so.1'))
+
+  # found again from the cache directory, without searching
+  monkeypatch.setattr(L.Resolver, 'search', lambda self, lib: None)
+  assert L.Resolver().find('foo') == str(libs.join('libfoo.so'))
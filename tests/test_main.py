@@ -0,0 +1,45 @@
+import rain.__main__ as U
+import subprocess
+import sys
+
+# modules that lexing has no use for
+HEAVY = ['camel', 'yaml', 'llvmlite', 'rain.backend', 'rain.build', 'rain.emit', 'rain.engine',
+         'rain.module', 'rain.parser', 'rain.repl', 'rain.server']
+
+# runs rainc, then prints every module it loaded
+RAINC = '''
+import runpy
+import sys
+sys.argv = ['rain'] + sys.argv[1:]
+try:
+  runpy.run_module('rain', run_name='__main__', alter_sys=True)
+finally:
+  print(' '.join(sorted(sys.modules)))
+'''
+
+def loaded(*args):
+  '''Run rainc. Returns the names of the modules it loaded.'''
+
+  out = subprocess.check_output([sys.executable, '-c', RAINC] + list(args), universal_newlines=True)
+  return out.splitlines()[-1].split()
+
+def test_lex_imports(tmpdir):
+  '''Test that lexing doesn't load the parser, the emitter or llvmlite.'''
+
+  names = loaded('--lex', '-o', str(tmpdir.join('hello.lex')), 'samples/hello.rn')
+
+  assert 'rain.lexer' in names
+  for mod in HEAVY:
+    assert not any(name == mod or name.startswith(mod + '.') for name in names)
+
+def test_program_args():
+  '''Test that everything after FILE goes to the program, flags included.'''
+
+  args = U.parser.parse_args(['--jit', 'prog.rn', '-x', '--lex', 'a'])
+  assert args.jit and not args.lex
+  assert args.file == 'prog.rn'
+  assert args.args == ['-x', '--lex', 'a']
+
+  args = U.parser.parse_args(['-r', '-q', 'prog.rn'])
+  assert args.run and args.quiet
+  assert args.args == []
@@ -0,0 +1,41 @@
+import os
+import os.path
+import rain.module as M
+
+def touch(*parts):
+  path = os.path.join(*parts)
+  with open(path, 'w'):
+    pass
+  return path
+
+def test_index(tmpdir):
+  base = str(tmpdir)
+  os.mkdir(os.path.join(base, 'pkg'))
+  touch(base, 'pkg', '_pkg.rn')
+  touch(base, 'pkg', 'inner.rn')
+  touch(base, 'outer.rn')
+
+  index = M.Index()
+  for name in ('outer', 'outer.rn', 'pkg', 'pkg/inner', 'missing'):
+    assert index.find_rain(name, paths=[base]) == M.find_rain(name, paths=[base])
+  assert index.find_file('outer.rn', paths=[base]) == M.find_file('outer.rn', paths=[base])
+
+  assert index.find_name(os.path.join(base, 'pkg', 'inner.rn')) == ('pkg.inner', 'inner')
+  assert index.find_name(os.path.join(base, 'pkg', '_pkg.rn')) == ('pkg', 'pkg')
+  assert index.find_name(os.path.join(base, 'outer.rn')) == ('outer', 'outer')
+
+def test_index_changes(tmpdir):
+  base = str(tmpdir)
+  index = M.Index()
+  assert index.find_rain('late', paths=[base]) is None
+
+  # make sure the directory's mtime moves on
+  stamp = os.stat(base).st_mtime_ns
+  path = touch(base, 'late.rn')
+  os.utime(base, ns=(stamp + 10 ** 9, stamp + 10 ** 9))
+
+  assert index.find_rain('late', paths=[base]) == path
+
+  touch(base, '_pkg.rn')
+  os.utime(base, ns=(stamp + 2 * 10 ** 9, stamp + 2 * 10 ** 9))
+  assert index.find_name(path)[0].endswith('.late')
@@ -0,0 +1,108 @@
+from itertools import product
+import os
+import rain.ast as A
+import rain.compiler as C
+import rain.lexer as L
+import rain.parser as P
+import rain.token as K
+import pytest
+
+def expr(src):
+  ctx = P.context(L.stream(src), file='test.rn')
+  return P.binexpr(ctx)
+
+def test_precedence():
+  a, b, c, d = (A.name_node(x) for x in 'abcd')
+
+  assert A.machine.dump(expr('a + b * c')) == A.machine.dump(A.binary_node(a, A.binary_node(b, c, '*'), '+'))
+  assert A.machine.dump(expr('a * b + c')) == A.machine.dump(A.binary_node(A.binary_node(a, b, '*'), c, '+'))
+
+def test_associativity():
+  a, b, c, d = (A.name_node(x) for x in 'abcd')
+
+  assert A.machine.dump(expr('a - b - c')) == A.machine.dump(A.binary_node(A.binary_node(a, b, '-'), c, '-'))
+  assert A.machine.dump(expr('a - b * c - d')) == A.machine.dump(
+    A.binary_node(a, A.binary_node(A.binary_node(b, c, '*'), d, '-'), '-'))
+
+def test_unary():
+  a, b = (A.name_node(x) for x in 'ab')
+
+  assert A.machine.dump(expr('-a * b')) == A.machine.dump(A.binary_node(A.unary_node('-', a), b, '*'))
+  assert A.machine.dump(expr('a == !b')) == A.machine.dump(A.binary_node(a, A.unary_node('!', b), '=='))
+
+def test_pack():
+  src = 'let f = func(a, b)\n  return {a = [a, 1.5], ["b"] = table}\n'
+  ast = P.program(P.context(L.stream(src), file='test.rn'))
+
+  assert A.machine.dump(A.unpack(A.pack(ast))) == A.machine.dump(ast)
+
+def test_mentions():
+  src = 'let f = func(a)\n  return [a, gensym()]\n'
+  ast = P.program(P.context(L.stream(src), file='test.rn'))
+
+  assert P.mentions(A.flatten(ast), 'gensym')
+  assert P.mentions(A.flatten(ast), 'a')
+  assert not P.mentions(A.flatten(ast), 'b')
+
+def baseline_binexpr(ctx):
+  '''binexpr as it was first written, to check the trees against.'''
+
+  lhs = P.unexpr(ctx)
+  pairs = []
+
+  while ctx.expect(K.operator_token):
+    op = ctx.require(K.operator_token)
+    pairs.append((op.value, P.unexpr(ctx)))
+
+  if pairs:
+    lhs = baseline_merge(lhs, pairs)
+
+  return lhs
+
+def baseline_merge(lhs, pairs):
+  op, rhs = pairs[0]
+  pairs = pairs[1:]
+  for nop, next in pairs:
+    if P.binary_ops[nop] > P.binary_ops[op]:
+      rhs = baseline_merge(rhs, pairs)
+      break
+    else:
+      lhs = A.binary_node(lhs, rhs, op)
+      op = nop
+      rhs = next
+      pairs = pairs[1:]
+
+  return A.binary_node(lhs, rhs, op)
+
+def baseline(src):
+  ctx = P.context(L.stream(src), file='test.rn')
+  return baseline_binexpr(ctx)
+
+def test_chains():
+  ops = ['::', '*', '+', '-', '$', '<', '==', '&', '|']
+  for count in range(1, 5):
+    for chain in product(ops, repeat=count):
+      src = 'a' + ''.join(' {} {}'.format(op, name) for op, name in zip(chain, 'bcde'))
+      assert A.machine.dump(expr(src)) == A.machine.dump(baseline(src)), src
+
+  # an operator with no precedence still makes a node
+  assert A.machine.dump(expr('a -> b')) == A.machine.dump(baseline('a -> b'))
+
+def samples():
+  for base, dirs, files in os.walk('samples'):
+    for name in sorted(files):
+      if name.endswith('.rn'):
+        yield os.path.join(base, name)
+
+@pytest.mark.parametrize('src', sorted(samples()))
+def test_samples(src, monkeypatch):
+  # in a session of its own, so the modules it imports aren't left parsed for other tests
+  def parse():
+    session = C.Session()
+    with open(src) as tmp:
+      ctx = P.context(L.stream(tmp.read(), file=src, session=session), file=src, session=session)
+    return A.machine.dump(P.program(ctx))
+
+  new = parse()
+  monkeypatch.setattr(P, 'binexpr', baseline_binexpr)
+  assert parse() == new
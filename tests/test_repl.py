@@ -0,0 +1,28 @@
+import rain.compiler as C
+import rain.repl as R
+
+C.Compiler.quiet = True
+
+def test_repl(capfd):
+  repl = R.Repl(C.Session())
+  repl.eval('let x = 5\n')
+  repl.eval('x + 1\n')
+  repl.eval('let f = func(a)\n  return a * x\n')
+  repl.eval('print(f(2))\n')
+  repl.eval('f(3)\n')
+  repl.eval('x = 1\n')
+  repl.eval('f(3)\n')
+
+  out, err = capfd.readouterr()
+  assert out == '6\n10\n15\n3\n'
+
+def test_incomplete():
+  repl = R.Repl.__new__(R.Repl)
+  repl.session = C.Session()
+  repl.file = 'repl.rn'
+  repl.macros = {}
+
+  assert repl.incomplete('let f = func(a)\n')
+  assert repl.incomplete('if x > 1\n')
+  assert not repl.incomplete('let x = 5\n')
+  assert not repl.incomplete('x + 1\n')
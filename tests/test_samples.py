@@ -1,13 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
 import os
 import os.path
 import subprocess
+import sys
 import pytest
+import rain.ast as A
+import rain.build as B
 import rain.compiler as C
+import rain.lexer as L
+import rain.parser as P
 
 os.putenv('RAIN_TEST', 'testing') # for command line args test
 
 C.Compiler.quiet = True
 
+# samples are built like rainc --batch builds them, each on top of the modules
+# the ones before it emitted, so the builtins and shared modules are built once.
+# a sample that fails to build isn't adopted, so it can't affect the next one
+batch = C.Session()
+
 def ls(*path):
   '''List all files in a directory.'''
 
@@ -55,30 +66,163 @@ def test_parse(src):
   check_file(comp.target)
   os.remove(comp.target)
 
+def test_sessions():
+  '''Test parsing every sample at once in separate sessions.'''
+
+  def parse(src):
+    comp = C.Session().get_compiler(src, main=True)
+    comp.read()
+    comp.lex()
+    comp.parse()
+    return comp
+
+  with ThreadPoolExecutor(max_workers=4) as pool:
+    comps = list(pool.map(parse, lsrn('samples', recurse=True)))
+
+  for comp in comps:
+    with open(os.path.join('tests', 'outputs', comp.mname + '.yml')) as exp:
+      assert A.machine.dump(comp.ast) == exp.read()
+
+def check_edit(comp, start, stop, text, capsys):
+  '''Check re-parsing an edit against parsing the edited source from scratch. Returns
+  whether the source still parses.'''
+
+  src = comp.src[:start] + text + comp.src[stop:]
+  try:
+    ctx = P.context(L.stream(src, file=comp.file, session=comp.session), file=comp.file, session=comp.session)
+    ast = P.program(ctx)
+  except SystemExit:
+    err = capsys.readouterr().out
+    with pytest.raises(SystemExit):
+      comp.edit(start, stop, text)
+    assert capsys.readouterr().out == err
+    return False
+
+  comp.edit(start, stop, text)
+
+  assert comp.src == src
+  assert [str(tok) for tok in comp.tokens] == [str(tok) for tok in L.lex(src)]
+  assert comp.parser.starts == ctx.starts
+  assert A.machine.dump(comp.ast) == A.machine.dump(ast)
+  assert sorted(comp.parser.macros) == sorted(ctx.macros)
+  assert [imp.file for imp in comp.parser.imports] == [imp.file for imp in ctx.imports]
+  assert [file for file, key in comp.deps] == [file for imp in ctx.imports
+                                               for file in [imp.file] + [dep for dep, key in imp.deps]]
+  return True
+
+@pytest.mark.parametrize('src', lsrn('samples', recurse=True))
+def test_edit(src, capsys):
+  '''Test re-parsing an edited sample against parsing it from scratch.'''
+
+  comp = C.Session().get_compiler(src, main=True)
+  comp.read()
+  comp.lex()
+  comp.parse()
+
+  # add a statement before the last one, then change a line inside it
+  last = comp.tokens.src.line_start(comp.tokens.offsets[comp.parser.starts[-1]])
+  assert check_edit(comp, last, last, 'let edited = func(a)\n  return a\n', capsys)
+  inner = comp.src.index('  return a\n', last)
+  assert check_edit(comp, inner, inner + len('  return a\n'), '  return a + 1\n  pass\n', capsys)
+
+  # remove the first import, along with the macros it brought in
+  for num, node in enumerate(comp.ast.stmts):
+    if isinstance(node, A.import_node):
+      start = comp.tokens.src.line_start(comp.tokens.offsets[comp.parser.starts[num]])
+      if not check_edit(comp, start, comp.src.index('\n', start) + 1, '', capsys):
+        return
+      break
+
+  # use a macro before it's defined
+  for node in comp.ast.stmts:
+    if isinstance(node, A.macro_node):
+      assert not check_edit(comp, 0, 0, 'let early = @{}\n'.format(node.name), capsys)
+      break
+
+@pytest.mark.parametrize('src', ['samples/moda.rn', 'samples/table.rn'])
+def test_build(src, tmpdir):
+  '''Test emitting over a process pool against emitting serially.'''
+
+  serial = C.Session().get_compiler(src, main=True)
+  serial.target = str(tmpdir.join('serial.ll'))
+  serial.goodies(C.phases.emitting)
+
+  parallel = C.Session().get_compiler(src, main=True)
+  parallel.target = str(tmpdir.join('parallel.ll'))
+  B.build(parallel, C.phases.emitting, jobs=2)
+
+  with open(serial.target) as exp, open(parallel.target) as out:
+    assert out.read() == exp.read()
+
+@pytest.mark.parametrize('src', ['samples/moda.rn', 'samples/table.rn'])
+def test_low_memory(src, tmpdir):
+  '''Test emitting with module summaries against emitting normally.'''
+
+  full = C.Session().get_compiler(src, main=True)
+  full.target = str(tmpdir.join('full.ll'))
+  full.goodies(C.phases.emitting)
+
+  try:
+    C.Compiler.low_memory = True
+    low = C.Session().get_compiler(src, main=True)
+    low.target = str(tmpdir.join('low.ll'))
+    low.goodies(C.phases.emitting)
+  finally:
+    C.Compiler.low_memory = False
+
+  assert low.ast is None
+  with open(full.target) as exp, open(low.target) as out:
+    assert out.read() == exp.read()
+
+def test_batch(tmpdir):
+  '''Test emitting samples in a batch against emitting each on its own.'''
+
+  srcs = ['samples/moda.rn', 'samples/modb.rn', 'samples/table.rn', 'samples/hello.rn']
+  targets = [str(tmpdir.join(os.path.basename(src) + '.batch.ll')) for src in srcs]
+  with C.Session() as session:
+    comps = C.batch(srcs, C.phases.emitting, targets=targets, session=session)
+
+  # everything but the main modules is shared
+  moda, modb, table, hello = comps
+  assert moda.session.compilers[moda.file] is moda
+  assert moda.session.compilers[modb.file] is not modb
+  assert table.session.compilers[C.builtin()] is moda.session.compilers[C.builtin()]
+
+  for src, target in zip(srcs, targets):
+    alone = C.Session().get_compiler(src, main=True)
+    alone.target = str(tmpdir.join(os.path.basename(src) + '.ll'))
+    alone.goodies(C.phases.emitting)
+
+    with open(alone.target) as exp, open(target) as out:
+      assert out.read() == exp.read()
+
 @pytest.mark.parametrize('src', lsrn('samples', recurse=True))
 def test_compile(src):
   '''Test the compilation phase.'''
 
-  C.reset_compilers()
-  comp = C.get_compiler(src, main=True)
-  comp.target = comp.mname
-  comp.goodies(C.phases.building)
-  comp.compile()
-  os.remove(comp.target)
+  comp, = C.batch([src], session=batch)
+  os.remove(comp.mname)
 
 @pytest.mark.parametrize('src', lsrn('samples', recurse=True))
 def test_run(src):
   '''Test program execution and results.'''
 
-  C.reset_compilers()
-  comp = C.get_compiler(src, main=True)
-  comp.target = comp.mname
-  comp.goodies(C.phases.building)
-  comp.compile()
+  comp, = C.batch([src], session=batch)
 
-  with open(comp.target + '.out', 'w') as tmp:
-    subprocess.call([os.path.abspath(comp.target)], stdout=tmp)
+  with open(comp.mname + '.out', 'w') as tmp:
+    subprocess.call([os.path.abspath(comp.mname)], stdout=tmp)
 
-  check_file(comp.target + '.out')
-  os.remove(comp.target + '.out')
-  os.remove(comp.target)
+  check_file(comp.mname + '.out')
+  os.remove(comp.mname + '.out')
+  os.remove(comp.mname)
+
+@pytest.mark.parametrize('src', lsrn('samples', recurse=True))
+def test_jit(src):
+  '''Test running programs in the compiler's process.'''
+
+  name = C.Session().get_compiler(src, main=True).mname
+  with open(name + '.out', 'w') as tmp:
+    subprocess.call([sys.executable, '-m', 'rain', '-q', '--jit', src], stdout=tmp)
+
+  check_file(name + '.out')
+  os.remove(name + '.out')
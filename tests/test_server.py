@@ -0,0 +1,106 @@
+import io
+import json
+import os
+import os.path
+import rain.__main__ as U
+import rain.client as K
+import rain.compiler as C
+import rain.server as S
+import socket
+import threading
+import time
+
+def test_server(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  path = str(tmpdir.join('rainc.sock'))
+
+  server = S.Server(path, U.parser, U.build)
+  threading.Thread(target=server.serve, daemon=True).start()
+  while not os.path.exists(path):
+    time.sleep(0.01)
+
+  # two builds, the second from the warm builtins
+  for num in range(2):
+    out = io.BytesIO()
+    target = str(tmpdir.join('hello{}.ll'.format(num)))
+    reply = K.request(['--emit', '-q', '-o', target, 'samples/hello.rn'], path, out)
+    assert reply == {'exit': 0, 'run': None}
+
+  comp = C.Session().get_compiler('samples/hello.rn', target=str(tmpdir.join('hello.ll')), main=True)
+  comp.goodies(C.phases.emitting)
+  for num in range(2):
+    with open(str(tmpdir.join('hello{}.ll'.format(num)))) as tmp:
+      assert tmp.read() == comp.mod.ir
+
+  # diagnostics come back to the client
+  out = io.BytesIO()
+  reply = K.request(['missing.rn'], path, out)
+  assert reply['exit'] == 1
+  assert b"Can't find module 'missing.rn'" in out.getvalue()
+
+
+def test_disconnect(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  path = str(tmpdir.join('rainc.sock'))
+
+  server = S.Server(path, U.parser, U.build)
+  thread = threading.Thread(target=server.serve, daemon=True)
+  thread.start()
+  while not os.path.exists(path):
+    time.sleep(0.01)
+
+  # clients that hang up before their build is done
+  for argv in (['--emit', 'samples/hello.rn'], ['missing.rn']):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+      sock.connect(path)
+      req = {'cwd': os.getcwd(), 'argv': ['-o', str(tmpdir.join('gone.ll'))] + argv}
+      sock.sendall(json.dumps(req).encode('utf-8') + b'\n')
+
+  # the server keeps going, writing to its own stdout again
+  out = io.BytesIO()
+  target = str(tmpdir.join('hello.ll'))
+  reply = K.request(['--emit', '-o', target, 'samples/hello.rn'], path, out)
+  assert reply == {'exit': 0, 'run': None}
+  assert b'emitting hello' in out.getvalue()
+  assert os.path.exists(target)
+  assert thread.is_alive()
+
+def test_c_links(tmpdir, monkeypatch):
+  monkeypatch.setenv('RAIN_CACHE_DIR', str(tmpdir.join('cache')))
+  path = str(tmpdir.join('rainc.sock'))
+
+  # stand-ins for clang and ar that put together the files they're given
+  for tool in ('clang', 'ar'):
+    tmpdir.join(tool).write('#!/bin/sh\n[ "$1" = --version ] && exit 0\n[ "$1" = -M ] && exit 1\nout="$2"\nshift 2\n'
+                            'for file; do [ -f "$file" ] && cat "$file"; done > "$out"\nexit 0\n')
+    tmpdir.join(tool).chmod(0o755)
+  monkeypatch.setenv('CLANG', str(tmpdir.join('clang')))
+  monkeypatch.setenv('AR', str(tmpdir.join('ar')))
+
+  server = S.Server(path, U.parser, U.build)
+  threading.Thread(target=server.serve, daemon=True).start()
+  while not os.path.exists(path):
+    time.sleep(0.01)
+
+  link = tmpdir.join('link.c')
+  main = tmpdir.join('main.rn')
+  main.write('link "link.c"\n\nlet main = func()\n  print("main")\n')
+  target = str(tmpdir.join('main'))
+
+  link.write('int before;\n')
+  reply = K.request(['-q', '-o', target, str(main)], path, io.BytesIO())
+  assert reply == {'exit': 0, 'run': None}
+  with open(target) as tmp:
+    assert 'int before;' in tmp.read()
+
+  # make sure the file's mtime moves on
+  stamp = os.stat(str(link)).st_mtime_ns
+  link.write('int after;\n')
+  os.utime(str(link), ns=(stamp + 10 ** 9, stamp + 10 ** 9))
+
+  reply = K.request(['-q', '-o', target, str(main)], path, io.BytesIO())
+  assert reply == {'exit': 0, 'run': None}
+  with open(target) as tmp:
+    out = tmp.read()
+  assert 'int after;' in out and 'int before;' not in out